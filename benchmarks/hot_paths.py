@@ -0,0 +1,325 @@
+"""
+Throughput and memory benchmarks of the transformation and fitting hot paths.
+
+    python -m benchmarks.hot_paths --output results.json
+    python -m benchmarks.hot_paths --output results.json --baseline baseline.json
+
+Every case is timed a few times and its best run kept. Results are written as JSON; given a baseline
+written the same way, cases whose throughput fell by more than the tolerance are reported and the
+exit status is 1. Peak memory is measured with tracemalloc where it exists (Python 3). Elsewhere it is how much
+the call raised the peak resident set size of the process (resource.getrusage), which misses memory reused from
+earlier cases - a lower bound - and None where neither exists.
+This module must not import Qt.
+"""
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+import timeit
+
+import numpy
+
+from transfromations import solvers
+from transfromations.areas import CirclePath
+from transfromations.bilinear import BilinearTransformation
+from transfromations.geometry import Point
+from transfromations.linear_transformations import AffineTransformation, ProjectiveTransformation
+from transfromations.transformations import ComposedTransformation
+from transfromations.transformations_builders import angle
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_SIZES = [10, 1000, 100000, 10000000]
+DEFAULT_DEPTHS = [1, 10, 100, 1000]
+# Point by point loops above this size take minutes, they are only run when asked for.
+DEFAULT_MAX_LOOP_SIZE = 100000
+# Points pushed through the compositions of every depth.
+COMPOSITION_POINTS = 10000
+# Calls of the scalar functions per measurement.
+SCALAR_CALLS = 10000
+
+
+class Case(object):
+    """
+    A measurement: `setup()` builds the inputs outside the timing and returns the function timed.
+    """
+
+    def __init__(self, name, params, unit, items, setup):
+        """
+        :param params: dict telling this case apart from the others of the same name.
+        :param unit: what `items` counts - points, fits or calls.
+        :param items: units processed by one call of the timed function.
+        """
+        self.name = name
+        self.params = params
+        self.unit = unit
+        self.items = items
+        self.setup = setup
+
+
+def _random_points(n, seed=0):
+    return numpy.random.RandomState(seed).uniform(-1000, 1000, (n, 2))
+
+
+def _affine(i):
+    theta = 0.001 * (i + 1)
+    return AffineTransformation(math.cos(theta), -math.sin(theta), 1., math.sin(theta), math.cos(theta), -1.)
+
+
+def _bilinear():
+    # Close to the identity, so a thousand stages keep the points finite.
+    return BilinearTransformation(numpy.array([[0., 1., 0., 1e-9], [0., 0., 1., -1e-9]]))
+
+
+def _point_cases(sizes, max_loop_size):
+    res = []
+    projective = ProjectiveTransformation(numpy.matrix([[1., 0.1, 5.], [0.2, 0.9, -3.], [1e-4, 2e-4, 1.]]))
+    for n in sizes:
+        def vectorized(n=n):
+            points = _random_points(n)
+            return lambda: projective.transform_points(points)
+
+        res.append(Case('transform_points', {'n': n}, 'points', n, vectorized))
+        if n <= max_loop_size:
+            def loop(n=n):
+                points = [Point(x, y) for x, y in _random_points(n)]
+                return lambda: [projective.transform_point(p) for p in points]
+
+            res.append(Case('transform_point', {'n': n}, 'points', n, loop))
+    return res
+
+
+def _composition_cases(depths):
+    res = []
+    for depth in depths:
+        # Projective stages are folded into one matrix, interleaved bilinear stages keep every stage.
+        def folded(depth=depth):
+            composed = ComposedTransformation([_affine(i) for i in range(depth)])
+            points = _random_points(COMPOSITION_POINTS)
+            return lambda: composed.transform_points(points)
+
+        def chained(depth=depth):
+            composed = ComposedTransformation([_affine(i) if i % 2 else _bilinear() for i in range(depth)])
+            points = _random_points(COMPOSITION_POINTS)
+            return lambda: composed.transform_points(points)
+
+        def build(depth=depth):
+            stages = [_affine(i) for i in range(depth)]
+            return lambda: ComposedTransformation(stages)
+
+        res.append(Case('composed_transform_points', {'depth': depth, 'stages': 'projective'}, 'points',
+                        COMPOSITION_POINTS, folded))
+        res.append(Case('composed_transform_points', {'depth': depth, 'stages': 'mixed'}, 'points',
+                        COMPOSITION_POINTS, chained))
+        res.append(Case('composed_build', {'depth': depth}, 'calls', 1, build))
+    return res
+
+
+def _fit_cases(sizes):
+    def single_fits(fit):
+        src = _random_points(solvers.MIN_PAIRS[fit], seed=1).T
+        dst = _random_points(solvers.MIN_PAIRS[fit], seed=2).T
+
+        def solve():
+            for _ in range(SCALAR_CALLS // 10):
+                fit(src, dst)
+        return solve
+
+    def preview(fit):
+        # The fit a builder previews while dragging: the accumulated pairs plus one, whatever their number.
+        equations = solvers.NormalEquations(fit)
+        src = _random_points(1000, seed=1).T
+        equations.add(src, src + _random_points(1000, seed=2).T * 0.01)
+        extra_src = _random_points(1, seed=3).T
+        extra_dst = _random_points(1, seed=4).T
+
+        def solve():
+            for _ in range(SCALAR_CALLS // 10):
+                equations.solve(extra_src, extra_dst)
+        return solve
+
+    res = []
+    for fit in (solvers.fit_translation, solvers.fit_similarity, solvers.fit_affine, solvers.fit_projective):
+        params = {'model': fit.__name__[len('fit_'):]}
+        res.append(Case('fit_single', params, 'fits', SCALAR_CALLS // 10, lambda fit=fit: single_fits(fit)))
+    for fit in solvers.NORMAL_EQUATIONS_SIZES:
+        params = {'model': fit.__name__[len('fit_'):]}
+        res.append(Case('normal_equations_preview', params, 'fits', SCALAR_CALLS // 10, lambda fit=fit: preview(fit)))
+    for n in sizes:
+        # n fits of 3 pairs each, batched into one call.
+        def batched(n=n):
+            src = _random_points(3 * n, seed=1).T.reshape(2, n, 3).swapaxes(0, 1)
+            dst = _random_points(3 * n, seed=2).T.reshape(2, n, 3).swapaxes(0, 1)
+            return lambda: solvers.fit_affine(src, dst)
+
+        # One fit of n pairs.
+        def least_squares(n=n):
+            src = _random_points(n, seed=1).T
+            dst = src + _random_points(n, seed=2).T * 0.01
+            return lambda: solvers.fit_affine(src, dst)
+
+        # Accumulating n pairs into the normal equations, as a builder given n pairs does.
+        def accumulate(n=n):
+            src = _random_points(n, seed=1).T
+            dst = src + _random_points(n, seed=2).T * 0.01
+            return lambda: solvers.NormalEquations(solvers.fit_affine).add(src, dst)
+
+        res.append(Case('fit_affine_batch', {'n': n}, 'fits', n, batched))
+        res.append(Case('fit_affine_pairs', {'n': n}, 'points', n, least_squares))
+        res.append(Case('normal_equations_add', {'n': n}, 'points', n, accumulate))
+    return res
+
+
+def _scalar_cases():
+    def project():
+        path = CirclePath(Point(1., 2.), 50.)
+        points = [Point(x, y) for x, y in _random_points(SCALAR_CALLS)]
+        return lambda: [path.project_point(p) for p in points]
+
+    def angles():
+        points = [Point(x, y) for x, y in _random_points(SCALAR_CALLS + 1)]
+        pairs = list(zip(points[:-1], points[1:]))
+        return lambda: [angle(p1, p2) for p1, p2 in pairs]
+
+    return [Case('circle_path_project_point', {}, 'calls', SCALAR_CALLS, project),
+            Case('angle', {}, 'calls', SCALAR_CALLS, angles)]
+
+
+def all_cases(sizes=DEFAULT_SIZES, depths=DEFAULT_DEPTHS, max_loop_size=DEFAULT_MAX_LOOP_SIZE):
+    """
+    :rtype: list[Case]
+    """
+    return _point_cases(sizes, max_loop_size) + _composition_cases(depths) + _fit_cases(sizes) + _scalar_cases()
+
+
+def _max_rss():
+    """
+    :return: the peak resident set size of the process so far, in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes, except on macOS.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(case, repeat=3, min_time=0.2):
+    """
+    :return: dict of the JSON result of the case.
+    """
+    function = case.setup()
+    # Calls per run, so short cases run long enough for the timer.
+    start = timeit.default_timer()
+    function()
+    first = timeit.default_timer() - start
+    number = max(1, int(min_time / first)) if first > 0 else 1000
+    best = first
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        for _ in range(number):
+            function()
+        best = min(best, (timeit.default_timer() - start) / number)
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    elif resource is not None:
+        before = _max_rss()
+        function()
+        peak = _max_rss() - before
+    return {
+        'name': case.name,
+        'params': case.params,
+        'unit': case.unit,
+        'items': case.items,
+        'seconds': best,
+        'throughput': case.items / best if best > 0 else float('inf'),
+        'peak_bytes': peak,
+    }
+
+
+def run(cases, repeat=3, min_time=0.2, log=sys.stderr):
+    results = []
+    for case in cases:
+        result = measure(case, repeat, min_time)
+        log.write('%-30s %-40s %14.4g %s/s\n' % (case.name, json.dumps(case.params, sort_keys=True),
+                                                  result['throughput'], case.unit))
+        results.append(result)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def _result_key(result):
+    return result['name'], tuple(sorted(result['params'].items()))
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    :param tolerance: relative throughput drop reported as a regression.
+    :return: list of (name, params, ratio) of the regressed cases, ratio being new / baseline throughput.
+    """
+    previous = dict((_result_key(r), r) for r in baseline['results'])
+    regressions = []
+    for result in report['results']:
+        old = previous.get(_result_key(result))
+        if old is None or not old['throughput']:
+            continue
+        ratio = result['throughput'] / old['throughput']
+        if ratio < 1. - tolerance:
+            regressions.append((result['name'], result['params'], ratio))
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the transformation and fitting hot paths.')
+    parser.add_argument('--output', help='JSON file the results are written to, stdout if missing')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative throughput drop failing the run')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--depths', type=int, nargs='+', default=DEFAULT_DEPTHS)
+    parser.add_argument('--max-loop-size', type=int, default=DEFAULT_MAX_LOOP_SIZE,
+                        help='largest size timed point by point')
+    parser.add_argument('--filter', default='', help='only the cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds each timed run lasts at least')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    cases = [c for c in all_cases(args.sizes, args.depths, args.max_loop_size) if args.filter in c.name]
+    report = run(cases, args.repeat, args.min_time)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for name, params, ratio in regressions:
+            sys.stderr.write('REGRESSION %s %s: %.2fx of the baseline throughput\n'
+                             % (name, json.dumps(params, sort_keys=True), ratio))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import numpy
+
+from transfromations import solvers
+
+
+class GeometryStore(object):
+    """
+    Keeps the vertices of many polygons in one contiguous float64 buffer.
+    Polygon i owns the rows offsets[i]:offsets[i + 1] (CSR-style layout).
+    """
+
+    def __init__(self, capacity=1024):
+        self._buffer = numpy.empty((capacity, 2), dtype=numpy.float64)
+        self._offsets = [0]
+        self._listeners = []
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def n_points(self):
+        return self._offsets[-1]
+
+    def add_polygon(self, points):
+        """
+        :param points: (N, 2) array
+        :return: the index of the new polygon
+        """
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        start = self._offsets[-1]
+        end = start + len(points)
+        self._reserve(end)
+        self._buffer[start:end] = points
+        self._offsets.append(end)
+        return len(self._offsets) - 2
+
+    def _reserve(self, n_points):
+        if n_points > len(self._buffer):
+            capacity = max(n_points, 2 * len(self._buffer))
+            buffer = numpy.empty((capacity, 2), dtype=numpy.float64)
+            buffer[:self.n_points()] = self._buffer[:self.n_points()]
+            self._buffer = buffer
+
+    def points(self, index):
+        """
+        :return: a (N, 2) view into the buffer - valid until the next add_polygon.
+        """
+        return self._buffer[self._offsets[index]:self._offsets[index + 1]]
+
+    def set_points(self, index, points):
+        self.points(index)[:] = points
+
+    def all_points(self):
+        """
+        :return: a (N, 2) view of every vertex of every polygon.
+        """
+        return self._buffer[:self.n_points()]
+
+    def offsets(self):
+        return numpy.array(self._offsets)
+
+    def polygon_of(self, point_index):
+        """
+        :param point_index: row in all_points(), or an array of rows.
+        :return: (polygon index, vertex index inside the polygon), arrays for an array of rows.
+        """
+        offsets = numpy.asarray(self._offsets)
+        polygon = numpy.searchsorted(offsets, point_index, side='right') - 1
+        return polygon, point_index - offsets[polygon]
+
+    def rows(self, indices):
+        """
+        :param indices: polygon indices
+        :return: array of the rows of all their vertices, polygon after polygon.
+        """
+        offsets = numpy.asarray(self._offsets)
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        starts = offsets[indices]
+        lengths = offsets[indices + 1] - starts
+        # Each row is its polygon start plus its position inside the polygon.
+        firsts = numpy.cumsum(lengths) - lengths
+        return numpy.repeat(starts - firsts, lengths) + numpy.arange(lengths.sum())
+
+    def transform_polygons(self, indices, transformation):
+        """
+        Transforms the vertices of the given polygons with one vectorized call.
+        :return: the transformed rows, see rows.
+        """
+        rows = self.rows(indices)
+        self._buffer[rows] = transformation.transform_points(self._buffer[rows])
+        return rows
+
+    def apply_matrices(self, indices, matrices):
+        """
+        Transforms each polygon by its own 3x3 matrix, all in one vectorized pass.
+        :param indices: polygon indices
+        :param matrices: (len(indices), 3, 3) array, or one (3, 3) matrix for all of them.
+        :return: the transformed rows, see rows.
+        """
+        rows = self.rows(indices)
+        matrices = numpy.asarray(matrices, dtype=numpy.float64)
+        if matrices.ndim == 2:
+            self._buffer[rows] = solvers.apply_matrix(matrices, self._buffer[rows])
+            return rows
+        offsets = numpy.asarray(self._offsets)
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        per_row = numpy.repeat(matrices, offsets[indices + 1] - offsets[indices], axis=0)
+        points = self._buffer[rows]
+        v = numpy.einsum('nij,nj->ni', per_row[:, :, :2], points) + per_row[:, :, 2]
+        self._buffer[rows] = v[:, :2] / v[:, 2:]
+        return rows
+
+    def transform(self, transformation):
+        """
+        Transforms every stored vertex with one vectorized call.
+        """
+        all_points = self.all_points()
+        all_points[:] = transformation.transform_points(all_points)
+
+    def add_listener(self, listener):
+        """
+        :param listener: called as listener(first_row, points) whenever the scene positions of the
+                         rows first_row, first_row + 1, ... change, e.g. VertexIndex.update. first_row may
+                         also be an array of the rows, see scene_rows_changed.
+        """
+        self._listeners.append(listener)
+
+    def scene_points_changed(self, index, points):
+        """
+        :param index: polygon index
+        :param points: (N, 2) array of the polygon vertices in scene coordinates.
+        """
+        for listener in self._listeners:
+            listener(self._offsets[index], points)
+
+    def scene_rows_changed(self, rows):
+        """
+        :param rows: array of rows which now hold the scene coordinates of their vertices.
+        """
+        points = self._buffer[rows]
+        for listener in self._listeners:
+            listener(rows, points)
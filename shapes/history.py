@@ -0,0 +1,192 @@
+"""
+Undo / redo of the transformations applied to the polygons of a GeometryStore.
+
+A step keeps its transformation - the 3x3 matrix of a projective one, the coefficients or control pairs of the
+others - and which polygons it moved, never their vertices, so thousands of steps take a few hundred kilobytes
+whatever the size of the scene. Jumping any number of projective steps composes their matrices, or the inverses
+of their matrices when undoing, and then moves every affected polygon once, by its own composed matrix; other
+steps are redone and undone one at a time with their transformation and its inverse.
+Only a step that cannot be undone this way - a singular matrix, or a transformation without an inverse that
+takes the vertices back - keeps the affected vertices before (and, once undone, after) the step instead.
+This module must not import Qt.
+"""
+import numpy
+
+from transfromations.linear_transformations import ProjectiveTransformation
+from transfromations.thin_plate import ThinPlateSpline
+
+
+class _Step(object):
+    __slots__ = ('indices', 'n_polygons', 'matrix', 'transformation', 'before', 'after')
+
+    def __init__(self, indices, n_polygons, matrix=None, transformation=None, before=None):
+        """
+        :param indices: array of the moved polygons, None for the first n_polygons - all there were.
+        :param matrix: 3x3 array of an invertible projective step.
+        :param transformation: a step without a matrix, whose inverse takes the vertices back.
+        :param before: the rows and the points they held before the step, only kept when neither can undo it.
+        """
+        self.indices = indices
+        self.n_polygons = n_polygons
+        self.matrix = matrix
+        self.transformation = transformation
+        self.before = before
+        self.after = None
+
+    def polygons(self):
+        return numpy.arange(self.n_polygons) if self.indices is None else self.indices
+
+
+class TransformationHistory(object):
+    # Steps whose matrix has a larger condition number are kept as vertices, their inverse would be garbage.
+    MAX_CONDITION = 1e12
+    # Largest distance, relative to the extent of the vertices, an undone step may leave them from where they were.
+    ROUND_TRIP_TOLERANCE = 1e-9
+
+    def __init__(self, store):
+        """
+        :type store: GeometryStore
+        """
+        self._store = store
+        self._steps = []
+        self._position = 0
+        self._inverses = {}
+
+    def __len__(self):
+        return len(self._steps)
+
+    def position(self):
+        """
+        :return: how many steps are applied.
+        """
+        return self._position
+
+    def can_undo(self):
+        return self._position > 0
+
+    def can_redo(self):
+        return self._position < len(self._steps)
+
+    def record(self, transformation, indices=None):
+        """
+        To be called right before the store vertices of the polygons are transformed. Drops the undone steps.
+        :type transformation: Transformation
+        :param indices: the polygons about to be transformed, None for all of them.
+        """
+        del self._steps[self._position:]
+        for k in [k for k in self._inverses if k >= self._position]:
+            del self._inverses[k]
+        if indices is not None:
+            indices = numpy.asarray(indices, dtype=numpy.int64)
+        step = _Step(indices, len(self._store))
+        if indices is not None and not len(indices):
+            # Moves no polygon, e.g. a transformation of the image layers only.
+            step.matrix = numpy.eye(3)
+        elif isinstance(transformation, ProjectiveTransformation):
+            matrix = numpy.asarray(transformation.matrix(), dtype=numpy.float64)
+            if numpy.all(numpy.isfinite(matrix)) and numpy.linalg.cond(matrix) < self.MAX_CONDITION:
+                step.matrix = matrix
+        elif self._undoes(transformation, step):
+            step.transformation = transformation
+            if isinstance(transformation, ThinPlateSpline):
+                step.transformation = transformation.without_system()
+        if step.matrix is None and step.transformation is None:
+            rows = self._store.rows(step.polygons())
+            step.before = rows, self._store.all_points()[rows]
+        self._steps.append(step)
+        self._position += 1
+
+    def _undoes(self, transformation, step):
+        """
+        :return: whether the inverse of transformation takes the vertices of the step back where they are now.
+        """
+        points = self._store.all_points()[self._store.rows(step.polygons())]
+        if not len(points):
+            return True
+        with numpy.errstate(all='ignore'):
+            back = transformation.inverse().transform_points(transformation.transform_points(points))
+        extent = max(numpy.abs(points).max(), 1.)
+        return bool(numpy.all(numpy.abs(back - points) <= self.ROUND_TRIP_TOLERANCE * extent))
+
+    def undo(self):
+        return self.jump_to(self._position - 1)
+
+    def redo(self):
+        return self.jump_to(self._position + 1)
+
+    def jump_to(self, position):
+        """
+        Undoes or redoes steps until `position` steps are applied.
+        :return: array of the moved rows of the store, to be passed to GeometryStore.scene_rows_changed.
+        """
+        assert 0 <= position <= len(self._steps)
+        moved = []
+        if position < self._position:
+            for first, last in reversed(self._runs(position, self._position)):
+                moved.append(self._apply(first, last, backward=True))
+        else:
+            for first, last in self._runs(self._position, position):
+                moved.append(self._apply(first, last, backward=False))
+        self._position = position
+        if not moved:
+            return numpy.zeros(0, dtype=numpy.int64)
+        return numpy.unique(numpy.concatenate(moved))
+
+    def _runs(self, first, last):
+        """
+        Splits the steps first..last - 1 into runs of matrix steps and single steps without a matrix.
+        :return: list of (first, last) bounds.
+        """
+        res = []
+        start = first
+        for k in range(first, last):
+            if self._steps[k].matrix is None:
+                if start < k:
+                    res.append((start, k))
+                res.append((k, k + 1))
+                start = k + 1
+        if start < last:
+            res.append((start, last))
+        return res
+
+    def _inverse(self, k):
+        if k not in self._inverses:
+            self._inverses[k] = numpy.linalg.inv(self._steps[k].matrix)
+        return self._inverses[k]
+
+    def _apply(self, first, last, backward):
+        steps = self._steps[first:last]
+        if steps[0].matrix is None:
+            if steps[0].transformation is None:
+                return self._apply_snapshot(steps[0], backward)
+            return self._apply_transformation(steps[0], backward)
+        order = range(last - 1, first - 1, -1) if backward else range(first, last)
+        if all(s.indices is None and s.n_polygons == steps[0].n_polygons for s in steps):
+            # The same polygons all along, one composed matrix moves them all.
+            matrix = numpy.eye(3)
+            for k in order:
+                matrix = numpy.dot(self._inverse(k) if backward else self._steps[k].matrix, matrix)
+            return self._store.apply_matrices(steps[0].polygons(), matrix)
+        # Every polygon accumulates the matrices of the steps that moved it, then moves once.
+        polygons = numpy.unique(numpy.concatenate([s.polygons() for s in steps]))
+        composed = numpy.tile(numpy.eye(3), (len(polygons), 1, 1))
+        for k in order:
+            step = self._steps[k]
+            matrix = self._inverse(k) if backward else step.matrix
+            at = numpy.searchsorted(polygons, step.polygons())
+            composed[at] = numpy.matmul(matrix, composed[at])
+        return self._store.apply_matrices(polygons, composed)
+
+    def _apply_transformation(self, step, backward):
+        transformation = step.transformation.inverse() if backward else step.transformation
+        return self._store.transform_polygons(step.polygons(), transformation)
+
+    def _apply_snapshot(self, step, backward):
+        rows, points = step.before
+        if backward:
+            if step.after is None:
+                step.after = self._store.all_points()[rows]
+            self._store.all_points()[rows] = points
+        else:
+            self._store.all_points()[rows] = step.after
+        return rows
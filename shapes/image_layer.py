@@ -0,0 +1,85 @@
+import numpy
+
+from utils.my_qt import *
+from transfromations import warp
+from transfromations.transformations import IdTransformation
+
+
+def qimage_to_array(image):
+    """
+    :param image:
+    :type image: QtGui.QImage
+    :return: (H, W, 4) uint8 array in the native ARGB32 byte order.
+    """
+    image = image.convertToFormat(QtGui.QImage.Format_ARGB32)
+    ptr = image.constBits()
+    ptr.setsize(image.byteCount())
+    data = numpy.frombuffer(ptr, numpy.uint8).reshape(image.height(), image.bytesPerLine())
+    return data[:, :image.width() * 4].reshape(image.height(), image.width(), 4).copy()
+
+
+def array_to_qimage(array):
+    """
+    :param array: (H, W, 4) uint8 array in the native ARGB32 byte order.
+    :rtype: QtGui.QImage
+    """
+    array = numpy.ascontiguousarray(array, dtype=numpy.uint8)
+    height, width = array.shape[:2]
+    image = QtGui.QImage(array.data, width, height, width * 4, QtGui.QImage.Format_ARGB32)
+    # QImage does not own the buffer.
+    return image.copy()
+
+
+class WarpedImageLayer(QtGui.QGraphicsPixmapItem):
+    """
+    A background image shown under a transformation. Only the visible part of the view is warped,
+    at the resolution of the current zoom level.
+    """
+
+    def __init__(self, image, executor=None, parent=None, scene=None):
+        """
+        :param image:
+        :type image: QtGui.QImage
+        :param executor: spreads the warp tiles, a warp.thread_pool() if None.
+        """
+        super(WarpedImageLayer, self).__init__(parent, scene)
+        self._image = qimage_to_array(image)
+        self._transformation = IdTransformation()
+        self._executor = executor if executor is not None else warp.thread_pool()
+        self.setZValue(-1)
+        self.setTransformationMode(QtCore.Qt.SmoothTransformation)
+
+    def my_transform(self, transformation):
+        """
+        Applies transformation after the current one. Takes effect on the next update_view.
+        """
+        if isinstance(self._transformation, IdTransformation):
+            self._transformation = transformation
+        else:
+            self._transformation = transformation.compose(self._transformation)
+
+    def transformation(self):
+        return self._transformation
+
+    def set_transformation(self, transformation):
+        """
+        Replaces the current transformation, e.g. when undoing. Takes effect on the next update_view.
+        """
+        self._transformation = transformation
+
+    def update_view(self, view):
+        """
+        Re-warps the region of the scene visible in the view.
+        :param view:
+        :type view: QtGui.QGraphicsView
+        """
+        viewport = view.viewport().rect()
+        if viewport.isEmpty():
+            return
+        visible = view.mapToScene(viewport).boundingRect()
+        scale = viewport.width() / visible.width()
+        warped = warp.warp_image(self._image, self._transformation, (viewport.height(), viewport.width()),
+                                 (visible.left(), visible.top()), scale, executor=self._executor)
+        self.setPixmap(QtGui.QPixmap.fromImage(array_to_qimage(warped)))
+        self.setPos(visible.topLeft())
+        self.setScale(1. / scale)
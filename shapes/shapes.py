@@ -1,24 +1,70 @@
+import math
+
+import numpy
+
 from utils.my_qt import *
-from utils.utils import average
+from transfromations.transformations import points_to_array
+from transfromations.linear_transformations import ProjectiveTransformation
+from transfromations.qt_adapters import to_qtransform, from_qtransform
+from shapes.geometry_store import GeometryStore
+from shapes.simplify import simplify_polygon
 ABC = ''.join(chr(ord('A') + i) for i in xrange(26))
 
 
+def vertex_label(i):
+    """
+    A, B, ..., Z, AA, AB, ... like spreadsheet columns, so every vertex gets a label.
+    """
+    res = ''
+    i += 1
+    while i > 0:
+        i, letter = divmod(i - 1, len(ABC))
+        res = ABC[letter] + res
+    return res
+
+
 class PointItem(QtGui.QGraphicsItem):
+    # Shared by all the points, created on first use. Fonts by pixel size.
+    _fonts = {}
+    _brush = None
+
+    @classmethod
+    def font(cls, pixel_size):
+        if pixel_size not in cls._fonts:
+            font = QtGui.QFont()
+            font.setBold(True)
+            font.setPixelSize(pixel_size)
+            cls._fonts[pixel_size] = font
+        return cls._fonts[pixel_size]
+
+    @classmethod
+    def brush(cls):
+        if cls._brush is None:
+            cls._brush = QtGui.QBrush(QtGui.QColor("purple"))
+        return cls._brush
+
     def __init__(self, x, y, color, radius, owner, text, parent=None, scene=None):
         super(PointItem, self).__init__(parent, scene)
         self._point = QtCore.QPointF(x, y)
         self._radius = radius
         self.color = color
         self._owner = owner
-        adjust = 0.5
-        self._bounding_rect = QtCore.QRectF(-self._radius - adjust, -self._radius * 3 - adjust,
-                                            self._radius * 3 + adjust, self._radius * 5 + adjust)
         self._text = text
+        self._shape = QtGui.QPainterPath()
+        self._shape.addEllipse(-self._radius, -self._radius, self._radius * 2, self._radius * 2)
+        # The label is drawn above the point and may be several letters wide.
+        text_rect = QtGui.QFontMetricsF(self.font(self._radius * 2)).boundingRect(text)
+        adjust = 0.5
+        self._bounding_rect = self._shape.boundingRect().united(text_rect.translated(0, -self._radius)).adjusted(
+            -adjust, -adjust, adjust, adjust)
         self.setPos(self._point)
+        # Points are drawn in device pixels (see PolygonItem.handle), so their cached pixmaps stay sharp and are
+        # only redrawn when the text changes.
+        self.setCacheMode(QtGui.QGraphicsItem.DeviceCoordinateCache)
 
     def move_to(self, point):
-        self._point = point
-        self.setPos(point)
+        self._point = QtCore.QPointF(point.x(), point.y())
+        self.setPos(self._point)
 
     def extra_items(self):
         return []
@@ -27,6 +73,15 @@ class PointItem(QtGui.QGraphicsItem):
         return self._owner
 
     def get_point(self):
+        """
+        :return: the scene position, also when the point is attached to a transformed polygon.
+        """
+        parent = self.parentItem()
+        if parent is None:
+            return self._point
+        return parent.mapToScene(self._point)
+
+    def get_local_point(self):
         return self._point
 
     def get_text(self):
@@ -40,9 +95,7 @@ class PointItem(QtGui.QGraphicsItem):
         return self._bounding_rect
 
     def shape(self):
-        path = QtGui.QPainterPath()
-        path.addEllipse(-self._radius, -self._radius, self._radius * 2, self._radius * 2)
-        return path
+        return self._shape
 
     def paint(self, painter, option, widget):
         """
@@ -54,61 +107,289 @@ class PointItem(QtGui.QGraphicsItem):
         :return:
         """
         # Body.
-        font = QtGui.QFont()
-        font.setBold(True)
-        font.setPixelSize(self._radius * 2)
-        painter.setFont(font)
+        painter.setFont(self.font(self._radius * 2))
         painter.drawText(-QtCore.QPoint(0, self._radius), self._text)
-        painter.setBrush(QtGui.QColor("purple"))
-        shape = self.shape()
-        painter.drawPath(shape)
+        painter.setBrush(self.brush())
+        painter.drawPath(self._shape)
 
 
 class PolygonItem(QtGui.QGraphicsItem):
-    def __init__(self, points, color, parent=None, scene=None):
+    # Below this many device pixels per item unit the outline is drawn decimated, see _outline.
+    SIMPLIFY_BELOW_DETAIL = 1.
+    # Largest distance, in device pixels, of a dropped vertex from the decimated outline.
+    SIMPLIFY_TOLERANCE = 0.5
+    # Outlines with fewer vertices are always drawn whole.
+    SIMPLIFY_MIN_POINTS = 16
+
+    HIGHLIGHT_COLOR = QtGui.QColor(255, 140, 0)
+
+    # Shared by all the polygons, created on first use. Pens by color.
+    _pens = {}
+    _no_brush = None
+
+    @classmethod
+    def pen(cls, color):
+        key = QtGui.QColor(color).rgba()
+        if key not in cls._pens:
+            pen = QtGui.QPen()
+            pen.setWidth(5)
+            pen.setCosmetic(True)
+            pen.setBrush(color)
+            cls._pens[key] = pen
+        return cls._pens[key]
+
+    @classmethod
+    def no_brush(cls):
+        if cls._no_brush is None:
+            cls._no_brush = QtGui.QBrush(QtCore.Qt.NoBrush)
+        return cls._no_brush
+
+    def __init__(self, points, color, store=None, parent=None, scene=None):
+        """
+        :param points:
+        :type points: List[QtCore.QPointF]
+        :param store: the buffer holding the vertices, a private one is created if None.
+        :type store: GeometryStore
+        """
         super(PolygonItem, self).__init__(parent, scene)
         self.color = color
-        self._points_items = [PointItem(p.x(), p.y(), self.color, 8, self, letter) for p, letter in zip(points, ABC)]
-        for p in self._points_items:
-            p.setCursor(QtCore.Qt.OpenHandCursor)
-        self._polygon = self._get_polygon()
+        self._store = store if store is not None else GeometryStore(len(points))
+        self._index = self._store.add_polygon(points_to_array(points))
+        self._handles = {}
+        self._editing = False
+        self._hovered = False
+        self._highlighted = False
+        self.setAcceptHoverEvents(True)
+        # The Qt polygon and paths are only built when the item is painted or hit tested.
+        self._polygon = None
+        self._bounding_rect = self._get_bounding_rect()
+        self._shape = None
+        # Decimated outlines by level of detail.
+        self._outlines = {}
+        self._handles_visible = True
+        self._store.scene_points_changed(self._index, self.local_points_array())
+
+    def store(self):
+        return self._store
+
+    def store_index(self):
+        return self._index
 
     def my_transform(self, transformation):
+        if isinstance(transformation, ProjectiveTransformation):
+            self.defer_transform(transformation)
+            self._store.scene_points_changed(self._index, self.points_array())
+            return
         self.hide()
-        for p in self._points_items:
-            p.my_transform(transformation)
-        self._polygon = self._get_polygon()
+        self.set_points_array(transformation.transform_points(self.points_array()))
         self.show()
         self.update()
 
+    def defer_transform(self, transformation):
+        """
+        Folds a projective transformation into the pending one, the item transform: Qt maps the vertices while
+        painting and hit testing the item, nothing is moved in Python. The stored vertices and the store listeners
+        only see it once materialized by bake_transform.
+        :type transformation: ProjectiveTransformation
+        """
+        self.setTransform(self.transform() * to_qtransform(transformation))
+
+    def pending_transformation(self):
+        """
+        :return: what the stored vertices still have to go through to reach the scene, None if nothing.
+        :rtype: ProjectiveTransformation
+        """
+        if self.transform().isIdentity():
+            return None
+        return from_qtransform(self.transform())
+
+    def set_points_array(self, points):
+        """
+        Moves the vertices to the given scene coordinates and drops the item transform.
+        :param points: (N, 2) array
+        """
+        self.setTransform(QtGui.QTransform())
+        self._store.set_points(self._index, points)
+        self.geometry_changed()
+
+    def bake_transform(self):
+        """
+        Writes the item transform into the stored vertices, so they hold scene coordinates - materializes the
+        pending transformation.
+        """
+        if not self.transform().isIdentity():
+            self.set_points_array(self.points_array())
+
+    def geometry_changed(self, notify=True):
+        """
+        To be called after the stored vertices were modified directly.
+        :param notify: False when the caller tells the store listeners about many polygons at once, see
+                       GeometryStore.scene_rows_changed.
+        """
+        self._set_bounding_rect(self._get_bounding_rect())
+        if notify:
+            self._store.scene_points_changed(self._index, self.points_array())
+
+    @staticmethod
+    def geometries_changed(polygons):
+        """
+        geometry_changed(notify=False) of many polygons of one store, their bounding rects computed in one numpy pass.
+        Qt still has to be told item by item (prepareGeometryChange), which with building the QRectF and dropping
+        the cached paths is the per polygon cost left - a few Python calls each.
+        :type polygons: list[PolygonItem]
+        """
+        if not polygons:
+            return
+        store = polygons[0].store()
+        indices = numpy.array([p.store_index() for p in polygons], dtype=numpy.int64)
+        offsets = store.offsets()
+        lengths = offsets[indices + 1] - offsets[indices]
+        points = store.all_points()[store.rows(indices)]
+        firsts = numpy.cumsum(lengths) - lengths
+        lows = numpy.minimum.reduceat(points, firsts, axis=0).tolist()
+        highs = numpy.maximum.reduceat(points, firsts, axis=0).tolist()
+        for polygon, (x0, y0), (x1, y1) in zip(polygons, lows, highs):
+            polygon._set_bounding_rect(QtCore.QRectF(x0, y0, x1 - x0, y1 - y0))
+
+    def _set_bounding_rect(self, bounding_rect):
+        self.prepareGeometryChange()
+        self._polygon = None
+        self._bounding_rect = bounding_rect
+        self._shape = None
+        self._outlines = {}
+        if self._handles:
+            local = self._store.points(self._index)
+            for i, handle in self._handles.items():
+                handle.move_to(QtCore.QPointF(*local[i]))
+
     def extra_items(self):
-        return self._points_items
+        return []
+
+    def n_points(self):
+        return len(self._store.points(self._index))
+
+    def handle(self, i):
+        """
+        Creates the vertex handle on demand. The handles are children positioned in item coordinates, so
+        transforming the polygon moves them along, while ItemIgnoresTransformations keeps them from being skewed.
+        :rtype: PointItem
+        """
+        if i not in self._handles:
+            x, y = self._store.points(self._index)[i]
+            handle = PointItem(x, y, self.color, 8, self, vertex_label(i), parent=self)
+            handle.setCursor(QtCore.Qt.OpenHandCursor)
+            handle.setFlag(QtGui.QGraphicsItem.ItemIgnoresTransformations)
+            handle.setVisible(self._handles_visible)
+            self._handles[i] = handle
+        return self._handles[i]
+
+    def point_items(self):
+        return [self.handle(i) for i in xrange(self.n_points())]
+
+    def clear_handles(self):
+        for handle in self._handles.values():
+            handle.setParentItem(None)
+            if handle.scene() is not None:
+                handle.scene().removeItem(handle)
+        self._handles.clear()
+
+    def set_handles_visible(self, visible):
+        """
+        Hides the handles and their labels, e.g. when the view is zoomed too far out for them to be useful.
+        """
+        self._handles_visible = visible
+        for handle in self._handles.values():
+            handle.setVisible(visible)
+
+    def set_highlighted(self, highlighted):
+        """
+        Draws the outline in HIGHLIGHT_COLOR, e.g. while the polygon is selected.
+        """
+        if highlighted != self._highlighted:
+            self._highlighted = highlighted
+            self.update()
+
+    def is_highlighted(self):
+        return self._highlighted
+
+    def set_editing(self, editing):
+        self._editing = editing
+        if not editing and not self._hovered:
+            self.clear_handles()
+
+    def hoverEnterEvent(self, event):
+        self._hovered = True
+        self.point_items()
+
+    def hoverLeaveEvent(self, event):
+        self._hovered = False
+        if not self._editing:
+            self.clear_handles()
+
+    def local_points_array(self):
+        """
+        :return: (N, 2) view of the stored vertices, in item coordinates.
+        """
+        return self._store.points(self._index)
+
+    def points_array(self):
+        """
+        :return: (N, 2) array of the vertices in scene coordinates.
+        """
+        local = self.local_points_array()
+        if self.transform().isIdentity():
+            return local.copy()
+        return from_qtransform(self.transform()).transform_points(local)
 
     def boundingRect(self):
-        return self._polygon.boundingRect()
+        return self._bounding_rect
 
     def shape(self):
-        path = QtGui.QPainterPath()
-        path.addPolygon(self._polygon)
-        return path
+        # Rebuilt only after geometry_changed. No cache mode is set: the cosmetic pen reaches out of the bounding
+        # rect by a width in pixels, which a cached pixmap would clip.
+        if self._shape is None:
+            if self._polygon is None:
+                self._polygon = self._get_polygon()
+            self._shape = QtGui.QPainterPath()
+            self._shape.addPolygon(self._polygon)
+        return self._shape
+
+    def _outline(self, detail):
+        """
+        :param detail: device pixels per item unit.
+        :return: the path drawn at this level of detail, decimated once per power of two of detail.
+        """
+        if detail >= self.SIMPLIFY_BELOW_DETAIL or self.n_points() < self.SIMPLIFY_MIN_POINTS:
+            return self.shape()
+        level = int(math.floor(math.log(detail, 2)))
+        if level not in self._outlines:
+            points = simplify_polygon(self.local_points_array(), self.SIMPLIFY_TOLERANCE / 2. ** level)
+            path = QtGui.QPainterPath()
+            path.addPolygon(QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in points] + [QtCore.QPointF(*points[0])]))
+            self._outlines[level] = path
+        return self._outlines[level]
 
     def paint(self, painter, option, widget):
-        pen = QtGui.QPen()
-        pen.setWidth(5)
-        pen.setBrush(self.color)
-        painter.setBrush(QtGui.QColor(0, 0, 0, 0))
-        painter.setPen(pen)
-        painter.drawPath(self.shape())
+        painter.setBrush(self.no_brush())
+        painter.setPen(self.pen(self.HIGHLIGHT_COLOR if self._highlighted else self.color))
+        painter.drawPath(self._outline(option.levelOfDetailFromTransform(painter.worldTransform())))
+
+    def _get_bounding_rect(self):
+        local = self._store.points(self._index)
+        (x0, y0), (x1, y1) = local.min(axis=0), local.max(axis=0)
+        return QtCore.QRectF(x0, y0, x1 - x0, y1 - y0)
 
     def _get_polygon(self):
-        return QtGui.QPolygonF([p.get_point() for p in self._points_items] + [self._points_items[0].get_point()])
+        local = self._store.points(self._index)
+        return QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in local] + [QtCore.QPointF(*local[0])])
 
     def mean(self):
-        return average([self._polygon.at(i) for i in xrange(self._polygon.size() - 1)])
+        x, y = self.local_points_array().mean(axis=0)
+        return self.mapToScene(QtCore.QPointF(x, y))
 
 
 class RectangleItem(PolygonItem):
-    def __init__(self, rect, color):
+    def __init__(self, rect, color, store=None):
         """
         :param rect:
         :type rect: QtCore.QRectF
@@ -116,7 +397,7 @@ class RectangleItem(PolygonItem):
         :return:
         """
         super(RectangleItem, self).__init__([rect.topLeft(), rect.topRight(), rect.bottomRight(), rect.bottomLeft()],
-                                            color)
+                                            color, store)
 
 
 
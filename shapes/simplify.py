@@ -0,0 +1,52 @@
+"""
+Douglas-Peucker decimation of polygon outlines, used for drawing them at low levels of detail.
+This module must not import Qt.
+"""
+import numpy
+
+
+def _keep_polyline(points, tolerance, keep, first, last):
+    """
+    Marks in keep the vertices of points[first:last + 1] the decimation keeps. Iterative, so long outlines
+    do not hit the recursion limit; each step finds the farthest vertex of a span with numpy.
+    """
+    spans = [(first, last)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        inner = points[first + 1:last]
+        direction = end - start
+        length = numpy.hypot(*direction)
+        if length == 0:
+            distances = numpy.hypot(*(inner - start).T)
+        else:
+            distances = numpy.abs(direction[0] * (inner[:, 1] - start[1]) - direction[1] * (inner[:, 0] - start[0]))
+            distances /= length
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            spans.append((first, middle))
+            spans.append((middle, last))
+
+
+def simplify_polygon(points, tolerance):
+    """
+    :param points: (N, 2) array of the vertices of a closed polygon.
+    :param tolerance: largest distance of a dropped vertex from the simplified outline.
+    :return: (M, 2) array of the kept vertices, in order, M <= N.
+    """
+    points = numpy.asarray(points, dtype=numpy.float64)
+    n = len(points)
+    if n <= 3:
+        return points
+    # A closed outline is split in two at the vertex farthest from the first one.
+    farthest = int(((points - points[0]) ** 2).sum(axis=1).argmax())
+    keep = numpy.zeros(n + 1, dtype=bool)
+    keep[0] = keep[farthest] = True
+    closed = numpy.vstack([points, points[:1]])
+    _keep_polyline(closed, tolerance, keep, 0, farthest)
+    _keep_polyline(closed, tolerance, keep, farthest, n)
+    return points[keep[:n]]
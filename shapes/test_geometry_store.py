@@ -0,0 +1,45 @@
+import unittest
+
+import numpy
+
+from shapes.geometry_store import GeometryStore
+from transfromations import solvers
+
+
+class GeometryStoreTest(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(0)
+        self.polygons = [random.uniform(0, 100, (n, 2)) for n in (3, 5, 4, 6)]
+        # Small capacity, so adding polygons grows the buffer.
+        self.store = GeometryStore(capacity=4)
+        for points in self.polygons:
+            self.store.add_polygon(points)
+
+    def test_rows_and_polygon_of(self):
+        rows = self.store.rows([3, 1])
+        numpy.testing.assert_array_equal(rows, list(range(12, 18)) + list(range(3, 8)))
+        polygons, vertices = self.store.polygon_of(rows)
+        numpy.testing.assert_array_equal(polygons, [3] * 6 + [1] * 5)
+        numpy.testing.assert_array_equal(vertices, list(range(6)) + list(range(5)))
+        self.assertEqual(self.store.polygon_of(4), (1, 1))
+
+    def test_apply_matrices_moves_each_polygon_by_its_own(self):
+        matrices = numpy.array([numpy.eye(3), numpy.eye(3)])
+        matrices[0, :2, 2] = 10., 20.
+        matrices[1, 2, :2] = 1e-3, -1e-3
+        self.store.apply_matrices([2, 0], matrices)
+        numpy.testing.assert_allclose(self.store.points(2), solvers.apply_matrix(matrices[0], self.polygons[2]))
+        numpy.testing.assert_allclose(self.store.points(0), solvers.apply_matrix(matrices[1], self.polygons[0]))
+        numpy.testing.assert_array_equal(self.store.points(1), self.polygons[1])
+
+    def test_listeners_get_rows(self):
+        calls = []
+        self.store.add_listener(lambda rows, points: calls.append((rows, points.copy())))
+        self.store.scene_rows_changed(numpy.array([0, 5]))
+        self.store.scene_points_changed(2, self.polygons[2])
+        numpy.testing.assert_array_equal(calls[0][1], [self.polygons[0][0], self.polygons[1][2]])
+        self.assertEqual(calls[1][0], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
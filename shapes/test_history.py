@@ -0,0 +1,123 @@
+import unittest
+
+import numpy
+
+from shapes.geometry_store import GeometryStore
+from shapes.history import TransformationHistory
+from transfromations.bilinear import BilinearTransformation
+from transfromations.geometry import Point
+from transfromations.linear_transformations import AffineTransformation
+from transfromations.thin_plate import ThinPlateSpline
+from transfromations.transformations_builders import AffineBuilder
+
+
+def _rotation(theta, tx, ty):
+    return AffineTransformation(numpy.cos(theta), -numpy.sin(theta), tx, numpy.sin(theta), numpy.cos(theta), ty)
+
+
+class TransformationHistoryTest(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(0)
+        self.store = GeometryStore()
+        for n in (4, 5, 3, 6, 4):
+            self.store.add_polygon(random.uniform(0, 100, (n, 2)))
+        self.history = TransformationHistory(self.store)
+        # The vertices after each step.
+        self.states = [self.store.all_points().copy()]
+
+    def transform(self, transformation, indices=None):
+        self.history.record(transformation, indices)
+        if indices is None:
+            self.store.transform(transformation)
+        else:
+            self.store.transform_polygons(indices, transformation)
+        self.states.append(self.store.all_points().copy())
+
+    def assert_at(self, position, atol=1e-9):
+        self.assertEqual(self.history.position(), position)
+        numpy.testing.assert_allclose(self.store.all_points(), self.states[position], atol=atol)
+
+    def check_every_jump(self, atol=1e-9):
+        n = len(self.history)
+        for position in [0, n, n // 2, 1, n, 0, n - 1, 2, n]:
+            rows = self.history.jump_to(position)
+            self.assert_at(position, atol)
+            self.assertTrue(numpy.all(numpy.diff(rows) > 0))
+
+    def test_matrix_steps_of_all_and_some_polygons(self):
+        for i in range(20):
+            self.transform(_rotation(0.1 * i, i, -i), None if i % 3 else [i % 5, (i + 2) % 5])
+        self.check_every_jump()
+
+    def test_undo_redo(self):
+        for i in range(3):
+            self.transform(_rotation(0.2, 1., 2.), [i])
+        self.history.undo()
+        self.assert_at(2)
+        self.history.undo()
+        self.history.redo()
+        self.assert_at(2)
+        self.assertTrue(self.history.can_redo())
+
+    def test_recording_drops_the_undone_steps(self):
+        for i in range(4):
+            self.transform(_rotation(0.1, i, 0.))
+        self.history.jump_to(2)
+        del self.states[3:]
+        self.transform(_rotation(-0.3, 0., 5.), [1])
+        self.assertEqual(len(self.history), 3)
+        self.assertFalse(self.history.can_redo())
+        self.check_every_jump()
+
+    def test_singular_step(self):
+        # An affine fit onto collinear destinations squashes everything onto a line, it cannot be inverted.
+        builder = AffineBuilder()
+        for src, dst in [((0., 0.), (0., 0.)), ((10., 0.), (10., 0.)), ((0., 10.), (20., 0.))]:
+            builder = builder.move_point(Point(*src), Point(*dst))
+        self.transform(_rotation(0.3, 1., 1.))
+        self.transform(builder.get_transformation())
+        self.transform(_rotation(0., 5., 3.))
+        self.transform(_rotation(0.1, -2., 1.), [0, 2])
+        self.check_every_jump()
+
+    def test_long_histories_do_not_drift(self):
+        for i in range(2000):
+            self.transform(AffineTransformation(1.01, 0., 1., 0., 0.99, -1.) if i % 2 else
+                           AffineTransformation(1. / 1.01, 0., -1. / 1.01, 0., 1. / 0.99, 1. / 0.99))
+        self.history.jump_to(0)
+        self.assert_at(0, atol=1e-6)
+
+    def test_bilinear_and_spline_steps_keep_parameters(self):
+        bilinear = BilinearTransformation(numpy.array([[1., 1.01, 0.02, 1e-4], [2., 0.01, 0.99, -1e-4]]))
+        spline = ThinPlateSpline(numpy.array([[0., 100., 0., 100., 50.], [0., 0., 100., 100., 50.]]),
+                                 numpy.array([[0., 100., 0., 100., 53.], [0., 0., 100., 100., 48.]]))
+        self.transform(_rotation(0.2, 3., 4.))
+        self.transform(bilinear, [0, 3])
+        self.transform(spline)
+        self.transform(_rotation(-0.2, 1., 0.), [1])
+        for step in self.history._steps:
+            self.assertIsNone(step.before)
+        self.assertIsNone(self.history._steps[2].transformation._system_inverse)
+        self.check_every_jump(atol=1e-6)
+
+    def test_steps_moving_no_polygon(self):
+        # Image layer only steps, see RectanglesDAST.transform_image_layers.
+        bilinear = BilinearTransformation(numpy.array([[1., 1.01, 0.02, 1e-4], [2., 0.01, 0.99, -1e-4]]))
+        self.transform(_rotation(0.2, 3., 4.), [1])
+        self.transform(bilinear, [])
+        self.transform(_rotation(0.1, 1., 1.), [])
+        self.transform(_rotation(-0.1, 0., 2.))
+        self.check_every_jump()
+
+    def test_folding_spline_step_keeps_the_vertices(self):
+        # Pulling the middle control across the others folds the plane over, the inverse cannot undo it.
+        spline = ThinPlateSpline(numpy.array([[0., 100., 0., 100., 50.], [0., 0., 100., 100., 50.]]),
+                                 numpy.array([[0., 100., 0., 100., 150.], [0., 0., 100., 100., 150.]]))
+        self.transform(spline)
+        self.transform(_rotation(0.1, 0., 0.))
+        self.assertIsNotNone(self.history._steps[0].before)
+        self.check_every_jump()
+
+
+if __name__ == '__main__':
+    unittest.main()
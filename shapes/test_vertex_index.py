@@ -0,0 +1,66 @@
+import unittest
+
+import numpy
+
+from shapes.vertex_index import VertexIndex
+
+
+class VertexIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.random = numpy.random.RandomState(0)
+        self.points = self.random.uniform(0, 1000, (2000, 2))
+        self.index = VertexIndex(cell_size=32.)
+        self.index.update(0, self.points)
+
+    def assert_matches_a_scan(self, points, present=None):
+        """
+        Compares the rectangle queries with a brute force scan of points, of the ids where present is True.
+        """
+        if present is None:
+            present = numpy.ones(len(points), dtype=bool)
+        for x0, y0 in self.random.uniform(-50, 1000, (20, 2)):
+            x1, y1 = x0 + self.random.uniform(0, 300), y0 + self.random.uniform(0, 300)
+            inside = present & (points[:, 0] >= x0) & (points[:, 0] <= x1) & (points[:, 1] >= y0) & \
+                (points[:, 1] <= y1)
+            self.assertEqual(sorted(self.index.vertices_in_rect(x0, y0, x1, y1)), list(numpy.flatnonzero(inside)))
+        # Every cell holds exactly the present vertices in it.
+        cells = {}
+        for vertex_id in numpy.flatnonzero(present):
+            key = tuple(numpy.floor(points[vertex_id] / 32.).astype(int))
+            cells.setdefault(key, set()).add(vertex_id)
+        self.assertEqual(self.index._cells, cells)
+
+    def test_bulk_insert(self):
+        self.assertEqual(len(self.index), len(self.points))
+        self.assert_matches_a_scan(self.points)
+
+    def test_few_moves_update_cell_by_cell(self):
+        ids = self.random.choice(len(self.points), 50, replace=False)
+        self.points[ids] = self.random.uniform(0, 1000, (50, 2))
+        self.index.update(ids, self.points[ids])
+        self.assert_matches_a_scan(self.points)
+
+    def test_many_moves_rebuild(self):
+        self.points[:1500] += 100.
+        self.index.update(0, self.points[:1500])
+        self.assert_matches_a_scan(self.points)
+
+    def test_remove_and_add_back(self):
+        present = numpy.ones(len(self.points), dtype=bool)
+        for ids in (numpy.arange(10, 30), numpy.arange(len(self.points))):
+            self.index.remove(ids)
+            present[ids] = False
+            self.assert_matches_a_scan(self.points, present)
+        self.assertIsNone(self.index.nearest_vertex(500., 500., 1000.))
+        self.index.update(numpy.arange(5), self.points[:5])
+        present[:5] = True
+        self.assert_matches_a_scan(self.points, present)
+
+    def test_nearest_vertex(self):
+        x, y = self.points[7] + 0.5
+        self.assertEqual(self.index.nearest_vertex(x, y, 2.), 7)
+        self.assertIsNone(self.index.nearest_vertex(-500., -500., 10.))
+
+
+if __name__ == '__main__':
+    unittest.main()
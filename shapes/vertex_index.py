@@ -0,0 +1,142 @@
+import math
+
+import numpy
+
+
+class VertexIndex(object):
+    """
+    Uniform grid hash over vertex positions, for picking and snapping.
+    Vertices are identified by integer ids (rows of a GeometryStore) and updated incrementally.
+    """
+
+    # Updates moving more than this fraction of the vertices to other cells regroup the whole hash.
+    REBUILD_FRACTION = 0.25
+
+    def __init__(self, cell_size=32.):
+        self._cell_size = float(cell_size)
+        self._points = numpy.full((0, 2), numpy.nan)
+        self._cell_of = numpy.zeros((0, 2), dtype=numpy.int64)
+        self._cells = {}
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def _reserve(self, n):
+        if n > len(self._points):
+            capacity = max(n, 2 * len(self._points))
+            points = numpy.full((capacity, 2), numpy.nan)
+            points[:len(self._points)] = self._points
+            cell_of = numpy.zeros((capacity, 2), dtype=numpy.int64)
+            cell_of[:len(self._cell_of)] = self._cell_of
+            self._points, self._cell_of = points, cell_of
+
+    def _cells_of(self, points):
+        return numpy.floor(points / self._cell_size).astype(numpy.int64)
+
+    def update(self, first_id, points):
+        """
+        Sets the positions of the vertices first_id, first_id + 1, ... - adding them if needed.
+        Only the vertices that moved to another cell touch the hash.
+        :param first_id: the id of the first vertex, or an array with the id of every vertex.
+        :param points: (N, 2) array
+        """
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        if numpy.ndim(first_id) == 0:
+            ids = numpy.arange(first_id, first_id + len(points))
+        else:
+            ids = numpy.asarray(first_id, dtype=numpy.int64)
+        if len(ids) == 0:
+            return
+        end = int(ids.max()) + 1
+        self._reserve(end)
+        new_cells = self._cells_of(points)
+        is_new = numpy.isnan(self._points[ids, 0])
+        moved = is_new | (new_cells != self._cell_of[ids]).any(axis=1)
+        if moved.sum() > self.REBUILD_FRACTION * max(self._n, end):
+            # E.g. a whole selection was transformed: regrouping everything at once beats moving vertex by vertex.
+            self._points[ids] = points
+            self._cell_of[ids] = new_cells
+            self._n = max(self._n, end)
+            self._rebuild()
+            return
+        for offset in numpy.flatnonzero(moved):
+            vertex_id = int(ids[offset])
+            if not is_new[offset]:
+                old = tuple(self._cell_of[vertex_id])
+                bucket = self._cells[old]
+                bucket.discard(vertex_id)
+                if not bucket:
+                    del self._cells[old]
+            self._cells.setdefault(tuple(new_cells[offset]), set()).add(vertex_id)
+        self._points[ids] = points
+        self._cell_of[ids] = new_cells
+        self._n = max(self._n, end)
+
+    def remove(self, ids):
+        """
+        Drops the vertices from the index until they are updated again.
+        :param ids: array of vertex ids
+        """
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        ids = ids[ids < self._n]
+        ids = ids[~numpy.isnan(self._points[ids, 0])]
+        self._points[ids] = numpy.nan
+        if len(ids) > self.REBUILD_FRACTION * self._n:
+            self._rebuild()
+            return
+        for vertex_id in ids.tolist():
+            cell = tuple(self._cell_of[vertex_id])
+            bucket = self._cells[cell]
+            bucket.discard(vertex_id)
+            if not bucket:
+                del self._cells[cell]
+
+    def _rebuild(self):
+        ids = numpy.flatnonzero(~numpy.isnan(self._points[:self._n, 0]))
+        if not len(ids):
+            self._cells = {}
+            return
+        keys = self._cell_of[ids]
+        order = numpy.lexsort((keys[:, 1], keys[:, 0]))
+        keys, ids = keys[order], ids[order]
+        starts = numpy.flatnonzero(numpy.r_[True, (keys[1:] != keys[:-1]).any(axis=1)])
+        bounds = starts.tolist() + [len(ids)]
+        ids = ids.tolist()
+        self._cells = dict((tuple(key), set(ids[bounds[i]:bounds[i + 1]]))
+                           for i, key in enumerate(keys[starts].tolist()))
+
+    def vertices_in_rect(self, x0, y0, x1, y1):
+        """
+        :return: array of the ids of the vertices inside the rectangle.
+        """
+        (cx0, cy0), (cx1, cy1) = self._cells_of(numpy.array([[x0, y0], [x1, y1]]))
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            # Large rectangles are cheaper to answer with a scan than cell by cell.
+            candidates = numpy.arange(self._n)
+        else:
+            ids = []
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    ids.extend(self._cells.get((cx, cy), ()))
+            candidates = numpy.array(ids, dtype=numpy.int64)
+        p = self._points[candidates]
+        with numpy.errstate(invalid='ignore'):
+            inside = (p[:, 0] >= x0) & (p[:, 0] <= x1) & (p[:, 1] >= y0) & (p[:, 1] <= y1)
+        return candidates[inside]
+
+    def nearest_vertex(self, x, y, max_radius):
+        """
+        :return: the id of the nearest vertex within max_radius, or None.
+        """
+        candidates = self.vertices_in_rect(x - max_radius, y - max_radius, x + max_radius, y + max_radius)
+        if len(candidates) == 0:
+            return None
+        distances = numpy.hypot(*(self._points[candidates] - (x, y)).T)
+        best = numpy.argmin(distances)
+        if distances[best] > max_radius or math.isnan(distances[best]):
+            return None
+        return int(candidates[best])
+
+    def point(self, vertex_id):
+        return self._points[vertex_id]
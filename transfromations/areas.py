@@ -1,30 +1,20 @@
 import abc
-from utils.my_qt import *
+import math
 
+from transfromations.geometry import Point, distance
 
-def size(point):
-    return (point.x() ** 2 + point.y() ** 2) ** 0.5
-
-
-def distance(point1, point2):
-    return size(point2 - point1)
+# Enables the runtime validation of the projections.
+DEBUG = False
 
 
 class LegalPath(object):
-    @abc.abstractmethod
-    def get_path(self, rect):
-        return QtGui.QPainterPath()
-
-    @abc.abstractmethod
-    def get_brush(self):
-        return QtGui.QBrush()
-
     @abc.abstractmethod
     def project_point(self, point):
         """
         :param point:
-        :type point:QtCore.QPointF
+        :type point: Point
         :return:
+        :rtype: Point
         """
         return point
 
@@ -32,52 +22,35 @@ class LegalPath(object):
 class CirclePath(LegalPath):
     def __init__(self, center, radius):
         assert radius > 0
-        self._center = QtCore.QPointF(center)
+        self._center = Point.of(center)
         self._radius = radius
 
-    def get_path(self, rect):
-        path = QtGui.QPainterPath()
-        path.addEllipse(self._center.x() - self._radius, self._center.y() - self._radius,
-                        self._center.x() + self._radius * 2, self._center.y() + self._radius * 2)
-        return path
+    def center(self):
+        return self._center
 
-    def get_brush(self):
-        return QtGui.QBrush(QtGui.QColor(0, 0, 0, 0))
+    def radius(self):
+        return self._radius
 
     def project_point(self, point):
         """
 
         :param point:
-        :type point: QtGui.QPointF
+        :type point: Point
         :return:
         """
-        moved = QtCore.QPointF(point) - self._center
-        if size(moved) == 0:
-            on_circle = QtCore.QPointF(0, self._radius)
+        dx = point.x() - self._center.x()
+        dy = point.y() - self._center.y()
+        d = math.hypot(dx, dy)
+        if d == 0:
+            res = Point(self._center.x(), self._center.y() + self._radius)
         else:
-            on_circle = moved / size(moved) * self._radius
-        assert abs(size(on_circle) - self._radius) < 0.0001
-        res = self._center + on_circle
-        assert abs(distance(self._center, res) - self._radius) < 0.0001
+            scale = self._radius / d
+            res = Point(self._center.x() + dx * scale, self._center.y() + dy * scale)
+        if DEBUG:
+            assert abs(distance(self._center, res) - self._radius) < 0.0001
         return res
 
 
-
-
-c = CirclePath(QtCore.QPoint(50, 50), (50 ** 2 * 2) ** 0.5)
-x = c.project_point(QtCore.QPointF(40, 50))
-
-
 class AllLegalPath(LegalPath):
-    def get_path(self, rect):
-        path = QtGui.QPainterPath()
-        path.addRect(rect)
-        return path
-
     def project_point(self, point):
-        return point
-
-    def get_brush(self):
-        return QtGui.QBrush(QtGui.QColor(0, 255, 0, 40))
-
-
+        return Point.of(point)
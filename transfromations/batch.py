@@ -0,0 +1,219 @@
+"""
+Headless batch transformation of point / polygon files.
+
+    python -m transfromations.batch --pairs pairs.csv --model affine input.csv output.csv
+
+The control pairs file holds one correspondence per row: x, y, u, v and an optional weight
+(CSV, `.npy`, or JSON Lines of {"src": [x, y], "dst": [u, v], "weight": w}).
+The input is streamed in chunks, so memory does not grow with its size:
+  * CSV - the first two columns are x, y; other columns are copied through.
+  * `.npy` - a (N, K >= 2) array whose first two columns are x, y; memory mapped, see point_clouds.
+  * JSON Lines - objects whose "points" list of [x, y] is transformed; other keys are copied through.
+This module must not import Qt.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+
+import numpy
+
+from transfromations import solvers, robust
+from transfromations.transformations_builders import LeastSquaresBuilder, RobustBuilder
+
+FITS = {
+    'translation': solvers.fit_translation,
+    'rigid': solvers.fit_rigid,
+    'similarity': solvers.fit_similarity,
+    'affine': solvers.fit_affine,
+    'projective': solvers.fit_projective,
+}
+
+
+def _file_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        return 'npy'
+    elif ext in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    elif ext in ('.csv', '.txt'):
+        return 'csv'
+    raise ValueError('unsupported file type: %s' % path)
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _pair_row(values, where):
+    """
+    :param where: the file and line, for the errors.
+    :return: [x, y, u, v, weight]
+    """
+    if len(values) not in (4, 5):
+        raise ValueError('%s: expected x, y, u, v and an optional weight, got %d values' % (where, len(values)))
+    try:
+        row = [float(value) for value in values]
+    except (TypeError, ValueError):
+        raise ValueError('%s: not a number in %r' % (where, values))
+    return row if len(row) == 5 else row + [1.]
+
+
+def _csv_rows(input_file):
+    """
+    :return: iterator of (line number, row)
+    """
+    reader = csv.reader(input_file)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_pairs(path):
+    """
+    :return: src (2, N), dst (2, N) and weights (N,) arrays
+    :raise ValueError: on a row that is not x, y, u, v[, weight], naming its line.
+    """
+    file_format = _file_format(path)
+    if file_format == 'npy':
+        rows = numpy.load(path)
+        if rows.ndim != 2 or rows.shape[1] not in (4, 5):
+            raise ValueError('%s: expected an (N, 4) or (N, 5) array, got the shape %s' % (path, rows.shape))
+        rows = numpy.asarray(rows, dtype=numpy.float64)
+        weights = rows[:, 4] if rows.shape[1] > 4 else numpy.ones(len(rows))
+        return rows[:, 0:2].T, rows[:, 2:4].T, weights
+    rows = []
+    with open(path) as f:
+        if file_format == 'jsonl':
+            for i, line in enumerate(f, 1):
+                if line.strip():
+                    where = '%s line %d' % (path, i)
+                    pair = json.loads(line)
+                    if len(pair.get('src', ())) != 2 or len(pair.get('dst', ())) != 2:
+                        raise ValueError('%s: "src" and "dst" must both be [x, y]' % where)
+                    rows.append(_pair_row(list(pair['src']) + list(pair['dst']) + [pair.get('weight', 1.)], where))
+        else:
+            for i, row in _csv_rows(f):
+                # Rows not starting with a number, like a header, are skipped.
+                if row and _is_number(row[0]):
+                    rows.append(_pair_row(row, '%s line %d' % (path, i)))
+    rows = numpy.asarray(rows, dtype=numpy.float64).reshape(len(rows), 5)
+    return rows[:, 0:2].T, rows[:, 2:4].T, rows[:, 4]
+
+
+def build_transformation(src, dst, weights, model, robust_method=None, threshold=3., workers=1):
+    """
+    :rtype: ProjectiveTransformation
+    """
+    fit = FITS[model]
+    executor = robust.process_pool(workers) if robust_method is not None and workers > 1 else None
+    try:
+        if robust_method is None:
+            builder = LeastSquaresBuilder(fit)
+        else:
+            builder = RobustBuilder(fit, robust_method, threshold, executor=executor)
+        return builder.add_pairs(src, dst, weights).get_transformation()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _transform_csv(transformation, input_file, output_file, chunk_size):
+    writer = csv.writer(output_file, lineterminator='\n')
+    rows = _csv_rows(input_file)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        points = []
+        for i, row in chunk:
+            if row and _is_number(row[0]):
+                if len(row) < 2 or not _is_number(row[1]):
+                    raise ValueError('line %d: expected x, y in the first two columns, got %r' % (i, row))
+                points.append([float(row[0]), float(row[1])])
+        if points:
+            moved = iter(transformation.transform_points(points))
+        for _, row in chunk:
+            if row and _is_number(row[0]):
+                x, y = next(moved)
+                row = [repr(float(x)), repr(float(y))] + row[2:]
+            writer.writerow(row)
+
+
+def _transform_jsonl(transformation, input_file, output_file, chunk_size):
+    lines = iter(input_file)
+    while True:
+        # Gather whole objects until the chunk holds chunk_size points, then transform them in one call.
+        objects = []
+        n_points = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            objects.append(obj)
+            n_points += len(obj.get('points', []))
+            if n_points >= chunk_size:
+                break
+        if not objects:
+            break
+        if n_points:
+            moved = transformation.transform_points([p for obj in objects for p in obj.get('points', [])])
+        start = 0
+        for obj in objects:
+            if 'points' in obj:
+                end = start + len(obj['points'])
+                obj['points'] = moved[start:end].tolist()
+                start = end
+            output_file.write(json.dumps(obj) + '\n')
+
+
+def transform_file(transformation, input_path, output_path, chunk_size=65536, workers=1):
+    """
+    :param workers: processes the chunks of a .npy input are spread over.
+    """
+    file_format = _file_format(input_path)
+    if _file_format(output_path) != file_format:
+        raise ValueError('the output must have the same format as the input')
+    if file_format == 'npy':
+        executor = robust.process_pool(workers) if workers > 1 else None
+        try:
+            transformation.transform_point_cloud(input_path, output_path, chunk_size, executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return
+    with open(input_path) as input_file:
+        with open(output_path, 'w') as output_file:
+            if file_format == 'csv':
+                _transform_csv(transformation, input_file, output_file, chunk_size)
+            else:
+                _transform_jsonl(transformation, input_file, output_file, chunk_size)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Fit a transformation to control pairs and apply it to a file.')
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--pairs', required=True, help='control pairs file: x, y, u, v[, weight] per row')
+    parser.add_argument('--model', choices=sorted(FITS), default='affine')
+    parser.add_argument('--robust', choices=[robust.RANSAC, robust.LMEDS], default=None)
+    parser.add_argument('--threshold', type=float, default=3., help='inlier distance of the robust fit')
+    parser.add_argument('--workers', type=int, default=1, help='processes for the robust fit and the .npy chunks')
+    parser.add_argument('--chunk-size', type=int, default=65536, help='points transformed per call')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    src, dst, weights = read_pairs(args.pairs)
+    transformation = build_transformation(src, dst, weights, args.model, args.robust, args.threshold, args.workers)
+    transform_file(transformation, args.input, args.output, args.chunk_size, args.workers)
+
+
+if __name__ == '__main__':
+    main()
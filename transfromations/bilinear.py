@@ -0,0 +1,102 @@
+import numpy
+
+from transfromations import solvers
+from transfromations.geometry import Point
+from transfromations.transformations import Transformation
+
+
+def fit_bilinear(src, dst, weights=None):
+    """
+    Fits u = a0 + a1 * x + a2 * y + a3 * x * y and the same form for v. Four correspondences give an
+    exact 4x4 solve; leading dimensions are a batch, as in the solvers module.
+    :param src: (..., 2, N) array
+    :param dst: (..., 2, N) array
+    :return: (..., 2, 4) array of the coefficients of u and v.
+    """
+    src, dst, weights = solvers._as_pairs(src, dst, weights)
+    x, y = src[..., 0, :], src[..., 1, :]
+    a = numpy.stack([numpy.ones_like(x), x, y, x * y], axis=-1)
+    b = numpy.swapaxes(dst, -1, -2)
+    if src.shape[-1] != 4:
+        a_t = numpy.swapaxes(a * weights[..., None], -1, -2)
+        a, b = numpy.matmul(a_t, a), numpy.matmul(a_t, b)
+    return numpy.swapaxes(numpy.linalg.solve(a, b), -1, -2)
+
+
+def _evaluate(coefs, x, y):
+    return coefs[:, 0] + coefs[:, 1] * x[:, None] + coefs[:, 2] * y[:, None] + coefs[:, 3] * (x * y)[:, None]
+
+
+class BilinearTransformation(Transformation):
+    def __init__(self, coefs, src_quad=None):
+        """
+        :param coefs: (2, 4) array, see fit_bilinear.
+        :param src_quad: optional (2, 4) control points, used for the initial guess of the inverse.
+        """
+        self._coefs = numpy.asarray(coefs, dtype=numpy.float64)
+        self._src_quad = src_quad
+        self._inverse = None
+
+    @staticmethod
+    def from_pairs(src, dst):
+        return BilinearTransformation(fit_bilinear(src, dst), numpy.asarray(src, dtype=numpy.float64))
+
+    def transform_point(self, point):
+        u, v = self.transform_points([[point.x(), point.y()]])[0]
+        return Point(u, v)
+
+    def transform_points(self, points):
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        return _evaluate(self._coefs, points[:, 0], points[:, 1])
+
+    def inverse(self):
+        if self._inverse is None:
+            self._inverse = BilinearInverseTransformation(self)
+        return self._inverse
+
+
+class BilinearInverseTransformation(Transformation):
+    """
+    Inverts a bilinear map with a vectorized Newton solve, starting from the affine approximation of
+    the inverse.
+    """
+    MAX_ITERATIONS = 20
+    TOLERANCE = 1e-9
+
+    def __init__(self, forward):
+        """
+        :type forward: BilinearTransformation
+        """
+        self._forward = forward
+        c = forward._coefs
+        # Per-quad setup, shared by all the points: the Jacobian terms and the initial guess.
+        self._a1, self._a2, self._a3 = c[0, 1], c[0, 2], c[0, 3]
+        self._b1, self._b2, self._b3 = c[1, 1], c[1, 2], c[1, 3]
+        src = forward._src_quad
+        if src is None:
+            src = numpy.array([[0., 1., 1., 0.], [0., 0., 1., 1.]])
+        self._guess = solvers.fit_affine(forward.transform_points(src.T).T, src)
+
+    def transform_point(self, point):
+        x, y = self.transform_points([[point.x(), point.y()]])[0]
+        return Point(x, y)
+
+    def transform_points(self, points):
+        targets = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        xy = solvers.apply_matrix(self._guess, targets)
+        for _ in range(self.MAX_ITERATIONS):
+            x, y = xy[:, 0], xy[:, 1]
+            f = self._forward.transform_points(xy) - targets
+            j00 = self._a1 + self._a3 * y
+            j01 = self._a2 + self._a3 * x
+            j10 = self._b1 + self._b3 * y
+            j11 = self._b2 + self._b3 * x
+            det = j00 * j11 - j01 * j10
+            xy[:, 0] -= (j11 * f[:, 0] - j01 * f[:, 1]) / det
+            xy[:, 1] -= (j00 * f[:, 1] - j10 * f[:, 0]) / det
+            if not len(f) or numpy.abs(f).max() < self.TOLERANCE:
+                break
+        return xy
+
+    def inverse(self):
+        return self._forward
@@ -0,0 +1,69 @@
+import math
+
+
+class Point(object):
+    """
+    Lightweight 2D point with the accessors of QtCore.QPointF, so the geometry code accepts either.
+    """
+    __slots__ = ('_x', '_y')
+
+    def __init__(self, x=0., y=0.):
+        self._x = float(x)
+        self._y = float(y)
+
+    @staticmethod
+    def of(point):
+        """
+        :param point: anything with x() and y(), e.g. a QtCore.QPointF.
+        :rtype: Point
+        """
+        return Point(point.x(), point.y())
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def __add__(self, other):
+        return Point(self._x + other.x(), self._y + other.y())
+
+    def __sub__(self, other):
+        return Point(self._x - other.x(), self._y - other.y())
+
+    def __mul__(self, factor):
+        return Point(self._x * factor, self._y * factor)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, factor):
+        return Point(self._x / factor, self._y / factor)
+
+    __div__ = __truediv__
+
+    def __neg__(self):
+        return Point(-self._x, -self._y)
+
+    def __eq__(self, other):
+        try:
+            return self._x == other.x() and self._y == other.y()
+        except AttributeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    def __hash__(self):
+        return hash((self._x, self._y))
+
+    def __repr__(self):
+        return 'Point(%r, %r)' % (self._x, self._y)
+
+
+def size(point):
+    return math.hypot(point.x(), point.y())
+
+
+def distance(point1, point2):
+    return math.hypot(point2.x() - point1.x(), point2.y() - point1.y())
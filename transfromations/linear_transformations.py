@@ -1,18 +1,48 @@
 import math
 
-from utils.my_qt import *
 import numpy
 
+from transfromations.geometry import Point
 from transfromations.transformations import Transformation
+from transfromations import solvers, point_clouds
 
 
 class ProjectiveTransformation(Transformation):
     def __init__(self, matrix):
         self._matrix = matrix
+        self._inverse = None
 
     def transform_point(self, point):
         v = (self._matrix * self.to_matrix(point))
-        return QtCore.QPointF(v[0, 0] / v[2, 0], v[1, 0] / v[2, 0])
+        return Point(v[0, 0] / v[2, 0], v[1, 0] / v[2, 0])
+
+    def transform_points(self, points):
+        """
+        :param points:
+        :type points: numpy.ndarray
+        :return: (N, 2) float64 array
+        """
+        return solvers.apply_matrix(self._matrix, points)
+
+    def transform_point_cloud(self, input_path, output_path, chunk_size=point_clouds.DEFAULT_CHUNK_SIZE,
+                              executor=None, raw_dtype=numpy.float64, raw_columns=2):
+        """
+        Transforms a point file larger than memory chunk by chunk, see transfromations.point_clouds.
+        :param input_path: a (N, K >= 2) .npy file, or a raw file of raw_dtype values with raw_columns per point.
+        :param output_path: written in the format and dtype of the input.
+        :param executor: optional `concurrent.futures` executor, e.g. robust.process_pool().
+        """
+        if input_path.lower().endswith('.npy'):
+            source = point_clouds.npy_layout(input_path)
+        else:
+            source = point_clouds.raw_layout(input_path, raw_dtype, raw_columns)
+        point_clouds.transform_point_cloud(self._matrix, source, output_path, chunk_size, executor)
+
+    def matrix(self):
+        """
+        :rtype: numpy.matrix
+        """
+        return self._matrix
 
     @staticmethod
     def to_matrix(point):
@@ -24,6 +54,13 @@ class ProjectiveTransformation(Transformation):
         """
         return numpy.matrix([[point.x()], [point.y()], [1.0]])
 
+    def inverse(self):
+        # Computed once, so reverse queries only cost the matmul.
+        if self._inverse is None:
+            self._inverse = ProjectiveTransformation(numpy.linalg.inv(self._matrix))
+            self._inverse._inverse = self
+        return self._inverse
+
     def compose(self, transformation):
         if isinstance(transformation, ProjectiveTransformation):
             # NOTE: could do here more gentle composing, but rather do it in the
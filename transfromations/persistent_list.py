@@ -0,0 +1,79 @@
+class _Node(object):
+    __slots__ = ('value', 'previous', 'length')
+
+    def __init__(self, value, previous):
+        self.value = value
+        self.previous = previous
+        self.length = 1 if previous is None else previous.length + 1
+
+
+class PersistentList(object):
+    """
+    Immutable list sharing its structure with the lists it was derived from: each node points to the one
+    appended before it. Appending is O(1) and copies nothing. Getting, replacing or removing item i walks back
+    from the last item, O(len - i), and the last two copy the items appended after it.
+    """
+    __slots__ = ('_last',)
+
+    def __init__(self, values=(), _last=None):
+        self._last = _last
+        for value in values:
+            self._last = _Node(value, self._last)
+
+    def __len__(self):
+        return 0 if self._last is None else self._last.length
+
+    def append(self, value):
+        """
+        :rtype: PersistentList
+        """
+        return PersistentList(_last=_Node(value, self._last))
+
+    def reversed_items(self):
+        """
+        Yields (index, value) from the last item back, without walking the list first.
+        """
+        node = self._last
+        while node is not None:
+            yield node.length - 1, node.value
+            node = node.previous
+
+    def __iter__(self):
+        return reversed([value for _, value in self.reversed_items()])
+
+    def _split(self, i):
+        """
+        :return: the node of item i and the values after it.
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        newer = []
+        node = self._last
+        while node.length - 1 > i:
+            newer.append(node.value)
+            node = node.previous
+        return node, newer
+
+    def __getitem__(self, i):
+        return self._split(i)[0].value
+
+    def _rebuilt(self, last, newer):
+        for value in reversed(newer):
+            last = _Node(value, last)
+        return PersistentList(_last=last)
+
+    def replace(self, i, value):
+        """
+        :rtype: PersistentList
+        """
+        node, newer = self._split(i)
+        return self._rebuilt(_Node(value, node.previous), newer)
+
+    def remove(self, i):
+        """
+        :rtype: PersistentList
+        """
+        node, newer = self._split(i)
+        return self._rebuilt(node.previous, newer)
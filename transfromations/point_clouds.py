@@ -0,0 +1,116 @@
+"""
+Transformation of point sets larger than memory.
+
+The input (`.npy` or a raw binary file of floats) and the output are memory mapped and split into
+chunks. Each worker maps both files itself and writes its chunk straight into the output, so only
+the chunk bounds are pickled, never the points.
+"""
+import os
+
+import numpy
+
+from transfromations import solvers
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+class FileLayout(object):
+    """
+    Where and how a (N, K) array is stored in a file.
+    """
+
+    def __init__(self, path, dtype, shape, offset):
+        self.path = path
+        self.dtype = numpy.dtype(dtype)
+        self.shape = tuple(shape)
+        self.offset = offset
+
+    def open(self, mode):
+        return numpy.memmap(self.path, dtype=self.dtype, mode=mode, offset=self.offset, shape=self.shape)
+
+
+def npy_layout(path):
+    """
+    :rtype: FileLayout
+    """
+    with open(path, 'rb') as f:
+        version = numpy.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+        assert not fortran_order, 'only C ordered arrays are supported'
+        return FileLayout(path, dtype, shape, f.tell())
+
+
+def raw_layout(path, dtype=numpy.float64, n_columns=2):
+    """
+    :param path: a headerless file of row major (N, n_columns) values.
+    :rtype: FileLayout
+    """
+    dtype = numpy.dtype(dtype)
+    n_rows = os.path.getsize(path) // (dtype.itemsize * n_columns)
+    return FileLayout(path, dtype, (n_rows, n_columns), 0)
+
+
+def create_output(path, like):
+    """
+    Creates an output file with the shape of `like` - a .npy if path ends with .npy, raw otherwise. The dtype is
+    floating even for integer inputs, which the transformed points would be truncated to.
+    An empty output cannot be memory mapped, its layout must not be opened.
+    :type like: FileLayout
+    :rtype: FileLayout
+    """
+    dtype = numpy.promote_types(like.dtype, numpy.float64)
+    empty = int(numpy.prod(like.shape)) == 0
+    if path.lower().endswith('.npy'):
+        if empty:
+            numpy.save(path, numpy.empty(like.shape, dtype=dtype))
+        else:
+            out = numpy.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=like.shape)
+            del out
+        return npy_layout(path)
+    with open(path, 'wb') as f:
+        f.truncate(dtype.itemsize * int(numpy.prod(like.shape)))
+    return FileLayout(path, dtype, like.shape, 0)
+
+
+def transform_chunk(matrix, source, target, start, stop):
+    """
+    Runs in the workers.
+    :type source: FileLayout
+    :type target: FileLayout
+    :return: the number of transformed points.
+    """
+    src = source.open('r')
+    dst = target.open('r+')
+    chunk = src[start:stop]
+    dst[start:stop, :2] = solvers.apply_matrix(matrix, chunk[:, :2])
+    if chunk.shape[1] > 2:
+        dst[start:stop, 2:] = chunk[:, 2:]
+    dst.flush()
+    del src, dst
+    return stop - start
+
+
+def transform_point_cloud(matrix, source, output_path, chunk_size=DEFAULT_CHUNK_SIZE, executor=None):
+    """
+    :param matrix: 3x3 array
+    :param source: the input layout, see npy_layout and raw_layout.
+    :type source: FileLayout
+    :param executor: optional `concurrent.futures` executor the chunks are spread over.
+    :return: the output layout.
+    :rtype: FileLayout
+    """
+    matrix = numpy.asarray(matrix, dtype=numpy.float64)
+    target = create_output(output_path, source)
+    n = source.shape[0]
+    bounds = [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+    if executor is None:
+        for start, stop in bounds:
+            transform_chunk(matrix, source, target, start, stop)
+    else:
+        futures = [executor.submit(transform_chunk, matrix, source, target, start, stop) for start, stop in bounds]
+        for f in futures:
+            f.result()
+    return target
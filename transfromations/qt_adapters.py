@@ -0,0 +1,67 @@
+"""
+Conversions between the Qt-free geometry core and PyQt4.
+"""
+import numpy
+
+from utils.my_qt import *
+from transfromations.areas import CirclePath
+from transfromations.linear_transformations import ProjectiveTransformation
+
+
+def to_qpointf(point):
+    """
+    :param point: anything with x() and y()
+    :rtype: QtCore.QPointF
+    """
+    return QtCore.QPointF(point.x(), point.y())
+
+
+def to_qtransform(transformation):
+    """
+    :param transformation:
+    :type transformation: ProjectiveTransformation
+    :rtype: QtGui.QTransform
+    """
+    m = numpy.asarray(transformation.matrix(), dtype=numpy.float64)
+    return QtGui.QTransform(m[0, 0], m[1, 0], m[2, 0],
+                            m[0, 1], m[1, 1], m[2, 1],
+                            m[0, 2], m[1, 2], m[2, 2])
+
+
+def from_qtransform(transform):
+    """
+    :param transform:
+    :type transform: QtGui.QTransform
+    :rtype: ProjectiveTransformation
+    """
+    t = transform
+    return ProjectiveTransformation(numpy.matrix([[t.m11(), t.m21(), t.m31()],
+                                                  [t.m12(), t.m22(), t.m32()],
+                                                  [t.m13(), t.m23(), t.m33()]]))
+
+
+def legal_path_painter_path(legal_path, rect):
+    """
+    :param legal_path:
+    :type legal_path: LegalPath
+    :param rect: the visible area
+    :type rect: QtCore.QRectF
+    :rtype: QtGui.QPainterPath
+    """
+    path = QtGui.QPainterPath()
+    if isinstance(legal_path, CirclePath):
+        path.addEllipse(to_qpointf(legal_path.center()), legal_path.radius(), legal_path.radius())
+    else:
+        path.addRect(rect)
+    return path
+
+
+def legal_path_brush(legal_path):
+    """
+    :param legal_path:
+    :type legal_path: LegalPath
+    :rtype: QtGui.QBrush
+    """
+    if isinstance(legal_path, CirclePath):
+        return QtGui.QBrush(QtGui.QColor(0, 0, 0, 0))
+    return QtGui.QBrush(QtGui.QColor(0, 255, 0, 40))
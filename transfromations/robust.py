@@ -0,0 +1,179 @@
+"""
+Robust (RANSAC / LMedS) fitting of linear transformations from noisy correspondences.
+
+Hypotheses are fitted and scored in vectorized batches; batches may be spread over a
+`concurrent.futures` executor (e.g. `process_pool()`) so large fits scale with the cores.
+robust_fit_async returns at once with a future of the result, for callers that must not wait, like the GUI.
+"""
+import threading
+
+import numpy
+
+from transfromations import solvers
+
+RANSAC = 'ransac'
+LMEDS = 'lmeds'
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def process_pool(max_workers=None):
+    """
+    :rtype: concurrent.futures.ProcessPoolExecutor
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def background_executor():
+    """
+    The thread robust_fit_async runs on when given no executor, shared and created on first use.
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    global _background
+    with _background_lock:
+        if _background is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _background = ThreadPoolExecutor(max_workers=1)
+    return _background
+
+
+def residuals(matrices, src, dst):
+    """
+    :param matrices: (H, 3, 3) array
+    :param src: (2, N) array
+    :param dst: (2, N) array
+    :return: (H, N) array of the distances between each transformed src and its dst.
+    """
+    v = numpy.matmul(matrices[:, :, :2], src) + matrices[:, :, 2:]
+    moved = v[:, :2] / v[:, 2:]
+    return numpy.sqrt(((moved - dst) ** 2).sum(axis=1))
+
+
+def _score_batch(fit, src, dst, samples, threshold, method):
+    """
+    Fits one hypothesis per row of `samples` and returns the best one.
+    :return: (score, matrix) - lower score is better.
+    """
+    with numpy.errstate(all='ignore'):
+        try:
+            matrices = fit(src[:, samples].transpose(1, 0, 2), dst[:, samples].transpose(1, 0, 2))
+        except numpy.linalg.LinAlgError:
+            # A degenerate sample makes the whole stacked solve fail, fall back to one by one.
+            matrices = numpy.array([_fit_or_nan(fit, src[:, s], dst[:, s]) for s in samples])
+        errors = residuals(matrices, src, dst)
+    errors[~numpy.isfinite(errors)] = numpy.inf
+    if method == RANSAC:
+        scores = -(errors < threshold).sum(axis=1)
+    else:
+        scores = numpy.median(errors, axis=1)
+    best = numpy.argmin(scores)
+    return scores[best], matrices[best]
+
+
+def _fit_or_nan(fit, src, dst):
+    try:
+        return fit(src, dst)
+    except numpy.linalg.LinAlgError:
+        return numpy.full((3, 3), numpy.nan)
+
+
+def _hypotheses(fit, n, n_hypotheses, batch_size, seed):
+    """
+    :return: list of (B, k) arrays of the indices of the pairs each hypothesis is fitted to.
+    """
+    k = solvers.MIN_PAIRS[fit]
+    assert n >= k
+    random = numpy.random.RandomState(seed)
+    # Drawn k at a time, the samples with a repeated pair drawn again: O(k) per hypothesis whatever the number of
+    # pairs, so robust_fit_async returns at once.
+    samples = random.randint(0, n, (n_hypotheses, k))
+    while True:
+        ordered = numpy.sort(samples, axis=1)
+        repeated = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+        if not repeated.any():
+            break
+        samples[repeated] = random.randint(0, n, (repeated.sum(), k))
+    return [samples[i:i + batch_size] for i in range(0, n_hypotheses, batch_size)]
+
+
+def _refit(fit, src, dst, results, threshold, weights):
+    """
+    Refits the inliers of the best hypothesis of all the batches, the hypothesis itself is kept when they are
+    degenerate.
+    :param results: the (score, matrix) of every batch.
+    :return: see robust_fit
+    """
+    score, best = min(results, key=lambda r: r[0])
+    inliers = residuals(best[None], src, dst)[0] < threshold
+    if inliers.sum() >= solvers.MIN_PAIRS[fit]:
+        try:
+            refit = fit(src[:, inliers], dst[:, inliers], None if weights is None else numpy.asarray(weights)[inliers])
+        except numpy.linalg.LinAlgError:
+            # Degenerate inliers, e.g. all on a line: keep the hypothesis they agree with.
+            return best, inliers
+        if numpy.all(numpy.isfinite(refit)):
+            best = refit
+            inliers = residuals(best[None], src, dst)[0] < threshold
+    return best, inliers
+
+
+def robust_fit(fit, src, dst, method=RANSAC, threshold=3., n_hypotheses=500, batch_size=100, executor=None,
+               seed=None, weights=None):
+    """
+    :param fit: one of the `solvers.fit_*` functions.
+    :param src: (2, N) array
+    :param dst: (2, N) array
+    :param method: RANSAC or LMEDS
+    :param threshold: inlier distance. For LMEDS it is only used to select the inliers of the final refit.
+    :param executor: optional `concurrent.futures.Executor` the hypothesis batches are submitted to.
+    :param weights: optional (N,) array used by the final least squares refit of the inliers.
+    :return: the fitted 3x3 matrix and the boolean inliers mask.
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    src = numpy.asarray(src, dtype=numpy.float64)
+    dst = numpy.asarray(dst, dtype=numpy.float64)
+    batches = _hypotheses(fit, src.shape[1], n_hypotheses, batch_size, seed)
+    if executor is None:
+        results = [_score_batch(fit, src, dst, b, threshold, method) for b in batches]
+    else:
+        futures = [executor.submit(_score_batch, fit, src, dst, b, threshold, method) for b in batches]
+        results = [f.result() for f in futures]
+    return _refit(fit, src, dst, results, threshold, weights)
+
+
+def robust_fit_async(fit, src, dst, method=RANSAC, threshold=3., n_hypotheses=500, batch_size=100, executor=None,
+                     seed=None, weights=None):
+    """
+    robust_fit without waiting for it: the batches are submitted and the refit runs once the last one is done,
+    on the thread that finished it.
+    :param executor: the batches are submitted to it, to background_executor() if None.
+    :return: future of what robust_fit returns.
+    :rtype: concurrent.futures.Future
+    """
+    from concurrent.futures import Future
+    src = numpy.asarray(src, dtype=numpy.float64)
+    dst = numpy.asarray(dst, dtype=numpy.float64)
+    batches = _hypotheses(fit, src.shape[1], n_hypotheses, batch_size, seed)
+    if executor is None:
+        executor = background_executor()
+    res = Future()
+    futures = [executor.submit(_score_batch, fit, src, dst, b, threshold, method) for b in batches]
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def batch_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            res.set_result(_refit(fit, src, dst, [f.result() for f in futures], threshold, weights))
+        except Exception as e:
+            res.set_exception(e)
+
+    for f in futures:
+        f.add_done_callback(batch_done)
+    return res
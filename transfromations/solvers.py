@@ -0,0 +1,337 @@
+"""
+Closed-form and small-system fitting of linear transformations from point correspondences.
+
+Every solver takes `src` and `dst` arrays of shape (2, N) - one column per correspondence -
+and returns the fitted 3x3 matrix as a numpy array. Any leading dimensions are treated as a
+batch, so (B, 2, N) inputs are fitted in one vectorized call and give (B, 3, 3) results.
+More than the minimal number of correspondences is fitted in the (optionally weighted) least
+squares sense; `weights` has shape (..., N).
+"""
+import numpy
+
+
+def _as_pairs(src, dst, weights=None):
+    src = numpy.asarray(src, dtype=numpy.float64)
+    dst = numpy.asarray(dst, dtype=numpy.float64)
+    assert src.shape == dst.shape and src.ndim >= 2 and src.shape[-2] == 2
+    if weights is None:
+        weights = numpy.ones(src.shape[:-2] + src.shape[-1:])
+    else:
+        weights = numpy.broadcast_to(numpy.asarray(weights, dtype=numpy.float64), src.shape[:-2] + src.shape[-1:])
+    return src, dst, weights
+
+
+def _empty_matrices(batch_shape):
+    res = numpy.zeros(batch_shape + (3, 3))
+    res[..., 2, 2] = 1.
+    return res
+
+
+def _weighted_mean(values, weights):
+    return (values * weights[..., None, :]).sum(axis=-1) / weights.sum(axis=-1)[..., None]
+
+
+def apply_matrix(matrix, points):
+    """
+    :param matrix: 3x3 array
+    :param points: (N, 2) array
+    :return: (N, 2) float64 array of the transformed points.
+    """
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    m = numpy.asarray(matrix, dtype=numpy.float64)
+    v = points.dot(m[:, :2].T) + m[:, 2]
+    return v[:, :2] / v[:, 2:]
+
+
+def fit_translation(src, dst, weights=None):
+    src, dst, weights = _as_pairs(src, dst, weights)
+    shift = _weighted_mean(dst - src, weights)
+    res = _empty_matrices(src.shape[:-2])
+    res[..., 0, 0] = res[..., 1, 1] = 1.
+    res[..., :2, 2] = shift
+    return res
+
+
+def _centered(src, dst, weights):
+    src_mean = _weighted_mean(src, weights)
+    dst_mean = _weighted_mean(dst, weights)
+    return src_mean, dst_mean, src - src_mean[..., None], dst - dst_mean[..., None]
+
+
+def _rotation_terms(s, d, weights):
+    dot = ((s * d).sum(axis=-2) * weights).sum(axis=-1)
+    cross = ((s[..., 0, :] * d[..., 1, :] - s[..., 1, :] * d[..., 0, :]) * weights).sum(axis=-1)
+    return dot, cross
+
+
+def _similar_matrices(a, b, src_mean, dst_mean):
+    res = _empty_matrices(a.shape)
+    res[..., 0, 0] = res[..., 1, 1] = a
+    res[..., 0, 1] = -b
+    res[..., 1, 0] = b
+    res[..., 0, 2] = dst_mean[..., 0] - a * src_mean[..., 0] + b * src_mean[..., 1]
+    res[..., 1, 2] = dst_mean[..., 1] - b * src_mean[..., 0] - a * src_mean[..., 1]
+    return res
+
+
+def fit_rigid(src, dst, weights=None):
+    """
+    Rotation + translation (2D Kabsch).
+    """
+    src, dst, weights = _as_pairs(src, dst, weights)
+    src_mean, dst_mean, s, d = _centered(src, dst, weights)
+    dot, cross = _rotation_terms(s, d, weights)
+    theta = numpy.arctan2(cross, dot)
+    return _similar_matrices(numpy.cos(theta), numpy.sin(theta), src_mean, dst_mean)
+
+
+def fit_similarity(src, dst, weights=None):
+    """
+    Rotation + uniform scale + translation.
+    """
+    src, dst, weights = _as_pairs(src, dst, weights)
+    src_mean, dst_mean, s, d = _centered(src, dst, weights)
+    dot, cross = _rotation_terms(s, d, weights)
+    norm = ((s ** 2).sum(axis=-2) * weights).sum(axis=-1)
+    return _similar_matrices(dot / norm, cross / norm, src_mean, dst_mean)
+
+
+def fit_affine(src, dst, weights=None):
+    src, dst, weights = _as_pairs(src, dst, weights)
+    n = src.shape[-1]
+    a = numpy.ones(src.shape[:-2] + (n, 3))
+    a[..., :2] = numpy.swapaxes(src, -1, -2)
+    b = numpy.swapaxes(dst, -1, -2)
+    if n == 3:
+        rows = numpy.linalg.solve(a, b)
+    else:
+        a_t = numpy.swapaxes(a * weights[..., None], -1, -2)
+        rows = numpy.linalg.solve(numpy.matmul(a_t, a), numpy.matmul(a_t, b))
+    res = _empty_matrices(src.shape[:-2])
+    res[..., :2, :] = numpy.swapaxes(rows, -1, -2)
+    return res
+
+
+def _normalizing_matrices(points, weights):
+    """
+    Hartley normalization: the similarity moving the weighted centroid of the points to the origin and
+    their root mean square distance from it to sqrt(2). Both only depend on the first and second moments of the
+    points, so NormalEquations can keep them up to date.
+    :param points: (..., 2, N) array
+    :return: (..., 3, 3) array
+    """
+    mean = _weighted_mean(points, weights)
+    squared_distances = ((points - mean[..., None]) ** 2).sum(axis=-2)
+    scale = numpy.sqrt(2. * weights.sum(axis=-1) / (squared_distances * weights).sum(axis=-1))
+    res = _empty_matrices(scale.shape)
+    res[..., 0, 0] = res[..., 1, 1] = scale
+    res[..., :2, 2] = -scale[..., None] * mean
+    return res
+
+
+def _apply_normalization(matrices, points):
+    return numpy.matmul(matrices[..., :2, :2], points) + matrices[..., :2, 2:]
+
+
+def fit_projective(src, dst, weights=None):
+    """
+    Normalized direct linear transform: both point sets are normalized (see _normalizing_matrices) and the
+    homography is the singular vector of the smallest singular value. Four correspondences determine it exactly.
+    The result is scaled so its bottom-right entry is 1.
+    """
+    src, dst, weights = _as_pairs(src, dst, weights)
+    n = src.shape[-1]
+    src_norm = _normalizing_matrices(src, weights)
+    dst_norm = _normalizing_matrices(dst, weights)
+    normalized_src = _apply_normalization(src_norm, src)
+    x, y = normalized_src[..., 0, :], normalized_src[..., 1, :]
+    normalized_dst = _apply_normalization(dst_norm, dst)
+    u, v = normalized_dst[..., 0, :], normalized_dst[..., 1, :]
+    a = numpy.zeros(src.shape[:-2] + (2 * n, 9))
+    a[..., :n, 0] = x
+    a[..., :n, 1] = y
+    a[..., :n, 2] = 1.
+    a[..., :n, 6] = -x * u
+    a[..., :n, 7] = -y * u
+    a[..., :n, 8] = -u
+    a[..., n:, 3] = x
+    a[..., n:, 4] = y
+    a[..., n:, 5] = 1.
+    a[..., n:, 6] = -x * v
+    a[..., n:, 7] = -y * v
+    a[..., n:, 8] = -v
+    a *= numpy.sqrt(numpy.concatenate([weights, weights], axis=-1))[..., None]
+    vt = numpy.linalg.svd(a, full_matrices=2 * n < 9)[2]
+    h = vt[..., -1, :].reshape(src.shape[:-2] + (3, 3))
+    h = numpy.matmul(numpy.linalg.inv(dst_norm), numpy.matmul(h, src_norm))
+    return h / h[..., 2:, 2:]
+
+
+MIN_PAIRS = {
+    fit_translation: 1,
+    fit_rigid: 2,
+    fit_similarity: 2,
+    fit_affine: 3,
+    fit_projective: 4,
+}
+
+
+def _design_rows(fit, src, dst):
+    """
+    Rows of the linear system a * h = b whose unknowns are the free parameters of the matrix, see _from_parameters.
+    :param src: (2, N) array
+    :param dst: (2, N) array
+    :return: a (2N, K) and b (2N,) arrays
+    """
+    x, y = src
+    u, v = dst
+    n = len(x)
+    zeros, ones = numpy.zeros(n), numpy.ones(n)
+    if fit is fit_translation:
+        a = numpy.vstack([numpy.column_stack([ones, zeros]), numpy.column_stack([zeros, ones])])
+        return a, numpy.concatenate([u - x, v - y])
+    if fit is fit_similarity:
+        a = numpy.vstack([numpy.column_stack([x, -y, ones, zeros]), numpy.column_stack([y, x, zeros, ones])])
+    elif fit is fit_affine:
+        a = numpy.vstack([numpy.column_stack([x, y, ones, zeros, zeros, zeros]),
+                          numpy.column_stack([zeros, zeros, zeros, x, y, ones])])
+    else:
+        raise ValueError('normal equations are not kept for %s' % fit.__name__)
+    return a, numpy.concatenate([u, v])
+
+
+def _from_parameters(fit, h):
+    if fit is fit_translation:
+        return numpy.array([[1., 0, h[0]], [0, 1., h[1]], [0, 0, 1.]])
+    if fit is fit_similarity:
+        return numpy.array([[h[0], -h[1], h[2]], [h[1], h[0], h[3]], [0, 0, 1.]])
+    return numpy.vstack([h.reshape(2, 3), [0, 0, 1.]])
+
+
+# Number of unknowns of the fits whose least squares system can be accumulated in NormalEquations.
+NORMAL_EQUATIONS_SIZES = {
+    fit_translation: 2,
+    fit_similarity: 4,
+    fit_affine: 6,
+    fit_projective: 8,
+}
+
+
+def _homogeneous(points):
+    return numpy.vstack([points, numpy.ones(points.shape[1])])
+
+
+def _normalization_from_moments(moments):
+    """
+    The matrix of _normalizing_matrices, from the sums of w * p * p^T of the homogeneous points p.
+    """
+    total = moments[2, 2]
+    mean = moments[:2, 2] / total
+    squared_distance = (moments[0, 0] + moments[1, 1]) / total - numpy.dot(mean, mean)
+    scale = numpy.sqrt(2. / squared_distance)
+    res = numpy.eye(3)
+    res[0, 0] = res[1, 1] = scale
+    res[:2, 2] = -scale * mean
+    return res
+
+
+# The rows of the DLT of a pair p -> q are kron(ROW_SELECTORS[i] * q, p), see _dlt_from_moments.
+ROW_SELECTORS = numpy.array([[[0., 0., 1.], [0., 0., 0.], [-1., 0., 0.]],
+                             [[0., 0., 0.], [0., 0., 1.], [0., -1., 0.]]])
+
+
+def _dlt_from_moments(moments, src_moments, dst_moments):
+    """
+    The normalized DLT of fit_projective, from sums over the pairs instead of the pairs themselves.
+    With z = kron(q, p) and the normalizations S of the sources and D of the destinations, the DLT rows of a pair
+    are kron(R_i * D, S) * z, so the DLT matrix squared is the sum over i of kron(R_i * D, S) * M * kron(R_i * D, S)^T,
+    M being the sum of w * z * z^T.
+    :param moments: (9, 9) array, the sum of w * z * z^T.
+    :param src_moments: (3, 3) array, the sum of w * p * p^T of the sources.
+    :param dst_moments: (3, 3) array, the same for the destinations.
+    :return: 3x3 array
+    """
+    src_norm = _normalization_from_moments(src_moments)
+    dst_norm = _normalization_from_moments(dst_moments)
+    scatter = numpy.zeros((9, 9))
+    for selector in ROW_SELECTORS:
+        g = numpy.kron(numpy.dot(selector, dst_norm), src_norm)
+        scatter += numpy.dot(numpy.dot(g, moments), g.T)
+    h = numpy.linalg.eigh(scatter)[1][:, 0].reshape(3, 3)
+    h = numpy.dot(numpy.linalg.inv(dst_norm), numpy.dot(h, src_norm))
+    return h / h[2, 2]
+
+
+class NormalEquations(object):
+    """
+    Accumulated sums of a linear least squares system, see NORMAL_EQUATIONS_SIZES: a^T * W * a and a^T * W * b,
+    or for fit_projective the moments the normalized DLT is built from (see _dlt_from_moments), so it gives what
+    fit_projective does.
+    Adding pairs costs O(K^2) each regardless of how many pairs were added before, and solving
+    with a few extra pairs on top (e.g. the pair being dragged) does not touch the accumulated state.
+    """
+
+    def __init__(self, fit):
+        self._fit = fit
+        if fit is fit_projective:
+            self._sums = [numpy.zeros((9, 9)), numpy.zeros((3, 3)), numpy.zeros((3, 3))]
+        else:
+            k = NORMAL_EQUATIONS_SIZES[fit]
+            self._sums = [numpy.zeros((k, k)), numpy.zeros(k)]
+        # The moments are taken about the first pairs added, so far away scenes do not lose their precision.
+        self._origin = None
+
+    def copy(self):
+        res = NormalEquations(self._fit)
+        res._sums = [a.copy() for a in self._sums]
+        res._origin = self._origin
+        return res
+
+    def add(self, src, dst, weights=None):
+        """
+        :param src: (2, N) array
+        :param dst: (2, N) array
+        :param weights: (N,) array. Negative weights remove previously added pairs.
+        """
+        src = numpy.asarray(src, dtype=numpy.float64).reshape(2, -1)
+        dst = numpy.asarray(dst, dtype=numpy.float64).reshape(2, -1)
+        if self._origin is None and self._fit is fit_projective and src.shape[1]:
+            self._origin = src[:, 0].copy(), dst[:, 0].copy()
+        for total, term in zip(self._sums, self._terms(src, dst, weights)):
+            total += term
+
+    def _terms(self, src, dst, weights):
+        if self._fit is fit_projective:
+            p = _homogeneous(src - self._origin[0][:, None])
+            q = _homogeneous(dst - self._origin[1][:, None])
+            z = (q[:, None, :] * p[None, :, :]).reshape(9, -1)
+            w = numpy.ones(src.shape[1]) if weights is None else weights
+            return numpy.dot(z * w, z.T), numpy.dot(p * w, p.T), numpy.dot(q * w, q.T)
+        a, b = _design_rows(self._fit, src, dst)
+        if weights is not None:
+            w = numpy.concatenate([weights, weights])
+            return numpy.dot(a.T * w, a), numpy.dot(a.T * w, b)
+        return numpy.dot(a.T, a), numpy.dot(a.T, b)
+
+    def solve(self, extra_src=None, extra_dst=None):
+        """
+        :param extra_src: optional (2, M) array of pairs fitted together with the accumulated ones.
+        :param extra_dst: optional (2, M) array
+        :return: 3x3 array
+        """
+        sums = self._sums
+        if extra_src is not None:
+            extra_src = numpy.asarray(extra_src, dtype=numpy.float64).reshape(2, -1)
+            extra_dst = numpy.asarray(extra_dst, dtype=numpy.float64).reshape(2, -1)
+            if self._origin is None and self._fit is fit_projective:
+                return fit_projective(extra_src, extra_dst)
+            sums = [total + term for total, term in zip(sums, self._terms(extra_src, extra_dst, None))]
+        if self._fit is not fit_projective:
+            return _from_parameters(self._fit, numpy.linalg.solve(*sums))
+        h = _dlt_from_moments(*sums)
+        # Back from the coordinates about the origin.
+        shift_src, shift_dst = numpy.eye(3), numpy.eye(3)
+        shift_src[:2, 2] = -self._origin[0]
+        shift_dst[:2, 2] = self._origin[1]
+        h = numpy.dot(shift_dst, numpy.dot(h, shift_src))
+        return h / h[2, 2]
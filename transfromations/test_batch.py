@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from transfromations import batch
+
+# x, y, u, v, weight of pairs related by a translation of (10, -5).
+PAIRS = numpy.array([[0., 0., 10., -5., 1.], [100., 0., 110., -5., 2.], [0., 100., 10., 95., 1.],
+                     [100., 100., 110., 95., 0.5]])
+
+
+class ReadPairsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def assert_pairs(self, path, weights):
+        src, dst, read_weights = batch.read_pairs(path)
+        numpy.testing.assert_array_equal(src, PAIRS[:, 0:2].T)
+        numpy.testing.assert_array_equal(dst, PAIRS[:, 2:4].T)
+        numpy.testing.assert_array_equal(read_weights, weights)
+
+    def test_csv_with_a_header_and_some_weights(self):
+        # The odd rows leave out their weight.
+        rows = ['x,y,u,v,weight'] + [','.join('%g' % v for v in row[:5 - i % 2]) for i, row in enumerate(PAIRS)]
+        self.assert_pairs(self.write('pairs.csv', '\n'.join(rows) + '\n'), [1., 1., 1., 1.])
+
+    def test_jsonl(self):
+        lines = [json.dumps({'src': list(row[:2]), 'dst': list(row[2:4]), 'weight': row[4]}) for row in PAIRS]
+        self.assert_pairs(self.write('pairs.jsonl', '\n'.join(lines) + '\n\n'), PAIRS[:, 4])
+
+    def test_npy(self):
+        path = os.path.join(self.directory, 'pairs.npy')
+        numpy.save(path, PAIRS[:, :4])
+        self.assert_pairs(path, numpy.ones(4))
+
+    def test_bad_rows_name_their_line(self):
+        for name, text in [('short.csv', '1,2,3,4\n1,2,3\n'), ('long.csv', 'x,y,u,v\n1,2,3,4,5,6\n'),
+                           ('text.csv', '1,2,3,4\n1,2,a,4\n'),
+                           ('pairs.jsonl', '{"src": [1, 2], "dst": [3, 4]}\n{"src": [1]}\n')]:
+            path = self.write(name, text)
+            with self.assertRaises(ValueError) as raised:
+                batch.read_pairs(path)
+            self.assertIn('line 2', str(raised.exception))
+        numpy.save(os.path.join(self.directory, 'pairs.npy'), numpy.zeros((3, 3)))
+        self.assertRaises(ValueError, batch.read_pairs, os.path.join(self.directory, 'pairs.npy'))
+
+
+class MainTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pairs = self.path('pairs.npy')
+        numpy.save(self.pairs, PAIRS)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def run_main(self, input_name, output_name):
+        batch.main(['--pairs', self.pairs, '--model', 'translation', '--chunk-size', '2', self.path(input_name),
+                    self.path(output_name)])
+
+    def test_csv_round_trip(self):
+        with open(self.path('in.csv'), 'w') as f:
+            f.write('x,y,name\n1,2,a\n\n3,4,b\n5.5,6,c\n')
+        self.run_main('in.csv', 'out.csv')
+        with open(self.path('out.csv')) as f:
+            self.assertEqual(f.read(), 'x,y,name\n11.0,-3.0,a\n\n13.0,-1.0,b\n15.5,1.0,c\n')
+
+    def test_csv_rows_without_y_name_their_line(self):
+        with open(self.path('in.csv'), 'w') as f:
+            f.write('1,2\n3\n')
+        with self.assertRaises(ValueError) as raised:
+            self.run_main('in.csv', 'out.csv')
+        self.assertIn('line 2', str(raised.exception))
+
+    def test_jsonl_round_trip(self):
+        objects = [{'id': 1, 'points': [[0, 0], [1, 1], [2, 2]]}, {'id': 2}, {'id': 3, 'points': [[5, 5]]}]
+        with open(self.path('in.jsonl'), 'w') as f:
+            f.write(''.join(json.dumps(obj) + '\n' for obj in objects))
+        self.run_main('in.jsonl', 'out.jsonl')
+        with open(self.path('out.jsonl')) as f:
+            out = [json.loads(line) for line in f]
+        self.assertEqual(out, [{'id': 1, 'points': [[10., -5.], [11., -4.], [12., -3.]]}, {'id': 2},
+                               {'id': 3, 'points': [[15., 0.]]}])
+
+    def test_npy_round_trip(self):
+        points = numpy.random.RandomState(0).uniform(-100, 100, (7, 3))
+        numpy.save(self.path('in.npy'), points)
+        self.run_main('in.npy', 'out.npy')
+        numpy.testing.assert_allclose(numpy.load(self.path('out.npy')), points + [10., -5., 0.])
+
+
+if __name__ == '__main__':
+    unittest.main()
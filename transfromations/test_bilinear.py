@@ -0,0 +1,36 @@
+import unittest
+
+import numpy
+
+from transfromations.bilinear import BilinearTransformation, fit_bilinear
+
+
+class BilinearTest(unittest.TestCase):
+    def setUp(self):
+        self.src = numpy.array([[0., 100., 100., 0.], [0., 0., 100., 100.]])
+        self.dst = numpy.array([[10., 120., 130., -5.], [5., -10., 90., 110.]])
+        self.transformation = BilinearTransformation.from_pairs(self.src, self.dst)
+
+    def test_fit_interpolates_four_pairs(self):
+        numpy.testing.assert_allclose(self.transformation.transform_points(self.src.T), self.dst.T, atol=1e-9)
+
+    def test_batched_fit(self):
+        coefs = fit_bilinear(numpy.array([self.src, self.src + 1.]), numpy.array([self.dst, self.dst]))
+        numpy.testing.assert_allclose(coefs[0], fit_bilinear(self.src, self.dst))
+
+    def test_newton_inverse_round_trip(self):
+        points = numpy.random.RandomState(0).uniform(0, 100, (1000, 2))
+        moved = self.transformation.transform_points(points)
+        numpy.testing.assert_allclose(self.transformation.inverse().transform_points(moved), points, atol=1e-7)
+        numpy.testing.assert_allclose(self.transformation.inverse().transform_points(self.dst.T), self.src.T,
+                                      atol=1e-7)
+
+    def test_no_points(self):
+        self.assertEqual(self.transformation.inverse().transform_points(numpy.zeros((0, 2))).shape, (0, 2))
+
+    def test_inverse_of_the_inverse(self):
+        self.assertIs(self.transformation.inverse().inverse(), self.transformation)
+
+
+if __name__ == '__main__':
+    unittest.main()
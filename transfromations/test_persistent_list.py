@@ -0,0 +1,36 @@
+import unittest
+
+from transfromations.persistent_list import PersistentList
+
+
+class PersistentListTest(unittest.TestCase):
+    def test_behaves_like_a_list(self):
+        values = PersistentList(range(5)).append(5)
+        self.assertEqual(list(values), list(range(6)))
+        self.assertEqual(len(values), 6)
+        self.assertEqual(values[2], 2)
+        self.assertEqual(values[-1], 5)
+        self.assertEqual(list(values.reversed_items()), [(i, i) for i in reversed(range(6))])
+        self.assertRaises(IndexError, values.__getitem__, 6)
+
+    def test_replace_and_remove_leave_the_original_alone(self):
+        values = PersistentList('abcd')
+        self.assertEqual(list(values.replace(1, 'x')), list('axcd'))
+        self.assertEqual(list(values.remove(0)), list('bcd'))
+        self.assertEqual(list(values.remove(-1)), list('abc'))
+        self.assertEqual(list(values), list('abcd'))
+
+    def test_derived_lists_share_their_prefix(self):
+        values = PersistentList('abc')
+        first, second = values.append('d'), values.append('e')
+        self.assertEqual(list(first), list('abcd'))
+        self.assertEqual(list(second), list('abce'))
+        self.assertIs(first._last.previous, second._last.previous)
+
+    def test_empty(self):
+        self.assertEqual(len(PersistentList()), 0)
+        self.assertEqual(list(PersistentList()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
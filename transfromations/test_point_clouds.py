@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from transfromations import point_clouds
+
+MATRIX = numpy.array([[0.5, 0., 0.25], [0., 2., -1.], [0., 0., 1.]])
+
+
+class PointCloudsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_chunks_match_one_transform(self):
+        points = numpy.random.RandomState(0).uniform(-100, 100, (1000, 3))
+        numpy.save(self.path('in.npy'), points)
+        point_clouds.transform_point_cloud(MATRIX, point_clouds.npy_layout(self.path('in.npy')),
+                                           self.path('out.npy'), chunk_size=64)
+        out = numpy.load(self.path('out.npy'))
+        numpy.testing.assert_allclose(out[:, :2], points[:, :2] * [0.5, 2.] + [0.25, -1.])
+        numpy.testing.assert_array_equal(out[:, 2], points[:, 2])
+
+    def test_integer_input_gives_float_output(self):
+        numpy.save(self.path('in.npy'), numpy.array([[1, 2], [3, 4]], dtype=numpy.int32))
+        point_clouds.transform_point_cloud(MATRIX, point_clouds.npy_layout(self.path('in.npy')), self.path('out.npy'))
+        out = numpy.load(self.path('out.npy'))
+        self.assertEqual(out.dtype, numpy.float64)
+        numpy.testing.assert_allclose(out, [[0.75, 3.], [1.75, 7.]])
+
+    def test_empty_input(self):
+        numpy.save(self.path('in.npy'), numpy.zeros((0, 2)))
+        point_clouds.transform_point_cloud(MATRIX, point_clouds.npy_layout(self.path('in.npy')), self.path('out.npy'))
+        self.assertEqual(numpy.load(self.path('out.npy')).shape, (0, 2))
+        open(self.path('in.raw'), 'wb').close()
+        layout = point_clouds.transform_point_cloud(MATRIX, point_clouds.raw_layout(self.path('in.raw')),
+                                                    self.path('out.raw'))
+        self.assertEqual(layout.shape, (0, 2))
+        self.assertEqual(os.path.getsize(self.path('out.raw')), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+
+import numpy
+
+from transfromations import solvers
+
+
+def _apply(matrix, src):
+    """
+    :param src: (2, N) array
+    """
+    return solvers.apply_matrix(matrix, src.T).T
+
+
+PROJECTIVE = numpy.array([[1.2, 0.3, 5.], [-0.4, 0.9, 2.], [1e-3, 2e-3, 1.]])
+AFFINE = numpy.array([[1.2, 0.3, 5.], [-0.4, 0.9, 2.], [0., 0., 1.]])
+SIMILARITY = numpy.array([[0.9, -0.2, 5.], [0.2, 0.9, -3.], [0., 0., 1.]])
+TRANSLATION = numpy.array([[1., 0., 4.], [0., 1., -7.], [0., 0., 1.]])
+EXACT = [
+    (solvers.fit_translation, TRANSLATION),
+    (solvers.fit_similarity, SIMILARITY),
+    (solvers.fit_affine, AFFINE),
+    (solvers.fit_projective, PROJECTIVE),
+]
+
+
+class FitTest(unittest.TestCase):
+    def setUp(self):
+        self.random = numpy.random.RandomState(0)
+
+    def test_exact_pairs(self):
+        for fit, matrix in EXACT:
+            src = self.random.uniform(0, 100, (2, solvers.MIN_PAIRS[fit]))
+            numpy.testing.assert_allclose(fit(src, _apply(matrix, src)), matrix, atol=1e-9, err_msg=fit.__name__)
+
+    def test_batches_match_single_fits(self):
+        src = self.random.uniform(0, 100, (5, 2, 6))
+        dst = src + self.random.normal(0, 1, src.shape)
+        for fit, _ in EXACT:
+            batch = fit(src, dst)
+            for i in range(len(src)):
+                numpy.testing.assert_allclose(batch[i], fit(src[i], dst[i]), atol=1e-9, err_msg=fit.__name__)
+
+    def test_normalized_dlt_is_similarity_invariant(self):
+        # The normalization makes the fit independent of where the scene is and of its units.
+        src = self.random.uniform(0, 100, (2, 20))
+        dst = _apply(PROJECTIVE, src) + self.random.normal(0, 0.5, (2, 20))
+        fitted = solvers.fit_projective(src, dst)
+        moved_src, moved_dst = src * 3. + 1e4, dst * 3. + 1e4
+        refitted = solvers.fit_projective(moved_src, moved_dst)
+        numpy.testing.assert_allclose(_apply(refitted, moved_src), _apply(fitted, src) * 3. + 1e4, atol=1e-6)
+
+    def test_zero_weights_drop_pairs(self):
+        src = self.random.uniform(0, 100, (2, 8))
+        dst = _apply(PROJECTIVE, src)
+        dst[:, :2] += 50.
+        weights = numpy.ones(8)
+        weights[:2] = 0.
+        numpy.testing.assert_allclose(solvers.fit_projective(src, dst, weights), PROJECTIVE, atol=1e-9)
+
+
+class NormalEquationsTest(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(1)
+        self.src = random.uniform(0, 1000, (2, 30))
+        self.dst = _apply(PROJECTIVE, self.src) + random.normal(0, 2, (2, 30))
+        self.weights = random.uniform(0.5, 2, 30)
+
+    def assert_same_fit(self, a, b):
+        # Compared on the points, the entries of a homography are scaled very differently.
+        numpy.testing.assert_allclose(_apply(a, self.src), _apply(b, self.src), atol=1e-8)
+
+    def test_accumulated_blocks_match_the_direct_fit(self):
+        for fit in solvers.NORMAL_EQUATIONS_SIZES:
+            equations = solvers.NormalEquations(fit)
+            equations.add(self.src[:, :10], self.dst[:, :10], self.weights[:10])
+            equations.add(self.src[:, 10:], self.dst[:, 10:], self.weights[10:])
+            self.assert_same_fit(equations.solve(), fit(self.src, self.dst, self.weights))
+
+    def test_downdates_match_a_fit_without_the_removed_pairs(self):
+        for fit in solvers.NORMAL_EQUATIONS_SIZES:
+            equations = solvers.NormalEquations(fit)
+            equations.add(self.src, self.dst, self.weights)
+            equations.add(self.src[:, :5], self.dst[:, :5], -self.weights[:5])
+            self.assert_same_fit(equations.solve(), fit(self.src[:, 5:], self.dst[:, 5:], self.weights[5:]))
+
+    def test_extra_pairs_do_not_change_the_accumulated_state(self):
+        for fit in solvers.NORMAL_EQUATIONS_SIZES:
+            equations = solvers.NormalEquations(fit)
+            equations.add(self.src[:, 1:], self.dst[:, 1:])
+            before = equations.solve()
+            self.assert_same_fit(equations.solve(self.src[:, :1], self.dst[:, :1]), fit(self.src, self.dst))
+            self.assert_same_fit(equations.solve(), before)
+
+    def test_copies_are_independent(self):
+        equations = solvers.NormalEquations(solvers.fit_projective)
+        equations.add(self.src, self.dst)
+        copy = equations.copy()
+        copy.add(self.src[:, :5], self.dst[:, :5], -numpy.ones(5))
+        self.assert_same_fit(equations.solve(), solvers.fit_projective(self.src, self.dst))
+
+    def test_far_away_scene(self):
+        src, dst = self.src + 1e5, self.dst + 1e5
+        equations = solvers.NormalEquations(solvers.fit_projective)
+        equations.add(src, dst)
+        numpy.testing.assert_allclose(_apply(equations.solve(), src), _apply(solvers.fit_projective(src, dst), src),
+                                      atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
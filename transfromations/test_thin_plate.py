@@ -0,0 +1,86 @@
+import unittest
+
+import numpy
+
+from transfromations.geometry import Point
+from transfromations.thin_plate import ThinPlateSpline
+
+
+class ThinPlateSplineTest(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(0)
+        self.src = random.uniform(0, 1000, (2, 20))
+        self.dst = self.src + random.normal(0, 5, (2, 20))
+        self.points = random.uniform(100, 900, (500, 2))
+
+    def assert_same_spline(self, a, b):
+        numpy.testing.assert_allclose(a.transform_points(self.points), b.transform_points(self.points), atol=1e-6)
+
+    def test_interpolates_the_controls(self):
+        spline = ThinPlateSpline(self.src, self.dst)
+        numpy.testing.assert_allclose(spline.transform_points(self.src.T), self.dst.T, atol=1e-8)
+
+    def test_reproduces_affine_maps(self):
+        dst = numpy.dot([[1.1, 0.2], [-0.3, 0.9]], self.src) + [[5.], [-2.]]
+        spline = ThinPlateSpline(self.src, dst)
+        expected = numpy.dot(self.points, [[1.1, -0.3], [0.2, 0.9]]) + [5., -2.]
+        numpy.testing.assert_allclose(spline.transform_points(self.points), expected, atol=1e-6)
+
+    def test_move_destination_matches_a_rebuilt_spline(self):
+        spline = ThinPlateSpline(self.src, self.dst).move_destination(3, Point(400., 500.))
+        dst = self.dst.copy()
+        dst[:, 3] = 400., 500.
+        self.assert_same_spline(spline, ThinPlateSpline(self.src, dst))
+
+    def test_move_source_matches_a_rebuilt_spline(self):
+        # Woodbury updates of the inverse, over and over.
+        spline = ThinPlateSpline(self.src, self.dst)
+        src = self.src.copy()
+        random = numpy.random.RandomState(1)
+        for _ in range(50):
+            i = random.randint(src.shape[1])
+            src[:, i] += random.normal(0, 20, 2)
+            spline = spline.move_source(i, Point(*src[:, i]))
+        self.assert_same_spline(spline, ThinPlateSpline(src, self.dst))
+
+    def test_add_control_matches_a_rebuilt_spline(self):
+        spline = ThinPlateSpline(self.src[:, :3], self.dst[:, :3])
+        for i in range(3, self.src.shape[1]):
+            spline = spline.add_control(Point(*self.src[:, i]), Point(*self.dst[:, i]))
+        self.assertEqual(spline.n_controls(), self.src.shape[1])
+        self.assert_same_spline(spline, ThinPlateSpline(self.src, self.dst))
+
+    def test_updates_leave_the_original_alone(self):
+        spline = ThinPlateSpline(self.src, self.dst)
+        before = spline.transform_points(self.points)
+        spline.move_source(0, Point(1., 2.))
+        spline.move_destination(1, Point(3., 4.))
+        spline.add_control(Point(5., 6.), Point(7., 8.))
+        numpy.testing.assert_array_equal(spline.transform_points(self.points), before)
+
+    def test_jacobians_match_finite_differences(self):
+        spline = ThinPlateSpline(self.src, self.dst)
+        values, jacobians = spline.values_and_jacobians(self.points)
+        numpy.testing.assert_allclose(values, spline.transform_points(self.points), atol=1e-9)
+        step = 1e-4
+        for j, offset in enumerate(([step, 0.], [0., step])):
+            difference = (spline.transform_points(self.points + offset) -
+                          spline.transform_points(self.points - offset)) / (2 * step)
+            numpy.testing.assert_allclose(jacobians[:, :, j], difference, atol=1e-6)
+
+    def test_inverse_round_trip(self):
+        spline = ThinPlateSpline(self.src, self.dst)
+        moved = spline.transform_points(self.points)
+        numpy.testing.assert_allclose(spline.inverse().transform_points(moved), self.points, atol=1e-6)
+        self.assertIs(spline.inverse().inverse(), spline)
+
+    def test_without_system_transforms_and_inverts_the_same(self):
+        spline = ThinPlateSpline(self.src, self.dst)
+        light = spline.without_system()
+        self.assert_same_spline(light, spline)
+        moved = spline.transform_points(self.points)
+        numpy.testing.assert_allclose(light.inverse().transform_points(moved), self.points, atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+
+import numpy
+
+from transfromations import robust, solvers
+from transfromations.geometry import Point
+from transfromations.thin_plate import ThinPlateSpline
+from transfromations.transformations_builders import LeastSquaresBuilder, ProjectiveBuilder, RobustBuilder, \
+    ThinPlateSplineBuilder
+
+HOMOGRAPHY = numpy.array([[1.1, 0.1, 20.], [0.05, 0.95, -10.], [1e-4, -2e-4, 1.]])
+
+
+def _points(matrix, points):
+    return solvers.apply_matrix(numpy.asarray(matrix), points)
+
+
+class LeastSquaresBuilderTest(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(0)
+        self.src = random.uniform(0, 500, (2, 8))
+        self.dst = _points(HOMOGRAPHY, self.src.T).T + random.normal(0, 2, (2, 8))
+        self.probe = random.uniform(0, 500, (50, 2))
+
+    def assert_same_transformation(self, a, b):
+        numpy.testing.assert_allclose(_points(a.matrix(), self.probe), _points(b.matrix(), self.probe), atol=1e-8)
+
+    def test_preview_is_the_fit_after_release(self):
+        # The ghost drawn while dragging must not jump when the pair is dropped.
+        for fit in solvers.NORMAL_EQUATIONS_SIZES:
+            builder = LeastSquaresBuilder(fit).add_pairs(self.src, self.dst)
+            src, dst = Point(100., 200.), Point(130., 190.)
+            self.assert_same_transformation(builder.preview_transformation(src, dst),
+                                            builder.move_point(src, dst).get_transformation())
+
+    def test_final_fit_matches_the_direct_solver(self):
+        for fit in solvers.NORMAL_EQUATIONS_SIZES:
+            builder = LeastSquaresBuilder(fit).add_pairs(self.src, self.dst)
+            numpy.testing.assert_allclose(_points(builder.get_transformation().matrix(), self.probe),
+                                          _points(fit(self.src, self.dst), self.probe), atol=1e-8)
+
+    def test_moved_and_removed_pairs_match_a_new_builder(self):
+        fit = solvers.fit_projective
+        builder = LeastSquaresBuilder(fit).add_pairs(self.src[:, :4], self.dst[:, :4])
+        builder = builder.add_pairs(self.src[:, 4:], self.dst[:, 4:])
+        moved = builder.move_pair(5, Point(1., 2.), Point(3., 4.)).remove_pair(1)
+        src, dst = self.src.copy(), self.dst.copy()
+        src[:, 5], dst[:, 5] = (1., 2.), (3., 4.)
+        fresh = LeastSquaresBuilder(fit).add_pairs(numpy.delete(src, 1, axis=1), numpy.delete(dst, 1, axis=1))
+        self.assert_same_transformation(moved.get_transformation(), fresh.get_transformation())
+        # The builders derived from are untouched.
+        self.assert_same_transformation(builder.get_transformation(),
+                                        LeastSquaresBuilder(fit).add_pairs(self.src, self.dst).get_transformation())
+
+
+class ProjectiveBuilderTest(unittest.TestCase):
+    def test_previews_with_any_number_of_pairs(self):
+        builder = ProjectiveBuilder(n_pairs=6)
+        src = [(0., 0.), (100., 0.), (100., 100.), (0., 100.), (50., 50.), (20., 70.)]
+        for x, y in src:
+            u, v = _points(HOMOGRAPHY, [[x, y]])[0]
+            self.assertIsNotNone(builder.preview_transformation(Point(x, y), Point(u, v)))
+            builder = builder.move_point(Point(x, y), Point(u, v))
+        numpy.testing.assert_allclose(builder.get_transformation().matrix(), HOMOGRAPHY, atol=1e-9)
+
+
+class RobustBuilderTest(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(0)
+        self.src = random.uniform(0, 100, (2, 200))
+        self.dst = self.src + [[5.], [-3.]]
+        self.dst[:, :40] += random.uniform(-50, 50, (2, 40))
+
+    def test_async_fit_matches_the_blocking_one(self):
+        blocking = robust.robust_fit(solvers.fit_affine, self.src, self.dst, seed=1)
+        background = robust.robust_fit_async(solvers.fit_affine, self.src, self.dst, seed=1).result()
+        numpy.testing.assert_allclose(background[0], blocking[0])
+        numpy.testing.assert_array_equal(background[1], blocking[1])
+
+    def test_transformation_future(self):
+        builder = RobustBuilder().add_pairs(self.src, self.dst)
+        transformation = builder.transformation_future().result()
+        expected = numpy.array([[1., 0., 5.], [0., 1., -3.], [0., 0., 1.]])
+        numpy.testing.assert_allclose(transformation.matrix(), expected, atol=1e-9)
+        self.assertGreaterEqual(builder.inliers.sum(), 160)
+
+    def test_degenerate_inliers_keep_the_best_hypothesis(self):
+        # Inliers all on a line cannot be refitted by an affine fit.
+        src = numpy.array([numpy.arange(10.), numpy.zeros(10)])
+        best = numpy.array([[1., 0., 5.], [0., 1., 0.], [0., 0., 1.]])
+        matrix, inliers = robust._refit(solvers.fit_affine, src, src + [[5.], [0.]], [(0, best)], 1., None)
+        numpy.testing.assert_array_equal(matrix, best)
+        self.assertTrue(inliers.all())
+
+
+class ThinPlateSplineBuilderTest(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(0)
+        self.src = random.uniform(0, 500, (2, 6))
+        self.dst = self.src + random.normal(0, 10, (2, 6))
+        self.probe = random.uniform(0, 500, (50, 2))
+
+    def test_incremental_builder_matches_a_new_spline(self):
+        builder = ThinPlateSplineBuilder()
+        for i in range(6):
+            builder = builder.move_point(Point(*self.src[:, i]), Point(*self.dst[:, i]))
+        builder = builder.move_source(2, Point(250., 250.)).move_destination(4, Point(10., 20.)).finish()
+        self.src[:, 2], self.dst[:, 4] = (250., 250.), (10., 20.)
+        numpy.testing.assert_allclose(builder.get_transformation().transform_points(self.probe),
+                                      ThinPlateSpline(self.src, self.dst).transform_points(self.probe), atol=1e-6)
+
+    def test_the_kernel_system_is_factorized_once(self):
+        inv = numpy.linalg.inv
+        calls = []
+
+        def counting_inv(a):
+            calls.append(a.shape)
+            return inv(a)
+
+        numpy.linalg.inv = counting_inv
+        try:
+            builder = ThinPlateSplineBuilder()
+            for i in range(6):
+                for k in range(5):
+                    # The frames of the drag.
+                    builder.preview_transformation(Point(*self.src[:, i]), Point(*self.dst[:, i] + k))
+                builder = builder.move_point(Point(*self.src[:, i]), Point(*self.dst[:, i]))
+            builder = builder.move_source(4, Point(100., 400.)).move_destination(1, Point(0., 0.)).finish()
+            builder.get_transformation().transform_points(self.probe)
+        finally:
+            numpy.linalg.inv = inv
+        # The 3 pair spline, solved for each preview frame of the third pair and once more when it is dropped.
+        self.assertEqual(calls, [(6, 6)] * 6)
+
+    def test_done_once_finished(self):
+        builder = ThinPlateSplineBuilder()
+        for i in range(3):
+            self.assertFalse(builder.finish().is_done())
+            builder = builder.move_point(Point(*self.src[:, i]), Point(*self.dst[:, i]))
+        self.assertFalse(builder.is_done())
+        self.assertTrue(builder.finish().is_done())
+
+    def test_collinear_sources(self):
+        builder = ThinPlateSplineBuilder()
+        for x, y in [(0., 0.), (10., 10.), (20., 20.)]:
+            builder = builder.move_point(Point(x, y), Point(x + 1., y))
+        self.assertIsNone(builder.preview_transformation(Point(30., 30.), Point(30., 30.)))
+        self.assertRaises(numpy.linalg.LinAlgError, builder.finish().get_transformation)
+        builder = builder.move_point(Point(0., 20.), Point(0., 20.)).finish()
+        numpy.testing.assert_allclose(builder.get_transformation().transform_points([[20., 20.]]), [[21., 20.]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+import numpy
+
+from transfromations import warp
+from transfromations.linear_transformations import ProjectiveTransformation
+from transfromations.thin_plate import ThinPlateSpline
+
+
+class WarpTest(unittest.TestCase):
+    def setUp(self):
+        self.image = numpy.arange(64 * 64 * 3, dtype=numpy.uint8).reshape(64, 64, 3)
+
+    def test_integer_samples_are_rounded(self):
+        image = numpy.array([[0, 10], [0, 10]], dtype=numpy.uint8)
+        # 0.03 * 0 + 0.97 * 10 = 9.7, which a cast alone truncates to 9.
+        numpy.testing.assert_array_equal(warp.sample(image, numpy.array([1.47]), numpy.array([0.5])), [10])
+
+    def test_identity_warp_gives_the_image(self):
+        identity = ProjectiveTransformation(numpy.matrix(numpy.eye(3)))
+        numpy.testing.assert_array_equal(warp.warp_image(self.image, identity, (64, 64), tile_size=16), self.image)
+
+    def test_thin_plate_spline_warp(self):
+        src = numpy.array([[0., 64., 64., 0., 32.], [0., 0., 64., 64., 32.]])
+        dst = src.copy()
+        dst[:, 4] += 3.
+        spline = ThinPlateSpline(src, dst)
+        warped = warp.warp_image(self.image, spline, (64, 64))
+        self.assertEqual(warped.shape, self.image.shape)
+        # The corners stay put.
+        numpy.testing.assert_array_equal(warped[0, 0], self.image[0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
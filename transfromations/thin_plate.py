@@ -0,0 +1,286 @@
+import numpy
+
+from transfromations import solvers
+from transfromations.geometry import Point
+from transfromations.transformations import Transformation
+
+# Points evaluated at once are limited so the (points x control points) kernel block stays this size.
+EVALUATION_BLOCK = 1 << 22
+
+
+def _kernel(squared_distances):
+    """
+    U(r) = r^2 log r, written with r^2 to skip the square roots. Overwrites its argument.
+    """
+    zero = squared_distances == 0
+    squared_distances[zero] = 1.
+    res = numpy.log(squared_distances)
+    res *= squared_distances
+    res *= 0.5
+    res[zero] = 0.
+    return res
+
+
+def _squared_distances(points, controls):
+    """
+    |p|^2 + |c|^2 - 2 p.c, which is a matrix product instead of an (M, N, 2) temporary.
+    """
+    res = numpy.dot(points, -2 * controls.T)
+    res += (points ** 2).sum(axis=1)[:, None]
+    res += (controls ** 2).sum(axis=1)
+    return numpy.maximum(res, 0, out=res)
+
+
+def _system_column(controls, i, regularization):
+    """
+    Column i of the system matrix [[K + regularization * I, P], [P^T, 0]].
+    """
+    n = len(controls)
+    res = numpy.zeros(n + 3)
+    res[:n] = _kernel(((controls - controls[i]) ** 2).sum(axis=1))
+    res[i] = regularization
+    res[n:] = 1., controls[i, 0], controls[i, 1]
+    return res
+
+
+class ThinPlateSpline(Transformation):
+    """
+    Thin plate spline through any number of control pairs.
+    The inverse of the system matrix is kept, so moving a destination costs O(N) and moving a source
+    O(N^2), instead of refactorizing in O(N^3).
+    """
+    # Relative residual of the solve above which the inverse is recomputed.
+    TOLERANCE = 1e-8
+
+    def __init__(self, src, dst, regularization=0.):
+        """
+        :param src: (2, N) array of control points, N >= 3 and not all on one line.
+        :param dst: (2, N) array of where they move to.
+        :param regularization: 0 interpolates exactly, larger values smooth.
+        :raise numpy.linalg.LinAlgError: when the control points are all on one line, which leaves the affine part
+                                         undetermined.
+        """
+        src = numpy.array(src, dtype=numpy.float64).reshape(2, -1).T
+        # The system is built in coordinates centered on the controls and of unit spread, otherwise kernel values
+        # of scene sized distances make it hopelessly ill conditioned. The spline itself does not change.
+        self._center = src.mean(axis=0)
+        self._scale = numpy.abs(src - self._center).max() or 1.
+        self._controls = self._normalized(src)
+        self._targets = numpy.array(dst, dtype=numpy.float64).reshape(2, -1).T
+        self._regularization = regularization
+        n = len(self._controls)
+        if numpy.linalg.matrix_rank(numpy.column_stack([numpy.ones(n), self._controls])) < 3:
+            raise numpy.linalg.LinAlgError('the control points are all on one line')
+        system = numpy.zeros((n + 3, n + 3))
+        system[:n, :n] = _kernel(_squared_distances(self._controls, self._controls))
+        system[:n, :n] += regularization * numpy.eye(n)
+        system[:n, n] = system[n, :n] = 1.
+        system[:n, n + 1:] = self._controls
+        system[n + 1:, :n] = self._controls.T
+        self._system = system
+        self._system_inverse = numpy.linalg.inv(system)
+        self._inverse = None
+        self._solve()
+
+    def _normalized(self, points):
+        return (points - self._center) / self._scale
+
+    def _solve(self):
+        n = len(self._controls)
+        rhs = numpy.zeros((n + 3, 2))
+        rhs[:n] = self._targets
+        self._params = numpy.dot(self._system_inverse, rhs)
+        # A step of iterative refinement takes back the error the updates of the inverse accumulate. Once they
+        # have drifted too far for it, the inverse is recomputed.
+        self._params += numpy.dot(self._system_inverse, rhs - numpy.dot(self._system, self._params))
+        residual = numpy.abs(rhs - numpy.dot(self._system, self._params)).max()
+        if residual > self.TOLERANCE * max(numpy.abs(rhs).max(), 1.):
+            self._system_inverse = numpy.linalg.inv(self._system)
+            self._params = numpy.dot(self._system_inverse, rhs)
+
+    def _copy(self):
+        res = ThinPlateSpline.__new__(ThinPlateSpline)
+        res.__dict__.update(self.__dict__)
+        res._inverse = None
+        return res
+
+    def without_system(self):
+        """
+        :return: the same spline without the system matrix and its inverse, O(N) instead of O(N^2) to keep around.
+                 It transforms and inverts points, it cannot move or add controls.
+        :rtype: ThinPlateSpline
+        """
+        res = self._copy()
+        res._system = res._system_inverse = None
+        return res
+
+    def n_controls(self):
+        return len(self._controls)
+
+    def move_destination(self, i, point):
+        """
+        :param point: the new destination of control i
+        :rtype: ThinPlateSpline
+        """
+        res = self._copy()
+        delta = numpy.array([point.x(), point.y()]) - self._targets[i]
+        res._targets = self._targets.copy()
+        res._targets[i] += delta
+        res._params = self._params + numpy.outer(self._system_inverse[:, i], delta)
+        return res
+
+    def move_source(self, i, point):
+        """
+        Moves control i, updating the inverse of the system matrix with the Woodbury identity - only its row
+        and column i change.
+        :param point: the new position of control i
+        :rtype: ThinPlateSpline
+        """
+        res = self._copy()
+        res._controls = self._controls.copy()
+        old_column = _system_column(self._controls, i, self._regularization)
+        res._controls[i] = self._normalized(numpy.array([point.x(), point.y()]))
+        new_column = _system_column(res._controls, i, self._regularization)
+        res._system = self._system.copy()
+        res._system[:, i] = res._system[i, :] = new_column
+        d = new_column - old_column
+        # new system = system + d e_i^T + e_i d^T
+        a = self._system_inverse
+        a_d = numpy.dot(a, d)
+        a_u = numpy.column_stack([a_d, a[:, i]])
+        vt_a = numpy.vstack([a[i], a_d])
+        small = numpy.eye(2) + numpy.array([[a_d[i], a[i, i]], [numpy.dot(d, a_d), a_d[i]]])
+        res._system_inverse = a - numpy.dot(a_u, numpy.linalg.solve(small, vt_a))
+        res._solve()
+        return res
+
+    def add_control(self, src, dst):
+        """
+        Adds a control pair, growing the inverse of the system matrix by its Schur complement in O(N^2).
+        :type src: Point
+        :type dst: Point
+        :rtype: ThinPlateSpline
+        """
+        n = len(self._controls)
+        res = self._copy()
+        res._controls = numpy.vstack([self._controls, self._normalized(numpy.array([[src.x(), src.y()]]))])
+        res._targets = numpy.vstack([self._targets, [[dst.x(), dst.y()]]])
+        column = _system_column(res._controls, n, self._regularization)
+        # The new control is bordered last, then moved to its place before the affine rows.
+        border, corner = numpy.hstack([column[:n], column[n + 1:]]), column[n]
+        a_b = numpy.dot(self._system_inverse, border)
+        schur = corner - numpy.dot(border, a_b)
+        grown = numpy.empty((n + 4, n + 4))
+        grown[:-1, :-1] = self._system_inverse + numpy.outer(a_b, a_b) / schur
+        grown[:-1, -1] = grown[-1, :-1] = -a_b / schur
+        grown[-1, -1] = 1. / schur
+        order = numpy.hstack([numpy.arange(n), [n + 3], numpy.arange(n, n + 3)])
+        res._system_inverse = grown[order][:, order]
+        res._system = numpy.zeros((n + 4, n + 4))
+        old = numpy.hstack([numpy.arange(n), numpy.arange(n + 1, n + 4)])
+        res._system[numpy.ix_(old, old)] = self._system
+        res._system[:, n] = res._system[n, :] = column
+        res._solve()
+        return res
+
+    def transform_point(self, point):
+        u, v = self.transform_points([[point.x(), point.y()]])[0]
+        return Point(u, v)
+
+    def transform_points(self, points):
+        points = self._normalized(numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2))
+        n = len(self._controls)
+        weights, affine = self._params[:n], self._params[n:]
+        res = numpy.empty_like(points)
+        step = max(1, EVALUATION_BLOCK // max(n, 1))
+        for start in range(0, len(points), step):
+            chunk = points[start:start + step]
+            res[start:start + step] = numpy.dot(_kernel(_squared_distances(chunk, self._controls)), weights) + \
+                affine[0] + numpy.dot(chunk, affine[1:])
+        return res
+
+    def values_and_jacobians(self, points):
+        """
+        :param points: (M, 2) array
+        :return: (M, 2) array of the transformed points and (M, 2, 2) array of the derivatives there,
+                 jacobians[m, k, j] = d out_k / d in_j.
+        """
+        points = self._normalized(numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2))
+        n = len(self._controls)
+        weights, affine = self._params[:n], self._params[n:]
+        values = numpy.empty_like(points)
+        jacobians = numpy.empty((len(points), 2, 2))
+        step = max(1, EVALUATION_BLOCK // max(n, 1))
+        for start in range(0, len(points), step):
+            chunk = points[start:start + step]
+            squared = _squared_distances(chunk, self._controls)
+            # d U(r) / d p = (p - c) (log r^2 + 1), which goes to 0 at r = 0.
+            zero = squared == 0
+            squared[zero] = 1.
+            slope = numpy.log(squared)
+            slope += 1.
+            slope[zero] = 0.
+            values[start:start + step] = numpy.dot(_kernel(squared), weights) + affine[0] + numpy.dot(chunk, affine[1:])
+            # sum_i w_i[k] slope_i (p - c_i)[j] = p[j] (slope . w[k]) - (slope * w[k]) . c[:, j]
+            for k in range(2):
+                weighted = slope * weights[:, k]
+                jacobians[start:start + step, k] = chunk * weighted.sum(axis=1)[:, None] - \
+                    numpy.dot(weighted, self._controls) + affine[1:, k]
+        jacobians /= self._scale
+        return values, jacobians
+
+    def inverse(self):
+        if self._inverse is None:
+            self._inverse = ThinPlateSplineInverse(self)
+        return self._inverse
+
+
+class ThinPlateSplineInverse(Transformation):
+    """
+    Inverts a thin plate spline with a vectorized Newton solve, starting from the affine fit of the destinations
+    back to the sources. Points the spline folds over have several preimages, one of them is returned.
+    """
+    MAX_ITERATIONS = 30
+    # Relative to the spread of the control points.
+    TOLERANCE = 1e-10
+
+    def __init__(self, forward):
+        """
+        :type forward: ThinPlateSpline
+        """
+        self._forward = forward
+        src = forward._controls * forward._scale + forward._center
+        try:
+            self._guess = solvers.fit_affine(forward._targets.T, src.T)
+        except numpy.linalg.LinAlgError:
+            # The destinations are on one line, nothing better than staying put.
+            self._guess = numpy.eye(3)
+        self._tolerance = self.TOLERANCE * forward._scale
+
+    def transform_point(self, point):
+        x, y = self.transform_points([[point.x(), point.y()]])[0]
+        return Point(x, y)
+
+    def transform_points(self, points):
+        targets = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        xy = solvers.apply_matrix(self._guess, targets)
+        # Only the points that did not converge yet are iterated.
+        active = numpy.arange(len(xy))
+        for _ in range(self.MAX_ITERATIONS):
+            if not len(active):
+                break
+            values, jacobians = self._forward.values_and_jacobians(xy[active])
+            f = values - targets[active]
+            (j00, j01), (j10, j11) = jacobians[:, 0].T, jacobians[:, 1].T
+            det = j00 * j11 - j01 * j10
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                dx = (j11 * f[:, 0] - j01 * f[:, 1]) / det
+                dy = (j00 * f[:, 1] - j10 * f[:, 0]) / det
+            usable = numpy.isfinite(dx) & numpy.isfinite(dy)
+            xy[active[usable], 0] -= dx[usable]
+            xy[active[usable], 1] -= dy[usable]
+            active = active[usable & (numpy.abs(f).max(axis=1) >= self._tolerance)]
+        return xy
+
+    def inverse(self):
+        return self._forward
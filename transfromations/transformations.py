@@ -1,5 +1,19 @@
 import abc
 
+import numpy
+
+from transfromations.geometry import Point
+
+
+def points_to_array(points):
+    """
+    :param points:
+    :type points: List[Point]
+    :return: (N, 2) float64 array
+    :rtype: numpy.ndarray
+    """
+    return numpy.array([(p.x(), p.y()) for p in points], dtype=numpy.float64).reshape(-1, 2)
+
 
 class Transformation(object):
     def compose(self, transformation):
@@ -9,16 +23,80 @@ class Transformation(object):
     def transform_point(self, point):
         """
         :param point:
-        :type point: QtCore.QPointF
+        :type point: Point
         :return:
         """
         return point
 
+    @abc.abstractmethod
+    def inverse(self):
+        """
+        :return: the transformation mapping the transformed points back. It may be only numerically inverse, e.g.
+                 solved point by point, where the transformation folds the plane over.
+        :rtype: Transformation
+        """
+
+    def inverse_transform_points(self, points):
+        """
+        Maps transformed points back to where they came from.
+        :param points: (N, 2) array
+        :return: (N, 2) float64 array
+        """
+        return self.inverse().transform_points(points)
+
+    def transform_points(self, points):
+        """
+        Fallback for transformations without a vectorized path.
+        :param points:
+        :type points: numpy.ndarray
+        :return: (N, 2) float64 array
+        """
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        res = numpy.empty_like(points)
+        for i, (x, y) in enumerate(points):
+            p = self.transform_point(Point(x, y))
+            res[i] = p.x(), p.y()
+        return res
+
 
 class IdTransformation(object):
     def transform_point(self, point):
         return point
 
+    def inverse(self):
+        return self
+
+    def inverse_transform_points(self, points):
+        return self.transform_points(points)
+
+    def transform_points(self, points):
+        return numpy.array(points, dtype=numpy.float64).reshape(-1, 2)
+
+
+def fold_stages(transformations):
+    """
+    Flattens nested compositions and multiplies every run of adjacent projective stages
+    into a single matrix, so applying the result costs the same regardless of history length.
+    :param transformations: stages in the order they are applied.
+    :type transformations: List[Transformation]
+    :rtype: List[Transformation]
+    """
+    from transfromations.linear_transformations import ProjectiveTransformation
+    res = []
+    for t in transformations:
+        if isinstance(t, ComposedTransformation):
+            stages = t._transformations
+        elif isinstance(t, IdTransformation):
+            stages = []
+        else:
+            stages = [t]
+        for stage in stages:
+            if res and isinstance(res[-1], ProjectiveTransformation) and isinstance(stage, ProjectiveTransformation):
+                res[-1] = ProjectiveTransformation(stage._matrix * res[-1]._matrix)
+            else:
+                res.append(stage)
+    return res
+
 
 class ComposedTransformation(object):
     def __init__(self, transformations):
@@ -27,12 +105,27 @@ class ComposedTransformation(object):
         :type transformations: List[Transformation]
         :return:
         """
-        self._transformations = list(transformations)
+        self._transformations = fold_stages(transformations)
 
     def transform_point(self, point):
         for t in self._transformations:
             point = t.transform_point(point)
         return point
 
+    def transform_points(self, points):
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        for t in self._transformations:
+            points = t.transform_points(points)
+        return points
+
     def compose(self, transformation):
         return ComposedTransformation([transformation] + self._transformations)
+
+    def inverse(self):
+        return ComposedTransformation([t.inverse() for t in reversed(self._transformations)])
+
+    def inverse_transform_points(self, points):
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        for t in reversed(self._transformations):
+            points = t.inverse_transform_points(points)
+        return points
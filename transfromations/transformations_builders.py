@@ -1,15 +1,21 @@
 from collections import namedtuple
 
+import copy
+
 import math
 import numpy
 
 from transfromations.linear_transformations import TranslationTransformation, RigidTransformation, \
-    SimilarityTransformation, AffineTransformation
-from utils.my_qt import *
+    SimilarityTransformation, AffineTransformation, ProjectiveTransformation
+from transfromations import solvers, robust
+from transfromations.bilinear import BilinearTransformation
+from transfromations.thin_plate import ThinPlateSpline
+from transfromations.persistent_list import PersistentList
 import abc
 
-from transfromations.areas import AllLegalPath, LegalPath, CirclePath, size, distance
-from transfromations.transformations import Transformation
+from transfromations.areas import AllLegalPath, LegalPath, CirclePath
+from transfromations.geometry import Point, distance
+from transfromations.transformations import Transformation, points_to_array
 
 
 class TransformationBuilder(object):
@@ -17,9 +23,9 @@ class TransformationBuilder(object):
     def move_point(self, src, dst):
         """
         :param src:
-        :type src: QtCore.QPointF
+        :type src: Point
         :param dst:
-        :type dst: QtCore.QPointF
+        :type dst: Point
         :return:
         """
         pass
@@ -28,7 +34,7 @@ class TransformationBuilder(object):
     def legal_path(self, src):
         """
         :param src:
-        :type src: QtCore.QPointF
+        :type src: Point
         :return:
         :rtype LegalPath
         """
@@ -46,47 +52,101 @@ class TransformationBuilder(object):
     def sources(self):
         return []
 
+    def preview_transformation(self, src, dst):
+        """
+        A provisional transformation for the pairs fixed so far plus src moved to dst, used while dragging.
+        :param src:
+        :type src: Point
+        :param dst:
+        :type dst: Point
+        :return: None if there is nothing to preview.
+        :rtype: Transformation
+        """
+        return None
+
 
 SrcDst = namedtuple('SrcDst', ['src', 'dst'])
 
+# The fits previewed while a builder has fewer pairs than it needs, by number of pairs. From 4 pairs on the
+# homography through them is previewed, see preview_fit.
+PREVIEW_FITS = {1: solvers.fit_translation, 2: solvers.fit_similarity, 3: solvers.fit_affine}
+
+
+def preview_fit(n_pairs):
+    return PREVIEW_FITS.get(n_pairs, solvers.fit_projective)
+
 
 class MultiSrcDstBuilder(TransformationBuilder):
     def __init__(self, n_pairs):
-        self._src_dst_pairs = []
+        self._src_dst_pairs = PersistentList()
         self._n_pairs = n_pairs
+        self._legal_paths = {}
+
+    def legal_path(self, src):
+        # The builder never changes once created, so the path only depends on src. It is asked for on every
+        # mouse move while dragging.
+        key = (src.x(), src.y())
+        if key not in self._legal_paths:
+            self._legal_paths[key] = self._create_legal_path(src)
+        return self._legal_paths[key]
+
+    @abc.abstractmethod
+    def _create_legal_path(self, src):
+        """
+        :rtype LegalPath
+        """
+        return LegalPath()
 
     def is_done(self):
         return len(self._src_dst_pairs) == self._n_pairs
 
     def move_point(self, src, dst):
         assert not self.is_done()
-        builder = self.__class__()
+        builder = copy.copy(self)
+        builder._legal_paths = {}
         projected_dst = self.legal_path(src).project_point(dst)
-        builder._src_dst_pairs = self._src_dst_pairs + [SrcDst(src=src, dst=projected_dst)]
+        builder._src_dst_pairs = self._src_dst_pairs.append(SrcDst(src=src, dst=projected_dst))
         return builder
 
     def sources(self):
         return [sd.src for sd in self._src_dst_pairs]
 
+    def preview_transformation(self, src, dst):
+        builder = self.move_point(src, dst)
+        if builder.is_done():
+            return builder.get_transformation()
+        # Not all the pairs are there yet, preview the most general transformation the existing ones determine.
+        fit = preview_fit(len(builder._src_dst_pairs))
+        return ProjectiveTransformation(numpy.matrix(fit(*builder.pairs_arrays())))
+
+    def pairs_arrays(self):
+        """
+        :return: src and dst arrays of shape (2, N), one column per pair.
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        src = points_to_array([sd.src for sd in self._src_dst_pairs]).T
+        dst = points_to_array([sd.dst for sd in self._src_dst_pairs]).T
+        return src, dst
+
 
 class TranslationBuilder(MultiSrcDstBuilder):
     def __init__(self):
         super(TranslationBuilder, self).__init__(1)
 
-    def legal_path(self, src):
+    def _create_legal_path(self, src):
         return AllLegalPath()
 
     def get_transformation(self):
         assert self.is_done()
-        shift = self._src_dst_pairs[0].dst - self._src_dst_pairs[0].src
-        return TranslationTransformation(shift.x(), shift.y())
+        m = solvers.fit_translation(*self.pairs_arrays())
+        return TranslationTransformation(m[0, 2], m[1, 2])
 
 
 class RigidBuilder(MultiSrcDstBuilder):
     def __init__(self):
         super(RigidBuilder, self).__init__(2)
 
-    def legal_path(self, src):
+    def _create_legal_path(self, src):
         if len(self._src_dst_pairs) == 0:
             return AllLegalPath()
         else:
@@ -96,45 +156,209 @@ class RigidBuilder(MultiSrcDstBuilder):
 
     def get_transformation(self):
         assert self.is_done()
-        sd1, sd2 = self._src_dst_pairs
-        t1 = sd1.dst - sd1.src
-        theta = angle(sd1.src, sd2.src) - angle(sd1.dst, sd2.dst)
-        R_theta = numpy.matrix([
-            [math.cos(theta), -math.sin(theta), 0],
-            [math.sin(theta), math.cos(theta), 0],
-            [0, 0, 1.0]])
-        c = t1 - sd1.dst
-        t = R_theta * numpy.matrix([[c.x()], [c.y()], [0]]) + numpy.matrix([[sd1.dst.x()], [sd1.dst.y()], [0]])
-        t_point = QtCore.QPoint(t[0, 0], t[1, 0])
-        return RigidTransformation(theta, t_point)
-
-
-class EquationSystem(object):
-    def __init__(self, n_rows, n_columns):
-        self._eqs = []
-        self._b = []
-        self._n_columns = n_columns
-        self._n_rows = n_rows
-
-    def index(self, i, j):
-        return i * self._n_columns + j
-
-    def add_equation(self, index_coef_pairs, b_value):
-        self._b.append(b_value)
-        self._eqs.append(self._create_eq(index_coef_pairs))
-
-    def _create_eq(self, index_coef):
-        res = [0] * self._n_columns * self._n_rows
-        for index, coef in index_coef:
-            res[index] = coef
-        return res
+        m = solvers.fit_rigid(*self.pairs_arrays())
+        theta = math.atan2(m[1, 0], m[0, 0])
+        return RigidTransformation(theta, Point(m[0, 2], m[1, 2]))
+
+
+# Pairs added together, (2, N) src and dst arrays and their (N,) weights.
+PairBlock = namedtuple('PairBlock', ['src', 'dst', 'weights'])
+
+
+class LeastSquaresBuilder(TransformationBuilder):
+    """
+    Accepts any number of (weighted) src/dst pairs and fits them in the least squares sense.
+    The pairs are kept in a PersistentList of blocks, one per add_pairs call, shared with the builders this one
+    was derived from. For the fits with linear systems (see solvers.NORMAL_EQUATIONS_SIZES) the normal equations
+    are updated as pairs are added, moved or removed instead of fitting all the pairs again. With N pairs in B
+    blocks:
+      * add_pairs of k pairs is O(k).
+      * move_pair and remove_pair of a pair in block b are O(B - b): the list is walked back to the block and the
+        blocks added after it are copied. Updating the normal equations is O(1).
+      * preview_transformation and get_transformation are O(1), solved from the accumulated system - the same
+        one, so releasing the dragged pair does not move the previewed result. The other fits are O(N).
+      * sources and pairs_arrays concatenate the N pairs, once per builder.
+    """
+
+    def __init__(self, fit=solvers.fit_affine):
+        """
+        :param fit: one of the `solvers.fit_*` functions.
+        """
+        self._fit = fit
+        self._blocks = PersistentList()
+        self._n_pairs = 0
+        self._normal_equations = solvers.NormalEquations(fit) if fit in solvers.NORMAL_EQUATIONS_SIZES else None
+        self._arrays = None
 
-    def get_solution(self):
-        assert len(self._eqs) == self._n_columns * self._n_rows
-        m = numpy.matrix(self._eqs)
-        b = numpy.matrix(self._b).T
-        matrix = numpy.linalg.solve(m, b)
-        return matrix.T.tolist()[0]
+    def _derived(self, blocks, n_pairs, removed=None, added=None):
+        """
+        :param removed: PairBlock no longer fitted
+        :param added: PairBlock fitted from now on
+        :rtype: LeastSquaresBuilder
+        """
+        builder = copy.copy(self)
+        builder._blocks = blocks
+        builder._n_pairs = n_pairs
+        builder._arrays = None
+        if self._normal_equations is not None:
+            builder._normal_equations = self._normal_equations.copy()
+            if removed is not None:
+                builder._normal_equations.add(removed.src, removed.dst, -removed.weights)
+            if added is not None:
+                builder._normal_equations.add(added.src, added.dst, added.weights)
+        return builder
+
+    def add_pairs(self, src, dst, weights=None):
+        """
+        :param src: (2, N) array
+        :param dst: (2, N) array
+        :param weights: (N,) array, defaults to ones.
+        :rtype: LeastSquaresBuilder
+        """
+        src = numpy.asarray(src, dtype=numpy.float64).reshape(2, -1)
+        dst = numpy.asarray(dst, dtype=numpy.float64).reshape(2, -1)
+        if weights is None:
+            weights = numpy.ones(src.shape[1])
+        block = PairBlock(src, dst, numpy.asarray(weights, dtype=numpy.float64).reshape(-1))
+        return self._derived(self._blocks.append(block), self._n_pairs + src.shape[1], added=block)
+
+    def _locate(self, i):
+        """
+        :return: the index of the block of pair i, the block and the column of the pair in it.
+        """
+        if not 0 <= i < self._n_pairs:
+            raise IndexError(i)
+        end = self._n_pairs
+        for block_index, block in self._blocks.reversed_items():
+            start = end - block.src.shape[1]
+            if i >= start:
+                return block_index, block, i - start
+            end = start
+
+    @staticmethod
+    def _column(block, j):
+        return PairBlock(block.src[:, j:j + 1], block.dst[:, j:j + 1], block.weights[j:j + 1])
+
+    def move_pair(self, i, src, dst):
+        """
+        :type src: Point
+        :type dst: Point
+        :rtype: LeastSquaresBuilder
+        """
+        block_index, block, j = self._locate(i)
+        moved = PairBlock(block.src.copy(), block.dst.copy(), block.weights)
+        moved.src[:, j] = src.x(), src.y()
+        moved.dst[:, j] = dst.x(), dst.y()
+        return self._derived(self._blocks.replace(block_index, moved), self._n_pairs,
+                             self._column(block, j), self._column(moved, j))
+
+    def remove_pair(self, i):
+        """
+        :rtype: LeastSquaresBuilder
+        """
+        block_index, block, j = self._locate(i)
+        if block.src.shape[1] == 1:
+            blocks = self._blocks.remove(block_index)
+        else:
+            blocks = self._blocks.replace(block_index, PairBlock(numpy.delete(block.src, j, axis=1),
+                                                                 numpy.delete(block.dst, j, axis=1),
+                                                                 numpy.delete(block.weights, j)))
+        return self._derived(blocks, self._n_pairs - 1, removed=self._column(block, j))
+
+    def preview_transformation(self, src, dst):
+        if self._n_pairs + 1 < solvers.MIN_PAIRS[self._fit]:
+            return None
+        extra_src = numpy.array([[src.x()], [src.y()]])
+        extra_dst = numpy.array([[dst.x()], [dst.y()]])
+        if self._normal_equations is None:
+            return self.add_pairs(extra_src, extra_dst).get_transformation()
+        # The accumulated system of the fixed pairs is shared by all the frames of the drag, only the dragged
+        # pair is added on top of it.
+        return ProjectiveTransformation(numpy.matrix(self._normal_equations.solve(extra_src, extra_dst)))
+
+    def move_point(self, src, dst):
+        return self.add_pairs([src.x(), src.y()], [dst.x(), dst.y()])
+
+    def legal_path(self, src):
+        return AllLegalPath()
+
+    def is_done(self):
+        return self._n_pairs >= solvers.MIN_PAIRS[self._fit]
+
+    def sources(self):
+        return [Point(x, y) for x, y in self.pairs_arrays()[0].T]
+
+    def weighted_pairs_arrays(self):
+        """
+        :return: (2, N) src and dst arrays and the (N,) weights, concatenated once per builder.
+        """
+        if self._arrays is None:
+            blocks = list(self._blocks)
+            if blocks:
+                self._arrays = tuple(numpy.concatenate(parts, axis=-1) for parts in zip(*blocks))
+            else:
+                self._arrays = numpy.zeros((2, 0)), numpy.zeros((2, 0)), numpy.zeros(0)
+        return self._arrays
+
+    def pairs_arrays(self):
+        return self.weighted_pairs_arrays()[:2]
+
+    def get_transformation(self):
+        assert self.is_done()
+        if self._normal_equations is not None:
+            return ProjectiveTransformation(numpy.matrix(self._normal_equations.solve()))
+        return ProjectiveTransformation(numpy.matrix(self._fit(*self.weighted_pairs_arrays())))
+
+
+class RobustBuilder(LeastSquaresBuilder):
+    """
+    Least squares fit of the inliers found by RANSAC or LMedS.
+    """
+
+    def __init__(self, fit=solvers.fit_affine, method=robust.RANSAC, threshold=3., n_hypotheses=500, executor=None):
+        """
+        :param executor: optional `concurrent.futures.Executor` to spread the hypotheses over,
+                         see `robust.process_pool`.
+        """
+        super(RobustBuilder, self).__init__(fit)
+        self._method = method
+        self._threshold = threshold
+        self._n_hypotheses = n_hypotheses
+        self._executor = executor
+        self.inliers = None
+
+    def get_transformation(self):
+        """
+        Waits for the fit, see transformation_future for callers that must not.
+        """
+        assert self.is_done()
+        src, dst, weights = self.weighted_pairs_arrays()
+        matrix, self.inliers = robust.robust_fit(self._fit, src, dst, self._method, self._threshold,
+                                                 self._n_hypotheses, executor=self._executor, weights=weights)
+        return ProjectiveTransformation(numpy.matrix(matrix))
+
+    def transformation_future(self):
+        """
+        Starts the fit on the executor, or on robust.background_executor() if there is none, and returns at once.
+        :return: future of the transformation. The inliers are set before it is done.
+        :rtype: concurrent.futures.Future
+        """
+        from concurrent.futures import Future
+        assert self.is_done()
+        src, dst, weights = self.weighted_pairs_arrays()
+        fitted = robust.robust_fit_async(self._fit, src, dst, self._method, self._threshold, self._n_hypotheses,
+                                         executor=self._executor, weights=weights)
+        res = Future()
+
+        def done(f):
+            try:
+                matrix, self.inliers = f.result()
+                res.set_result(ProjectiveTransformation(numpy.matrix(matrix)))
+            except Exception as e:
+                res.set_exception(e)
+
+        fitted.add_done_callback(done)
+        return res
 
 
 class SimilarityBuilder(MultiSrcDstBuilder):
@@ -143,30 +367,11 @@ class SimilarityBuilder(MultiSrcDstBuilder):
 
     def get_transformation(self):
         assert self.is_done()
-        system = EquationSystem(3, 3)
-        for sd in self._src_dst_pairs:
-            for i, value in enumerate([sd.dst.x(), sd.dst.y()]):
-                index_coef = [(system.index(i, 0), sd.src.x()), (system.index(i, 1), sd.src.y()),
-                              (system.index(i, 2), 1)]
-                system.add_equation(index_coef, value)
-        system.add_equation([(system.index(0, 0), 1), (system.index(1, 1), -1)], 0)
-        system.add_equation([(system.index(0, 1), 1), (system.index(1, 0), 1)], 0)
-        system.add_equation([(system.index(2, 0), 1)], 0)
-        system.add_equation([(system.index(2, 1), 1)], 0)
-        system.add_equation([(system.index(2, 2), 1)], 1)
-
-        solution = system.get_solution()
-        a = solution[system.index(0, 0)]
-        b = solution[system.index(1, 0)]
-        tx = solution[system.index(0, 2)]
-        ty = solution[system.index(1, 2)]
-        # m = numpy.solution(numpy.zeros((3, 3)))
-        # for i in xrange(3):
-        #     for j in xrange(3):
-        #         m[i, j] = solution[self._index(i, j)]
+        m = solvers.fit_similarity(*self.pairs_arrays())
+        a, b, tx, ty = m[0, 0], m[1, 0], m[0, 2], m[1, 2]
         return SimilarityTransformation(a, b, tx, ty)
 
-    def legal_path(self, src):
+    def _create_legal_path(self, src):
         return AllLegalPath()
 
 
@@ -176,28 +381,156 @@ class AffineBuilder(MultiSrcDstBuilder):
 
     def get_transformation(self):
         assert self.is_done()
-        system = EquationSystem(3, 3)
-        for sd in self._src_dst_pairs:
-            for i, value in enumerate([sd.dst.x(), sd.dst.y()]):
-                index_coef = [(system.index(i, 0), sd.src.x()), (system.index(i, 1), sd.src.y()),
-                              (system.index(i, 2), 1)]
-                system.add_equation(index_coef, value)
-        system.add_equation([(system.index(2, 0), 1)], 0)
-        system.add_equation([(system.index(2, 1), 1)], 0)
-        system.add_equation([(system.index(2, 2), 1)], 1)
-
-        solution = system.get_solution()
-        a00 = solution[system.index(0, 0)]
-        a01 = solution[system.index(0, 1)]
-        a02 = solution[system.index(0, 2)]
-        a10 = solution[system.index(1, 0)]
-        a11 = solution[system.index(1, 1)]
-        a12 = solution[system.index(1, 2)]
+        m = solvers.fit_affine(*self.pairs_arrays())
+        a00, a01, a02 = m[0]
+        a10, a11, a12 = m[1]
         return AffineTransformation(a00, a01, a02, a10, a11, a12)
 
+    def _create_legal_path(self, src):
+        return AllLegalPath()
+
+
+class ProjectiveBuilder(MultiSrcDstBuilder):
+    """
+    Homography from 4 or more pairs, fitted by the normalized DLT.
+    """
+
+    def __init__(self, n_pairs=4):
+        assert n_pairs >= 4
+        super(ProjectiveBuilder, self).__init__(n_pairs)
+
+    def get_transformation(self):
+        assert self.is_done()
+        return ProjectiveTransformation(numpy.matrix(solvers.fit_projective(*self.pairs_arrays())))
+
+    def _create_legal_path(self, src):
+        return AllLegalPath()
+
+
+class BilinearBuilder(MultiSrcDstBuilder):
+    def __init__(self):
+        super(BilinearBuilder, self).__init__(4)
+
+    def get_transformation(self):
+        assert self.is_done()
+        return BilinearTransformation.from_pairs(*self.pairs_arrays())
+
+    def _create_legal_path(self, src):
+        return AllLegalPath()
+
+
+class ThinPlateSplineBuilder(TransformationBuilder):
+    """
+    Smooth warp through any number of pairs, so it is done only once finish is called. The spline is solved once,
+    when the pairs first determine it, and then handed down the builders derived from this one: adding a pair,
+    moving one or previewing one updates it instead of solving the kernel system again.
+    """
+    MIN_PAIRS = 3
+
+    def __init__(self, regularization=0.):
+        self._regularization = regularization
+        self._src = numpy.zeros((2, 0))
+        self._dst = numpy.zeros((2, 0))
+        # None until the pairs determine a spline, e.g. with fewer than MIN_PAIRS of them or all on one line.
+        self._spline = None
+        self._finished = False
+
+    def _solved(self):
+        """
+        Solves the spline of the pairs when there is none yet.
+        """
+        if self._spline is None and self._src.shape[1] >= self.MIN_PAIRS:
+            try:
+                self._spline = ThinPlateSpline(self._src, self._dst, self._regularization)
+            except numpy.linalg.LinAlgError:
+                pass
+        return self
+
+    def add_pairs(self, src, dst):
+        """
+        :param src: (2, N) array
+        :param dst: (2, N) array
+        :rtype: ThinPlateSplineBuilder
+        """
+        src = numpy.asarray(src, dtype=numpy.float64).reshape(2, -1)
+        dst = numpy.asarray(dst, dtype=numpy.float64).reshape(2, -1)
+        builder = copy.copy(self)
+        builder._src = numpy.hstack([self._src, src])
+        builder._dst = numpy.hstack([self._dst, dst])
+        if self._spline is None:
+            return builder._solved()
+        for (x, y), (u, v) in zip(src.T, dst.T):
+            builder._spline = builder._spline.add_control(Point(x, y), Point(u, v))
+        return builder
+
+    def move_destination(self, i, dst):
+        """
+        :param dst: the new destination of pair i
+        :type dst: Point
+        :rtype: ThinPlateSplineBuilder
+        """
+        builder = copy.copy(self)
+        builder._dst = self._dst.copy()
+        builder._dst[:, i] = dst.x(), dst.y()
+        if self._spline is not None:
+            builder._spline = self._spline.move_destination(i, dst)
+        return builder
+
+    def move_source(self, i, src):
+        """
+        :param src: the new source of pair i
+        :type src: Point
+        :rtype: ThinPlateSplineBuilder
+        """
+        builder = copy.copy(self)
+        builder._src = self._src.copy()
+        builder._src[:, i] = src.x(), src.y()
+        if self._spline is None:
+            return builder._solved()
+        builder._spline = self._spline.move_source(i, src)
+        return builder
+
+    def preview_transformation(self, src, dst):
+        """
+        The spline with the dragged pair added to the one solved for the fixed pairs, None while they do not
+        determine one.
+        """
+        return self.move_point(src, dst)._spline
+
+    def move_point(self, src, dst):
+        return self.add_pairs([src.x(), src.y()], [dst.x(), dst.y()])
+
     def legal_path(self, src):
         return AllLegalPath()
 
+    def finish(self):
+        """
+        :return: this builder, done if it has MIN_PAIRS pairs or more.
+        :rtype: ThinPlateSplineBuilder
+        """
+        builder = copy.copy(self)
+        builder._finished = True
+        return builder
+
+    def is_done(self):
+        return self._finished and self._src.shape[1] >= self.MIN_PAIRS
+
+    def sources(self):
+        return [Point(x, y) for x, y in self._src.T]
+
+    def pairs_arrays(self):
+        return self._src, self._dst
+
+    def get_transformation(self):
+        """
+        :raise numpy.linalg.LinAlgError: when the sources are all on one line.
+        """
+        assert self.is_done()
+        if self._spline is None:
+            # Raises what _solved swallowed.
+            return ThinPlateSpline(self._src, self._dst, self._regularization)
+        return self._spline
+
 
 def angle(p1, p2):
     if p1.y() == p2.y():
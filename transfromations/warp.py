@@ -0,0 +1,114 @@
+"""
+Raster warping driven by the transformations.
+
+Every output pixel is mapped back through the inverse transformation and sampled from the source
+image, a tile at a time. The work of a tile is a handful of large numpy operations which release
+the GIL, so tiles run in parallel on a thread pool.
+"""
+import numpy
+
+NEAREST = 'nearest'
+BILINEAR = 'bilinear'
+
+DEFAULT_TILE_SIZE = 256
+
+
+def thread_pool(max_workers=None):
+    """
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    import multiprocessing
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=max_workers or multiprocessing.cpu_count())
+
+
+def sample(image, x, y, interpolation=BILINEAR):
+    """
+    :param image: (H, W) or (H, W, C) array. Pixel (i, j) covers the square [j, j + 1) x [i, i + 1).
+    :param x: array of source x coordinates
+    :param y: array of source y coordinates, same shape as x
+    :return: array of shape x.shape + image.shape[2:], zero outside the image.
+    """
+    height, width = image.shape[:2]
+    # Pixel centers are at half integers.
+    x = x - 0.5
+    y = y - 0.5
+    if interpolation == NEAREST:
+        j = numpy.floor(x + 0.5).astype(numpy.intp)
+        i = numpy.floor(y + 0.5).astype(numpy.intp)
+        inside = (i >= 0) & (i < height) & (j >= 0) & (j < width)
+        res = image[numpy.clip(i, 0, height - 1), numpy.clip(j, 0, width - 1)]
+    else:
+        j0 = numpy.floor(x)
+        i0 = numpy.floor(y)
+        fx = x - j0
+        fy = y - i0
+        j0 = j0.astype(numpy.intp)
+        i0 = i0.astype(numpy.intp)
+        inside = (i0 >= -1) & (i0 < height) & (j0 >= -1) & (j0 < width)
+        j1 = numpy.clip(j0 + 1, 0, width - 1)
+        i1 = numpy.clip(i0 + 1, 0, height - 1)
+        j0 = numpy.clip(j0, 0, width - 1)
+        i0 = numpy.clip(i0, 0, height - 1)
+        if image.ndim == 3:
+            fx = fx[..., None]
+            fy = fy[..., None]
+        top = image[i0, j0] * (1 - fx) + image[i0, j1] * fx
+        bottom = image[i1, j0] * (1 - fx) + image[i1, j1] * fx
+        res = top * (1 - fy) + bottom * fy
+        if numpy.issubdtype(image.dtype, numpy.integer):
+            # Rounded, casting alone would truncate the interpolated values.
+            res = numpy.rint(res)
+    if image.ndim == 3:
+        inside = inside[..., None]
+    return numpy.where(inside, res, 0).astype(image.dtype)
+
+
+def warp_tile(image, transformation, origin, scale, rows, columns, interpolation):
+    """
+    :param transformation: its inverse maps output scene points back to source image coordinates.
+    :param rows: (first, last) output rows of the tile, last excluded.
+    :param columns: (first, last) output columns of the tile, last excluded.
+    :return: the tile array
+    """
+    ys = origin[1] + (numpy.arange(*rows) + 0.5) / scale
+    xs = origin[0] + (numpy.arange(*columns) + 0.5) / scale
+    grid_x, grid_y = numpy.meshgrid(xs, ys)
+    points = numpy.column_stack([grid_x.ravel(), grid_y.ravel()])
+    with numpy.errstate(all='ignore'):
+        source = transformation.inverse_transform_points(points)
+    source[~numpy.isfinite(source)] = -1
+    shape = grid_x.shape
+    return sample(image, source[:, 0].reshape(shape), source[:, 1].reshape(shape), interpolation)
+
+
+def warp_image(image, transformation, output_shape, origin=(0., 0.), scale=1., interpolation=BILINEAR,
+               tile_size=DEFAULT_TILE_SIZE, executor=None):
+    """
+    Renders the image, placed at the scene origin with one unit per pixel, after the transformation.
+    :param image: (H, W) or (H, W, C) array
+    :param transformation: must implement inverse(); projective, bilinear and thin plate spline ones do.
+    :type transformation: Transformation
+    :param output_shape: (rows, columns) of the result.
+    :param origin: the scene point at the top left corner of the result.
+    :param scale: output pixels per scene unit (the zoom level).
+    :param executor: optional `concurrent.futures` executor the tiles are spread over, see thread_pool.
+    :return: array of shape output_shape + image.shape[2:]
+    """
+    image = numpy.asarray(image)
+    # Computes (and caches) the inverse before the tiles share it.
+    transformation.inverse()
+    n_rows, n_columns = output_shape
+    res = numpy.zeros(tuple(output_shape) + image.shape[2:], dtype=image.dtype)
+    tiles = [((r, min(r + tile_size, n_rows)), (c, min(c + tile_size, n_columns)))
+             for r in range(0, n_rows, tile_size) for c in range(0, n_columns, tile_size)]
+    if executor is None:
+        results = [warp_tile(image, transformation, origin, scale, rows, columns, interpolation)
+                   for rows, columns in tiles]
+    else:
+        futures = [executor.submit(warp_tile, image, transformation, origin, scale, rows, columns, interpolation)
+                   for rows, columns in tiles]
+        results = [f.result() for f in futures]
+    for ((r0, r1), (c0, c1)), tile in zip(tiles, results):
+        res[r0:r1, c0:c1] = tile
+    return res
@@ -101,6 +101,9 @@ class Ui_DockWidget(object):
         self.bilinear_interpolant = QtGui.QRadioButton(self.scrollAreaWidgetContents)
         self.bilinear_interpolant.setObjectName(_fromUtf8("bilinear_interpolant"))
         self.buttons_layout.addWidget(self.bilinear_interpolant)
+        self.thin_plate_spline = QtGui.QRadioButton(self.scrollAreaWidgetContents)
+        self.thin_plate_spline.setObjectName(_fromUtf8("thin_plate_spline"))
+        self.buttons_layout.addWidget(self.thin_plate_spline)
         self.horizontalLayout.addLayout(self.buttons_layout)
         self.scrollArea.setWidget(self.scrollAreaWidgetContents)
         self.gridLayout.addWidget(self.scrollArea, 0, 0, 1, 1)
@@ -118,4 +121,5 @@ class Ui_DockWidget(object):
         self.affine.setText(_translate("DockWidget", "Affine", None))
         self.projective.setText(_translate("DockWidget", "Projective", None))
         self.bilinear_interpolant.setText(_translate("DockWidget", "Bilinear Interpolant", None))
+        self.thin_plate_spline.setText(_translate("DockWidget", "Thin Plate Spline", None))
 
@@ -1,11 +1,22 @@
 import abc
+import contextlib
 import functools
+import json
 
+import numpy
+
+from shapes.geometry_store import GeometryStore
+from shapes.history import TransformationHistory
+from shapes.image_layer import WarpedImageLayer
 from shapes.shapes import RectangleItem, PointItem, PolygonItem
-from transfromations.transformations_builders import TranslationBuilder, RigidBuilder, SimilarityBuilder, AffineBuilder
+from shapes.vertex_index import VertexIndex
+from transfromations.linear_transformations import ProjectiveTransformation
+from transfromations.transformations_builders import TranslationBuilder, RigidBuilder, SimilarityBuilder, AffineBuilder, \
+    BilinearBuilder, ProjectiveBuilder, ThinPlateSplineBuilder
 from utils.my_qt import *
 from dock import Ui_DockWidget as Dock
 import sys
+import time
 
 
 L_SPOTS = [QtCore.Qt.LeftDockWidgetArea, QtCore.Qt.RightDockWidgetArea, QtCore.Qt.BottomDockWidgetArea,
@@ -36,21 +47,65 @@ def update_layout(form, new_area):
 
 
 class PolygonFinder(object):
-    def __init__(self, scene):
+    def __init__(self, vertex_index, polygon_of_vertex, radius=8, before_query=None, pickable=None):
         """
 
-        :param scene:
-        :type scene: QtGui.QGraphicsScene
+        :param vertex_index:
+        :type vertex_index: VertexIndex
+        :param polygon_of_vertex: maps a vertex id to its (PolygonItem, vertex index in the polygon).
+        :param radius: how far from a vertex a click still picks it.
+        :param before_query: called with the scene rectangle about to be queried, e.g. to bring the index up to date
+                             there, see RectanglesDAST.materialize_in_rect.
+        :param pickable: tells whether the handles can be picked now, e.g. RectanglesDAST.handles_visible - the
+                         handles of a view zoomed too far out are hidden and must not be dragged either.
         :return:
         """
-        self._scene = scene
+        self._vertex_index = vertex_index
+        self._polygon_of_vertex = polygon_of_vertex
+        self._radius = radius
+        self._before_query = before_query
+        self._pickable = pickable
 
     def has_point_at(self, pos):
-        item = self._scene.itemAt(pos)
-        return item is not None and isinstance(item, PointItem) and isinstance(item.get_owner(), PolygonItem)
+        return self.point_at(pos) is not None
 
     def point_at(self, pos):
-        return self._scene.itemAt(pos)
+        """
+        :return: the handle of the polygon vertex nearest to pos, created on demand, or None.
+        :rtype: PointItem
+        """
+        if self._pickable is not None and not self._pickable():
+            return None
+        vertex = self.nearest_vertex(pos, self._radius)
+        if vertex is None:
+            return None
+        polygon, i = vertex
+        return polygon.handle(i)
+
+    def nearest_vertex(self, pos, max_radius):
+        """
+        :param pos:
+        :type pos: QtCore.QPointF
+        :return: (PolygonItem, vertex index in the polygon) or None.
+        """
+        if self._before_query is not None:
+            self._before_query(QtCore.QRectF(pos.x() - max_radius, pos.y() - max_radius, 2 * max_radius, 2 * max_radius))
+        vertex_id = self._vertex_index.nearest_vertex(pos.x(), pos.y(), max_radius)
+        if vertex_id is None:
+            return None
+        return self._polygon_of_vertex(vertex_id)
+
+    def vertices_in_rect(self, rect):
+        """
+        :param rect:
+        :type rect: QtCore.QRectF
+        :return: list of (PolygonItem, vertex index in the polygon).
+        """
+        rect = rect.normalized()
+        if self._before_query is not None:
+            self._before_query(rect)
+        ids = self._vertex_index.vertices_in_rect(rect.left(), rect.top(), rect.right(), rect.bottom())
+        return [self._polygon_of_vertex(vertex_id) for vertex_id in ids]
 
 
 class TempItemDrawer(object):
@@ -100,16 +155,38 @@ class HandlesMouseGUI(object):
         pass
 
 
+class FutureWatcher(QtCore.QObject):
+    """
+    Calls slot with a concurrent.futures.Future once it is done. The future completes on a worker thread, the
+    signal is queued to the thread of the watcher, so the slot runs on the GUI thread - and never before the
+    constructor returns, even for a future already done.
+    """
+    finished = QtCore.pyqtSignal(object)
+
+    def __init__(self, future, slot, parent=None):
+        super(FutureWatcher, self).__init__(parent)
+        self.future = future
+        self.finished.connect(slot, QtCore.Qt.QueuedConnection)
+        future.add_done_callback(self.finished.emit)
+
+
 class TransformerGUI(HandlesMouseGUI):
     MODE_DRAGGING = 'DRAG'
     MODE_WAIT_TO_SELECT = 'WAIT'
+    # The builder is done and its transformation is fitted in the background, see _fitted.
+    MODE_FITTING = 'FIT'
 
-    def __init__(self, polygon_finder, temp_items_drawer, transformation_builder_getter, scene_rect):
+    def __init__(self, polygon_finder, temp_items_drawer, transformation_builder_getter, scene_rect, live_preview=True,
+                 apply_transformation=None, report_error=None):
         """
         :param polygon_finder:
         :type polygon_finder: PolygonFinder
         :param temp_items_drawer:
         :type temp_items_drawer: TempItemDrawer
+        :param live_preview: whether to draw a ghost of the transformed polygon while dragging.
+        :param apply_transformation: called as apply_transformation(polygon, transformation) once the builder is
+                                     done, e.g. RectanglesDAST.transform_polygon. polygon.my_transform if None.
+        :param report_error: called with a message when a fit fails, written to stderr if None.
         :return:
         """
         super(TransformerGUI, self).__init__()
@@ -117,34 +194,42 @@ class TransformerGUI(HandlesMouseGUI):
         self._temp_items_drawer = temp_items_drawer
         self._transformation_builder_getter = transformation_builder_getter
         self._scene_rect = scene_rect
+        self._live_preview = live_preview
+        self._apply_transformation = apply_transformation
+        self._report_error = report_error
 
+        self._current_transformed_polygon = None
         self._init_drag()
 
     def mouseReleased(self, pos, scene_pos):
         if self._mode == self.MODE_DRAGGING:
-            legal = self._current_transformation_builder.legal_path(self._current_src_point.get_point())
+            legal = self._current_transformation_builder.legal_path(self._current_src_pos)
             projected = legal.project_point(scene_pos)
             assert not self._current_transformation_builder.is_done()
-            new_builder = self._current_transformation_builder.move_point(self._current_src_point.get_point(), projected)
-            if new_builder.is_done():
+            new_builder = self._current_transformation_builder.move_point(self._current_src_pos, projected)
+            if new_builder.is_done() and hasattr(new_builder, 'transformation_future'):
+                # Slow fits, e.g. RobustBuilder, must not block the event loop.
+                self._mode = self.MODE_FITTING
+                self._fitting = FutureWatcher(new_builder.transformation_future(), self._fitted)
+            elif new_builder.is_done():
                 self._mode = self.MODE_DISABLED
-                transformation = new_builder.get_transformation()
-                self._current_transformed_polygon.my_transform(transformation)
-                self._init_drag()
+                self._apply(new_builder.get_transformation())
             else:
                 self._mode = self.MODE_WAIT_TO_SELECT
                 self._current_transformation_builder = new_builder
                 self._current_dragged_item = None
                 self._current_src_point = None
+                self._current_src_pos = None
 
     def mousePressed(self, pos, scene_pos):
-        if self._polygon_finder.has_point_at(scene_pos):
-            point = self._polygon_finder.point_at(scene_pos)
+        point = self._polygon_finder.point_at(scene_pos)
+        if point is not None:
             polygon = point.get_owner()
             assert isinstance(point, PointItem)
             if self._mode == self.MODE_DISABLED:
                 self._current_transformation_builder = self._transformation_builder_getter()
                 self._current_transformed_polygon = polygon
+                polygon.set_editing(True)
                 self._start_dragging(point, polygon, scene_pos)
             elif self._mode == self.MODE_WAIT_TO_SELECT and polygon == self._current_transformed_polygon and \
                 point.get_point() not in self._current_transformation_builder.sources():
@@ -157,8 +242,58 @@ class TransformerGUI(HandlesMouseGUI):
             self._update_dragging(scene_pos)
 
     def reset(self):
+        if self._mode == self.MODE_FITTING:
+            self._mode = self.MODE_DISABLED
         self._init_drag()
 
+    def _apply(self, transformation):
+        if self._apply_transformation is None:
+            self._current_transformed_polygon.my_transform(transformation)
+        else:
+            self._apply_transformation(self._current_transformed_polygon, transformation)
+        self._init_drag()
+
+    def finish(self):
+        """
+        Applies the transformation of a builder taking any number of pairs, e.g. ThinPlateSplineBuilder, once the
+        user has added them all.
+        """
+        builder = self._current_transformation_builder
+        if self._mode != self.MODE_WAIT_TO_SELECT or not hasattr(builder, 'finish'):
+            return
+        builder = builder.finish()
+        if not builder.is_done():
+            self._report("Add more pairs before finishing the transformation.")
+            return
+        try:
+            transformation = builder.get_transformation()
+        except numpy.linalg.LinAlgError as e:
+            # E.g. sources all on one line, another pair may still fix it.
+            self._report("Could not fit the transformation: %s" % e)
+            return
+        self._mode = self.MODE_DISABLED
+        self._apply(transformation)
+
+    def _fitted(self, future):
+        if self._fitting is None or future is not self._fitting.future:
+            # Reset while fitting.
+            return
+        self._mode = self.MODE_DISABLED
+        try:
+            transformation = future.result()
+        except Exception as e:
+            # Raising from a slot would only reach the console, the polygon is left as it was.
+            self._init_drag()
+            self._report("Could not fit the transformation: %s" % e)
+            return
+        self._apply(transformation)
+
+    def _report(self, message):
+        if self._report_error is None:
+            sys.stderr.write(message + '\n')
+        else:
+            self._report_error(message)
+
     def _start_dragging(self, src_point_item, polygon, dst_point):
         """
         :param src_point_item:
@@ -169,6 +304,7 @@ class TransformerGUI(HandlesMouseGUI):
         :return:
         """
         self._current_src_point = src_point_item
+        self._current_src_pos = src_point_item.get_point()
         self._current_dragged_item = PointItem(dst_point.x(), dst_point.y(),
                                                QtGui.QColor(255, 0, 0), 4, None, src_point_item.get_text())
         self._temp_items_drawer.draw_temp_item(self._current_dragged_item)
@@ -176,16 +312,54 @@ class TransformerGUI(HandlesMouseGUI):
         self._update_dragging(dst_point)
 
     def _update_dragging(self, point):
-        legal = self._current_transformation_builder.legal_path(self._current_src_point.get_point())
+        legal = self._current_transformation_builder.legal_path(self._current_src_pos)
         projected = legal.project_point(point)
         self._current_dragged_item.move_to(projected)
         self._current_dragged_item.update()
+        if self._live_preview:
+            self._update_preview(projected)
+
+    def _update_preview(self, dst):
+        try:
+            transformation = self._current_transformation_builder.preview_transformation(self._current_src_pos, dst)
+        except numpy.linalg.LinAlgError:
+            # E.g. an affine preview of two pairs with collinear sources.
+            transformation = None
+        if transformation is None:
+            self._hide_preview()
+            return
+        if self._polygon_points is None:
+            self._polygon_points = self._current_transformed_polygon.points_array()
+        points = transformation.transform_points(self._polygon_points)
+        if not numpy.all(numpy.isfinite(points)):
+            # A degenerate fit, or a projective one that sends a vertex to infinity.
+            self._hide_preview()
+            return
+        if self._preview_item is None:
+            self._preview_item = QtGui.QGraphicsPolygonItem()
+            pen = QtGui.QPen(QtGui.QColor(255, 0, 0, 160))
+            pen.setStyle(QtCore.Qt.DashLine)
+            pen.setCosmetic(True)
+            self._preview_item.setPen(pen)
+            self._temp_items_drawer.draw_temp_item(self._preview_item)
+        self._preview_item.setPolygon(QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in points]))
+        self._preview_item.show()
+
+    def _hide_preview(self):
+        if self._preview_item is not None:
+            self._preview_item.hide()
 
     def _init_drag(self):
+        if self._current_transformed_polygon is not None:
+            self._current_transformed_polygon.set_editing(False)
         self._current_transformation_builder = None
         self._current_src_point = None
+        self._current_src_pos = None
         self._current_dragged_item = None
         self._current_transformed_polygon = None
+        self._polygon_points = None
+        self._preview_item = None
+        self._fitting = None
         self._temp_items_drawer.clear()
 
     def scene_rect_changed(self, new_rect):
@@ -193,18 +367,44 @@ class TransformerGUI(HandlesMouseGUI):
 
 
 class RectanglesDAST(object):
-    def __init__(self, scene):
+    def __init__(self, scene, lazy=True):
         """
         :param scene:
         :type scene: QtGui.QGraphicsScene
+        :param lazy: whether projective transformations are deferred - folded into each polygon's pending
+                     transformation and only written to the store when the vertices are needed, see materialize_all.
         :return:
         """
         self._scene = scene
         self._items = []
         self._temp_items = []
+        self._store = GeometryStore()
+        self._image_layers = []
+        self._polygons = {}
+        self._vertex_index = VertexIndex()
+        self._store.add_listener(self._vertex_index.update)
+        self._handles_visible = True
+        self._selection = []
+        self._history = TransformationHistory(self._store)
+        self._lazy = lazy
+        # Store indices of the polygons with a pending transformation, their store rows and vertex index entries lag.
+        self._pending = set()
+        # The transformations of the image layers after each step of the history, they are not in the store.
+        self._layer_states = [[]]
+        # The last transformation applied to polygons, for transform_image_layers.
+        self._last_transformation = None
 
     def finder(self):
-        return PolygonFinder(self._scene)
+        return PolygonFinder(self._vertex_index, self.polygon_of_vertex, before_query=self.materialize_in_rect,
+                             pickable=self.handles_visible)
+
+    def polygon_of_vertex(self, vertex_id):
+        """
+        :param vertex_id: row in the geometry store
+        :return: (PolygonItem, vertex index in the polygon)
+        """
+        polygon_index, i = self._store.polygon_of(vertex_id)
+        return self._polygons[polygon_index], i
 
     def creator(self):
         return RectanglesCreator(self)
@@ -213,12 +413,242 @@ class RectanglesDAST(object):
         return TempItemDrawer(self._scene)
 
     def transform_all(self, transformation):
-        pass
+        """
+        Transforms every polygon in one pass. The scene index is rebuilt once at the end instead of per item.
+        :param transformation:
+        :type transformation: Transformation
+        """
+        self._last_transformation = transformation
+        self._layer_states[self._history.position()] = self._current_layer_states()
+        self._transform_layers(transformation)
+        polygons = self._polygons.values()
+        if self._lazy and isinstance(transformation, ProjectiveTransformation):
+            self._defer(polygons, transformation, None)
+            return
+        with self._index_disabled():
+            # All the polygons live in self._store, so one call transforms every vertex in place.
+            for polygon in polygons:
+                polygon.bake_transform()
+            self._pending.clear()
+            self._history.record(transformation)
+            self._store.transform(transformation)
+            PolygonItem.geometries_changed(list(polygons))
+            self._store.scene_rows_changed(numpy.arange(self._store.n_points()))
+        self._recorded()
+
+    def transform_polygons(self, polygons, transformation):
+        """
+        Transforms the vertices of all the polygons with one vectorized call, then updates the scene once.
+        :type polygons: list[PolygonItem]
+        :type transformation: Transformation
+        """
+        self._last_transformation = transformation
+        stored = [p for p in polygons if p.store() is self._store]
+        for polygon in polygons:
+            if polygon.store() is not self._store:
+                polygon.my_transform(transformation)
+        if not stored:
+            return
+        indices = [p.store_index() for p in stored]
+        if self._lazy and isinstance(transformation, ProjectiveTransformation):
+            self._defer(stored, transformation, indices)
+            return
+        self._layer_states[self._history.position()] = self._current_layer_states()
+        with self._index_disabled():
+            for polygon in stored:
+                polygon.bake_transform()
+            self._pending.difference_update(indices)
+            self._history.record(transformation, indices)
+            rows = self._store.transform_polygons(indices, transformation)
+            PolygonItem.geometries_changed(stored)
+            self._store.scene_rows_changed(rows)
+        self._recorded()
+
+    def transform_polygon(self, polygon, transformation):
+        """
+        Transforms the whole selection when polygon belongs to it, only polygon otherwise.
+        """
+        if polygon in self._selection:
+            self.transform_polygons(self._selection, transformation)
+        else:
+            self.transform_polygons([polygon], transformation)
+
+    def last_transformation(self):
+        """
+        :return: the last transformation applied to polygons, None before the first.
+        :rtype: Transformation
+        """
+        return self._last_transformation
+
+    def transform_image_layers(self, transformation):
+        """
+        Warps the image layers, e.g. by the last transformation fitted on the polygons, which stay where they are.
+        It is a step of the history, undone like the others.
+        """
+        self._layer_states[self._history.position()] = self._current_layer_states()
+        self._transform_layers(transformation)
+        self._history.record(transformation, [])
+        self._recorded()
+
+    def _transform_layers(self, transformation):
+        for layer in self._image_layers:
+            layer.my_transform(transformation)
+            for view in self._scene.views()[:1]:
+                layer.update_view(view)
+
+    def _defer(self, polygons, transformation, indices):
+        """
+        The lazy path of the transformations: one matrix product per polygon, no vertex is moved.
+        :param indices: the store indices of the polygons, None for all of them.
+        """
+        self._layer_states[self._history.position()] = self._current_layer_states()
+        with self._index_disabled():
+            for polygon in polygons:
+                polygon.defer_transform(transformation)
+            self._history.record(transformation, indices)
+        self._pending.update(p.store_index() for p in polygons)
+        # Their vertices are no longer where the index has them, they are found again once materialized.
+        if indices is None:
+            self._vertex_index.remove(numpy.arange(self._store.n_points()))
+        else:
+            self._vertex_index.remove(self._store.rows(indices))
+        self._recorded()
+
+    def materialize_in_rect(self, rect):
+        """
+        Writes the pending transformations of the polygons reaching into the scene rectangle to the store, so
+        their vertices can be hit tested there. Qt finds them from their transformed bounding rects.
+        :type rect: QtCore.QRectF
+        """
+        if not self._pending:
+            return
+        for item in self._scene.items(rect):
+            if isinstance(item, PolygonItem) and item.store() is self._store and item.store_index() in self._pending:
+                item.bake_transform()
+                self._pending.discard(item.store_index())
+
+    def materialize_all(self):
+        """
+        Writes every pending transformation to the store, e.g. before exporting the vertices.
+        """
+        for i in self._pending:
+            self._polygons[i].bake_transform()
+        self._pending.clear()
+
+    def polygons_arrays(self):
+        """
+        :return: list of (N, 2) arrays of the vertices of every polygon in scene coordinates, in creation order.
+        """
+        self.materialize_all()
+        return [self._polygons[i].points_array() for i in sorted(self._polygons)]
+
+    @contextlib.contextmanager
+    def _index_disabled(self):
+        """
+        Turns the scene index off while many items move, so it is rebuilt once instead of per item.
+        """
+        index_method = self._scene.itemIndexMethod()
+        self._scene.setItemIndexMethod(QtGui.QGraphicsScene.NoIndex)
+        try:
+            yield
+        finally:
+            self._scene.setItemIndexMethod(index_method)
+        self._scene.update()
+
+    def _current_layer_states(self):
+        return [(layer, layer.transformation()) for layer in self._image_layers]
+
+    def _recorded(self):
+        position = self._history.position()
+        del self._layer_states[position:]
+        self._layer_states.append(self._current_layer_states())
+
+    def history(self):
+        """
+        :rtype: TransformationHistory
+        """
+        return self._history
+
+    def undo(self):
+        if self._history.can_undo():
+            self.jump_to(self._history.position() - 1)
+
+    def redo(self):
+        if self._history.can_redo():
+            self.jump_to(self._history.position() + 1)
+
+    def jump_to(self, position):
+        """
+        Undoes or redoes transformations until `position` of them are applied, see TransformationHistory.
+        """
+        # The history moves the stored vertices, they must hold the scene coordinates first.
+        self.materialize_all()
+        with self._index_disabled():
+            rows = self._history.jump_to(position)
+            PolygonItem.geometries_changed([self._polygons[i] for i in numpy.unique(self._store.polygon_of(rows)[0])])
+            self._store.scene_rows_changed(rows)
+        for layer, transformation in self._layer_states[position]:
+            layer.set_transformation(transformation)
+            for view in self._scene.views()[:1]:
+                layer.update_view(view)
+
+    def select_in_rect(self, rect):
+        """
+        Selects the polygons with a vertex inside the scene rectangle. An empty rectangle clears the selection.
+        :type rect: QtCore.QRectF
+        """
+        for polygon in self._selection:
+            polygon.set_highlighted(False)
+        self.materialize_in_rect(rect)
+        ids = self._vertex_index.vertices_in_rect(rect.left(), rect.top(), rect.right(), rect.bottom())
+        indices = numpy.unique(self._store.polygon_of(ids)[0])
+        self._selection = [self._polygons[i] for i in indices if i in self._polygons]
+        for polygon in self._selection:
+            polygon.set_highlighted(True)
+
+    def selection(self):
+        return self._selection
 
     def get_scene(self):
         return self._scene
 
+    def add_image_layer(self, layer):
+        """
+        :param layer:
+        :type layer: WarpedImageLayer
+        """
+        self._image_layers.append(layer)
+        self._scene.addItem(layer)
+
+    def image_layers(self):
+        return self._image_layers
+
+    def store(self):
+        """
+        :rtype: GeometryStore
+        """
+        return self._store
+
+    def handles_visible(self):
+        return self._handles_visible
+
+    def set_handles_visible(self, visible):
+        if visible == self._handles_visible:
+            return
+        self._handles_visible = visible
+        for item in self._items:
+            if isinstance(item, PolygonItem):
+                item.set_handles_visible(visible)
+
     def add_item(self, item, is_temp):
+        if is_temp:
+            self._temp_items.append(item)
+        else:
+            self._items.append(item)
+        if isinstance(item, PolygonItem):
+            item.set_handles_visible(self._handles_visible)
+            if item.store() is self._store:
+                self._polygons[item.store_index()] = item
         self._scene.addItem(item)
         for extra_item in item.extra_items():
             self._scene.addItem(extra_item)
@@ -230,25 +660,26 @@ class RectanglesCreator(object):
         self._rectangles_dast = rectangles_dast
 
     def add_rectangle(self, rect):
-        item = RectangleItem(rect, QtGui.QColor("blue"))
+        item = RectangleItem(rect, QtGui.QColor("blue"), self._rectangles_dast.store())
         self._rectangles_dast.add_item(item, False)
 
 
 
-class RectanglesCreatorGUI(HandlesMouseGUI):
+class RubberBandGUI(HandlesMouseGUI):
+    """
+    Draws a rubber band while MODIFIER is held and the mouse dragged, then hands its scene rectangle to _band_drawn.
+    """
     MODE_DRAWING = 'DRAWING'
     MODE_WAIT_TO_DRAW = 'WAIT'
+    MODIFIER = QtCore.Qt.SHIFT
 
-    def __init__(self, rectangles_creator, rubber_band_parent):
+    def __init__(self, rubber_band_parent):
         """
 
-        :param rectangles_creator:
-        :type rectangles_creator: RectanglesCreator
         :param rubber_band_parent:
         :return:
         """
-        super(RectanglesCreatorGUI, self).__init__()
-        self._rectangles_creator = rectangles_creator
+        super(RubberBandGUI, self).__init__()
         self._rubber_band = QtGui.QRubberBand(QtGui.QRubberBand.Rectangle, rubber_band_parent)
         self._rubber_band.hide()
         self._origin = QtCore.QPoint(0, 0)
@@ -257,7 +688,7 @@ class RectanglesCreatorGUI(HandlesMouseGUI):
 
     def mouseReleased(self, pos, scene_pos):
         if self._mode == self.MODE_DRAWING:
-            self._add_current_rectangle()
+            self._finish_band()
             self._mode = self.MODE_WAIT_TO_DRAW
 
     def mousePressed(self, pos, scene_pos):
@@ -265,7 +696,7 @@ class RectanglesCreatorGUI(HandlesMouseGUI):
             self._mode = self.MODE_DRAWING
             self._origin = pos
             self._origin_scene = scene_pos
-            print 'origin', pos
+            self._target_scene = scene_pos
 
     def mouseMoved(self, pos, scene_pos):
         if self._mode == self.MODE_DRAWING:
@@ -274,22 +705,105 @@ class RectanglesCreatorGUI(HandlesMouseGUI):
             self._rubber_band.show()
 
     def update_modifiers(self, modifiers):
-        shift = bool(modifiers & QtCore.Qt.SHIFT)
-        if self._mode == self.MODE_DISABLED and shift:
+        held = bool(modifiers & self.MODIFIER)
+        if self._mode == self.MODE_DISABLED and held:
             self._mode = self.MODE_WAIT_TO_DRAW
-        elif self._mode == self.MODE_DRAWING and not shift:
-            self._add_current_rectangle()
+        elif self._mode == self.MODE_DRAWING and not held:
+            self._finish_band()
             self._mode = self.MODE_DISABLED
-        elif self._mode == self.MODE_WAIT_TO_DRAW and not shift:
+        elif self._mode == self.MODE_WAIT_TO_DRAW and not held:
             self._mode = self.MODE_DISABLED
 
-    def _add_current_rectangle(self):
+    def _finish_band(self):
         assert self._mode == self.MODE_DRAWING
         self._rubber_band.hide()
-        self._rectangles_creator.add_rectangle(QtCore.QRectF(self._origin_scene, self._target_scene))
+        self._band_drawn(QtCore.QRectF(self._origin_scene, self._target_scene))
+
+    @abc.abstractmethod
+    def _band_drawn(self, rect):
+        """
+        :param rect: from the press to the release point, in scene coordinates.
+        :type rect: QtCore.QRectF
+        """
+        pass
+
+
+class RectanglesCreatorGUI(RubberBandGUI):
+    def __init__(self, rectangles_creator, rubber_band_parent):
+        """
+
+        :param rectangles_creator:
+        :type rectangles_creator: RectanglesCreator
+        :param rubber_band_parent:
+        :return:
+        """
+        super(RectanglesCreatorGUI, self).__init__(rubber_band_parent)
+        self._rectangles_creator = rectangles_creator
+
+    def _band_drawn(self, rect):
+        self._rectangles_creator.add_rectangle(rect)
+
+
+class SelectionGUI(RubberBandGUI):
+    """
+    Ctrl + drag selects the polygons with a vertex in the band, so dragging one of them transforms them all.
+    """
+    MODIFIER = QtCore.Qt.CTRL
+
+    def __init__(self, rectangles_dast, rubber_band_parent):
+        """
+        :type rectangles_dast: RectanglesDAST
+        """
+        super(SelectionGUI, self).__init__(rubber_band_parent)
+        self._rectangles_dast = rectangles_dast
+
+    def _band_drawn(self, rect):
+        self._rectangles_dast.select_in_rect(rect.normalized())
+
+
+class FrameStats(object):
+    """
+    Per-frame counters of the coalesced mouse moves.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.events = 0
+        self.work_time = 0.
+        self.max_work_time = 0.
+        self.max_latency = 0.
+        self.last_latency = 0.
+
+    def add_frame(self, n_events, latency, work_time):
+        """
+        :param n_events: how many raw move events were merged into the frame.
+        :param latency: seconds from the first merged event to the end of the frame's work.
+        :param work_time: seconds spent handling the frame.
+        """
+        self.frames += 1
+        self.events += n_events
+        self.work_time += work_time
+        self.max_work_time = max(self.max_work_time, work_time)
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def mean_work_time(self):
+        return self.work_time / self.frames if self.frames else 0.
+
+    def reset(self):
+        self.__init__()
 
 
 class MyGraphicsView(QtGui.QGraphicsView):
+    # PyQt4 does not expose the display refresh rate, assume a 60Hz display.
+    FRAME_INTERVAL_MS = 16
+    # Vertex handles and their labels are hidden when zoomed out below this scale.
+    HANDLES_MIN_SCALE = 0.5
+    # Zoom factor per wheel step (120 units of delta).
+    ZOOM_STEP = 1.25
+    # Antialiasing comes back this long after the last zoom or scroll.
+    INTERACTION_END_MS = 200
+
     def __init__(self, dast, transformation_builder_getter, parent=None):
         """
         :param dast:
@@ -298,37 +812,144 @@ class MyGraphicsView(QtGui.QGraphicsView):
         :return:
         """
         super(MyGraphicsView, self).__init__(parent)
+        self._dast = dast
         self.setScene(dast.get_scene())
         self._transformerGUI = TransformerGUI(dast.finder(), dast.temp_items_drawer(), transformation_builder_getter,
-                                              dast.get_scene().sceneRect())
+                                              dast.get_scene().sceneRect(), apply_transformation=dast.transform_polygon,
+                                              report_error=self._report_error)
         dast.get_scene().sceneRectChanged.connect(self._transformerGUI.scene_rect_changed)
         self._rectangles_creatorGUI = RectanglesCreatorGUI(dast.creator(), self)
+        self._selectionGUI = SelectionGUI(dast, self)
+
+        # Mouse moves are merged down to the latest one and handled once per frame.
+        self._pending_move = None
+        self._pending_events = 0
+        self._pending_since = 0.
+        self._frame_timer = QtCore.QTimer(self)
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.setInterval(self.FRAME_INTERVAL_MS)
+        self._frame_timer.timeout.connect(self._flush_pending_move)
+        self._frame_stats = FrameStats()
+
+        # Antialiasing is switched off while the user drags, zooms or scrolls.
+        self._antialiasing = False
+        self._interacting = False
+        self._interaction_timer = QtCore.QTimer(self)
+        self._interaction_timer.setSingleShot(True)
+        self._interaction_timer.setInterval(self.INTERACTION_END_MS)
+        self._interaction_timer.timeout.connect(self._end_interaction)
+
+    def _report_error(self, message):
+        QtGui.QMessageBox.warning(self, "Transformation", message)
+
+    def finish_transformation(self):
+        self._transformerGUI.finish()
+
+    def set_antialiasing(self, antialiasing):
+        """
+        The hint used when not interacting.
+        """
+        self._antialiasing = antialiasing
+        if not self._interacting:
+            self.setRenderHint(QtGui.QPainter.Antialiasing, antialiasing)
+
+    def _begin_interaction(self):
+        if not self._interacting:
+            self._interacting = True
+            self.setRenderHint(QtGui.QPainter.Antialiasing, False)
+
+    def _end_interaction(self):
+        self._interaction_timer.stop()
+        if self._interacting:
+            self._interacting = False
+            self.setRenderHint(QtGui.QPainter.Antialiasing, self._antialiasing)
+            self.viewport().update()
+
+    def _brief_interaction(self):
+        self._begin_interaction()
+        self._interaction_timer.start()
+
+    def frame_stats(self):
+        """
+        :rtype: FrameStats
+        """
+        return self._frame_stats
+
+    def update_image_layers(self):
+        for layer in self._dast.image_layers():
+            layer.update_view(self)
+
+    def scrollContentsBy(self, dx, dy):
+        if not self._interacting or self._interaction_timer.isActive():
+            self._brief_interaction()
+        super(MyGraphicsView, self).scrollContentsBy(dx, dy)
+        self.update_image_layers()
+
+    def wheelEvent(self, QWheelEvent):
+        self._brief_interaction()
+        factor = self.ZOOM_STEP ** (QWheelEvent.delta() / 120.)
+        self.scale(factor, factor)
+        self._dast.set_handles_visible(self.zoom() >= self.HANDLES_MIN_SCALE)
+        self.update_image_layers()
+
+    def zoom(self):
+        """
+        :return: device pixels per scene unit.
+        """
+        return QtGui.QStyleOptionGraphicsItem.levelOfDetailFromTransform(self.transform())
+
+    def resizeEvent(self, QResizeEvent):
+        super(MyGraphicsView, self).resizeEvent(QResizeEvent)
+        self.update_image_layers()
 
     def keyPressEvent(self, QKeyEvent):
-        self._update_modifiers(QKeyEvent)
+        self._update_modifiers(QKeyEvent.modifiers())
 
     def keyReleaseEvent(self, QKeyEvent):
-        self._update_modifiers(QKeyEvent)
+        self._update_modifiers(QKeyEvent.modifiers())
 
     def mousePressEvent(self, QMouseEvent):
-        self._handle_mouse_event('press', QMouseEvent)
+        self._interaction_timer.stop()
+        self._begin_interaction()
+        self._flush_pending_move()
+        self._handle_mouse_event('press', QMouseEvent.pos(), QMouseEvent.modifiers())
         super(MyGraphicsView, self).mousePressEvent(QMouseEvent)
 
     def mouseReleaseEvent(self, QMouseEvent):
-        self._handle_mouse_event('release', QMouseEvent)
+        self._flush_pending_move()
+        self._handle_mouse_event('release', QMouseEvent.pos(), QMouseEvent.modifiers())
         super(MyGraphicsView, self).mouseReleaseEvent(QMouseEvent)
+        self._end_interaction()
 
     def mouseMoveEvent(self, QMouseEvent):
-        self._handle_mouse_event('move', QMouseEvent)
+        if self._pending_move is None:
+            self._pending_since = time.time()
+        self._pending_move = (QtCore.QPoint(QMouseEvent.pos()), QMouseEvent.modifiers())
+        self._pending_events += 1
+        if not self._frame_timer.isActive():
+            self._frame_timer.start()
         super(MyGraphicsView, self).mouseMoveEvent(QMouseEvent)
 
-    def _handle_mouse_event(self, event_name, QMouseEvent):
-        self._update_modifiers(QMouseEvent)
+    def _flush_pending_move(self):
+        self._frame_timer.stop()
+        if self._pending_move is None:
+            return
+        start = time.time()
+        pos, modifiers = self._pending_move
+        self._handle_mouse_event('move', pos, modifiers)
+        end = time.time()
+        self._frame_stats.add_frame(self._pending_events, end - self._pending_since, end - start)
+        self._pending_move = None
+        self._pending_events = 0
+
+    def _handle_mouse_event(self, event_name, pos, modifiers):
+        self._update_modifiers(modifiers)
         if self._rectangles_creatorGUI.enabled():
             gui = self._rectangles_creatorGUI
+        elif self._selectionGUI.enabled():
+            gui = self._selectionGUI
         else:
             gui = self._transformerGUI
-        pos = QMouseEvent.pos()
         scene_pos = self.mapToScene(pos).toPoint()
         if event_name == 'press':
             gui.mousePressed(pos, scene_pos)
@@ -337,9 +958,10 @@ class MyGraphicsView(QtGui.QGraphicsView):
         elif event_name == 'release':
             gui.mouseReleased(pos, scene_pos)
 
-    def _update_modifiers(self, event):
+    def _update_modifiers(self, modifiers):
         if not self._transformerGUI.enabled():
-            self._rectangles_creatorGUI.update_modifiers(event.modifiers())
+            self._rectangles_creatorGUI.update_modifiers(modifiers)
+            self._selectionGUI.update_modifiers(modifiers)
 
 
 class MainWin(QtGui.QMainWindow):
@@ -357,25 +979,75 @@ class MainWin(QtGui.QMainWindow):
         scene.setItemIndexMethod(QtGui.QGraphicsScene.BspTreeIndex)
         dast = RectanglesDAST(scene)
 
-        view = MyGraphicsView(dast, self.transformation_builder)
-        view.setRenderHint(QtGui.QPainter.Antialiasing)
+        self._dast = dast
+        self._view = view = MyGraphicsView(dast, self.transformation_builder)
+        view.set_antialiasing(True)
+        view.setTransformationAnchor(QtGui.QGraphicsView.AnchorUnderMouse)
         view.setCacheMode(QtGui.QGraphicsView.CacheBackground)
         view.setViewportUpdateMode(QtGui.QGraphicsView.BoundingRectViewportUpdate)
         view.setDragMode(QtGui.QGraphicsView.NoDrag)
 
+        file_menu = self.menuBar().addMenu("&File")
+        file_menu.addAction("Open &background image...", self.open_background_image)
+        file_menu.addAction("&Export polygons...", self.export_polygons)
+        edit_menu = self.menuBar().addMenu("&Edit")
+        edit_menu.addAction("&Undo", self.undo, QtGui.QKeySequence(QtGui.QKeySequence.Undo))
+        edit_menu.addAction("&Redo", self.redo, QtGui.QKeySequence(QtGui.QKeySequence.Redo))
+        edit_menu.addAction("&Finish transformation", view.finish_transformation, QtGui.QKeySequence("Ctrl+Return"))
+        edit_menu.addAction("&Warp image by the last transformation", self.warp_image_layers)
+
         self.setWindowTitle("Transformations")
         self.setCentralWidget(view)
 
+    def undo(self):
+        self._dast.undo()
+
+    def redo(self):
+        self._dast.redo()
+
+    def warp_image_layers(self):
+        transformation = self._dast.last_transformation()
+        if transformation is None or not self._dast.image_layers():
+            QtGui.QMessageBox.information(self, "Warp image", "Open a background image and transform a polygon first.")
+            return
+        self._dast.transform_image_layers(transformation)
+
+    def open_background_image(self):
+        path = QtGui.QFileDialog.getOpenFileName(self, "Background image", "", "Images (*.png *.jpg *.bmp)")
+        if not path:
+            return
+        image = QtGui.QImage(path)
+        if image.isNull():
+            QtGui.QMessageBox.warning(self, "Background image", "Could not read %s" % path)
+            return
+        layer = WarpedImageLayer(image)
+        self._dast.add_image_layer(layer)
+        layer.update_view(self._view)
+
+    def export_polygons(self):
+        """
+        Writes the polygons as JSON Lines of {"points": [[x, y], ...]}, the polygon input of transfromations.batch.
+        """
+        path = QtGui.QFileDialog.getSaveFileName(self, "Export polygons", "", "JSON Lines (*.jsonl)")
+        if not path:
+            return
+        with open(path, 'w') as f:
+            for points in self._dast.polygons_arrays():
+                f.write(json.dumps({'points': points.tolist()}) + '\n')
+
     def transformation_builder(self):
         # TODO: after implementing the transformations and the builders, update this switch.
         if self._transformation_form.similarity.isChecked():
             return SimilarityBuilder()
         elif self._transformation_form.bilinear_interpolant.isChecked():
-            return TranslationBuilder()
+            return BilinearBuilder()
         elif self._transformation_form.affine.isChecked():
             return AffineBuilder()
         elif self._transformation_form.projective.isChecked():
-            return TranslationBuilder()
+            return ProjectiveBuilder()
+        elif self._transformation_form.thin_plate_spline.isChecked():
+            # Takes pairs until Edit > Finish transformation.
+            return ThinPlateSplineBuilder()
         elif self._transformation_form.rigid.isChecked():
             return RigidBuilder()
         elif self._transformation_form.rotation.isChecked():